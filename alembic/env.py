@@ -8,7 +8,8 @@ from alembic import context
 
 config = context.config
 if "TMTRKR_DATABASE_URL" in os.environ:
-    config.set_main_option("sqlalchemy.url", os.environ.get("TMTRKR_DATABASE_URL"))
+    # sync driver URL (for the async drivers too)
+    config.set_main_option("sqlalchemy.url", tmtrkr.models.db.engine.url.render_as_string(hide_password=False))
 
 target_metadata = [
     tmtrkr.models.Base.metadata,
@@ -0,0 +1,22 @@
+"""record user/start index"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "00000001"
+down_revision = "00000000"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(
+        "ix_record_user_id_is_deleted_start",
+        "record",
+        ["user_id", "is_deleted", "start"],
+        unique=False,
+    )
+
+
+def downgrade():
+    op.drop_index("ix_record_user_id_is_deleted_start", table_name="record")
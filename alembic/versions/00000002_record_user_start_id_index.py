@@ -0,0 +1,29 @@
+"""record user/start/id index (keyset pagination)"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "00000002"
+down_revision = "00000001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(
+        "ix_record_user_id_is_deleted_start_id",
+        "record",
+        ["user_id", "is_deleted", "start", "id"],
+        unique=False,
+    )
+    op.drop_index("ix_record_user_id_is_deleted_start", table_name="record")
+
+
+def downgrade():
+    op.create_index(
+        "ix_record_user_id_is_deleted_start",
+        "record",
+        ["user_id", "is_deleted", "start"],
+        unique=False,
+    )
+    op.drop_index("ix_record_user_id_is_deleted_start_id", table_name="record")
@@ -0,0 +1,90 @@
+"""record daily rollup"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "00000003"
+down_revision = "00000002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "record_daily_rollup",
+        sa.Column("user_id", sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column("day", sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column("tag", sa.Text(), nullable=False),
+        sa.Column("count", sa.Integer(), nullable=False),
+        sa.Column("duration", sa.Integer(), nullable=False),
+        sa.Column("start_min", sa.Integer(), nullable=True),
+        sa.Column("start_max", sa.Integer(), nullable=True),
+        sa.Column("end_min", sa.Integer(), nullable=True),
+        sa.Column("end_max", sa.Integer(), nullable=True),
+        sa.PrimaryKeyConstraint("user_id", "day", "tag"),
+    )
+    op.create_index(
+        "ix_record_user_id_running",
+        "record",
+        ["user_id", "is_deleted", "start"],
+        unique=False,
+        sqlite_where=sa.text('"end" IS NULL'),
+        postgresql_where=sa.text('"end" IS NULL'),
+    )
+    backfill()
+
+
+def backfill():
+    """
+    Roll up the finished, not deleted records, user by user.
+
+    Record count and duration go to its start UTC day: to every its tag row
+    ('' for no tags) and to the total one ('*', with start/end min/max).
+    """
+    connection = op.get_bind()
+    record = sa.table(
+        "record",
+        sa.column("user_id"),
+        sa.column("start"),
+        sa.column("end"),
+        sa.column("tags"),
+        sa.column("is_deleted", sa.Boolean),
+    )
+    rollup = sa.table(
+        "record_daily_rollup",
+        *(sa.column(name) for name in ("user_id", "day", "tag", "count", "duration")),
+        *(sa.column(name) for name in ("start_min", "start_max", "end_min", "end_max")),
+    )
+    records = connection.execution_options(stream_results=True).execute(
+        sa.select(record.c.user_id, record.c.start, record.c.end, record.c.tags)
+        .where(record.c.is_deleted.is_(False), record.c.start.is_not(None), record.c.end.is_not(None))
+        .order_by(record.c.user_id)
+    )
+    empty = dict.fromkeys(rollup.c.keys())
+    user_id, rows = None, {}
+    for row in records:
+        if row.user_id != user_id and rows:
+            connection.execute(rollup.insert(), list(rows.values()))
+            rows = {}
+        user_id = row.user_id
+        start, end = int(row.start), int(row.end)
+        day = start - start % (24 * 60 * 60)
+        for tag in (set((row.tags or "").split()) or {""}) | {"*"}:
+            values = rows.setdefault(
+                (day, tag), {**empty, "user_id": user_id or 0, "day": day, "tag": tag, "count": 0, "duration": 0}
+            )
+            values["count"] += 1
+            values["duration"] += end - start
+            if tag == "*":
+                values["start_min"] = min(start, values["start_min"] or start)
+                values["start_max"] = max(start, values["start_max"] or start)
+                values["end_min"] = min(end, values["end_min"] or end)
+                values["end_max"] = max(end, values["end_max"] or end)
+    if rows:
+        connection.execute(rollup.insert(), list(rows.values()))
+
+
+def downgrade():
+    op.drop_index("ix_record_user_id_running", table_name="record")
+    op.drop_table("record_daily_rollup")
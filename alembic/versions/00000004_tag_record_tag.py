@@ -0,0 +1,70 @@
+"""tag and record_tag (normalized tags)"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql, sqlite
+
+
+# revision identifiers, used by Alembic.
+revision = "00000004"
+down_revision = "00000003"
+branch_labels = None
+depends_on = None
+
+BACKFILL_BATCH_SIZE = 10000
+
+
+def upgrade():
+    op.create_table(
+        "tag",
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column("name", sa.Text(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("name"),
+    )
+    op.create_table(
+        "record_tag",
+        sa.Column("record_id", sa.Integer(), nullable=False),
+        sa.Column("tag_id", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["record_id"], ["record.id"], ondelete="CASCADE"),
+        sa.ForeignKeyConstraint(["tag_id"], ["tag.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("record_id", "tag_id"),
+    )
+    op.create_index("ix_record_tag_tag_id_record_id", "record_tag", ["tag_id", "record_id"], unique=False)
+    backfill()
+
+
+def backfill():
+    """Fill record_tag from record.tags text, batch by batch."""
+    connection = op.get_bind()
+    record = sa.table("record", sa.column("id", sa.Integer), sa.column("tags", sa.Text))
+    tag = sa.table("tag", sa.column("id", sa.Integer), sa.column("name", sa.Text))
+    record_tag = sa.table("record_tag", sa.column("record_id", sa.Integer), sa.column("tag_id", sa.Integer))
+    insert_tag = (postgresql if connection.dialect.name == "postgresql" else sqlite).insert(tag)
+    insert_tag = insert_tag.on_conflict_do_nothing(index_elements=["name"])
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            sa.select(record.c.id, record.c.tags)
+            .where(record.c.id > last_id, record.c.tags.is_not(None))
+            .order_by(record.c.id)
+            .limit(BACKFILL_BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+        names = {row.id: sorted(set(row.tags.split())) for row in rows}
+        all_names = sorted(set(name for record_names in names.values() for name in record_names))
+        if not all_names:
+            continue
+        connection.execute(insert_tag, [{"name": name} for name in all_names])
+        ids = dict(connection.execute(sa.select(tag.c.name, tag.c.id).where(tag.c.name.in_(all_names))).all())
+        connection.execute(
+            record_tag.insert(),
+            [{"record_id": rid, "tag_id": ids[name]} for rid, record_names in names.items() for name in record_names],
+        )
+
+
+def downgrade():
+    op.drop_index("ix_record_tag_tag_id_record_id", table_name="record_tag")
+    op.drop_table("record_tag")
+    op.drop_table("tag")
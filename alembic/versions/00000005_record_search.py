@@ -0,0 +1,62 @@
+"""record full-text search (sqlite fts5, postgresql tsvector)"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "00000005"
+down_revision = "00000004"
+branch_labels = None
+depends_on = None
+
+# SQLite: external content FTS5 table, kept in sync by triggers
+SQLITE_CREATE = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS record_fts USING fts5(name, tags, content='record', content_rowid='id')",
+    "CREATE TRIGGER IF NOT EXISTS record_fts_ai AFTER INSERT ON record BEGIN "
+    "INSERT INTO record_fts(rowid, name, tags) VALUES (new.id, new.name, new.tags); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS record_fts_ad AFTER DELETE ON record BEGIN "
+    "INSERT INTO record_fts(record_fts, rowid, name, tags) VALUES ('delete', old.id, old.name, old.tags); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS record_fts_au AFTER UPDATE OF name, tags ON record BEGIN "
+    "INSERT INTO record_fts(record_fts, rowid, name, tags) VALUES ('delete', old.id, old.name, old.tags); "
+    "INSERT INTO record_fts(rowid, name, tags) VALUES (new.id, new.name, new.tags); "
+    "END",
+)
+SQLITE_DROP = (
+    "DROP TRIGGER IF EXISTS record_fts_au",
+    "DROP TRIGGER IF EXISTS record_fts_ad",
+    "DROP TRIGGER IF EXISTS record_fts_ai",
+    "DROP TABLE IF EXISTS record_fts",
+)
+
+# PostgreSQL: generated tsvector column with GIN index
+POSTGRESQL_CREATE = (
+    "ALTER TABLE record ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS "
+    "(to_tsvector('simple', coalesce(name, '') || ' ' || coalesce(tags, ''))) STORED",
+    "CREATE INDEX IF NOT EXISTS ix_record_search_vector ON record USING GIN (search_vector)",
+)
+POSTGRESQL_DROP = (
+    "DROP INDEX IF EXISTS ix_record_search_vector",
+    "ALTER TABLE record DROP COLUMN IF EXISTS search_vector",
+)
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == "sqlite":
+        for statement in SQLITE_CREATE:
+            op.execute(statement)
+        op.execute("INSERT INTO record_fts(record_fts) VALUES ('rebuild')")  # backfill
+    elif dialect == "postgresql":
+        for statement in POSTGRESQL_CREATE:
+            op.execute(statement)
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == "sqlite":
+        for statement in SQLITE_DROP:
+            op.execute(statement)
+    elif dialect == "postgresql":
+        for statement in POSTGRESQL_DROP:
+            op.execute(statement)
@@ -0,0 +1,88 @@
+"""user name unique index"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "00000006"
+down_revision = "00000005"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    dedup()
+    op.drop_index("ix_user_name", table_name="user")
+    op.create_index("ix_user_name", "user", ["name"], unique=True)
+
+
+def dedup():
+    """Merge duplicated users (concurrent first logins) into the first one."""
+    connection = op.get_bind()
+    user = sa.table("user", sa.column("id"), sa.column("name"))
+    record = sa.table("record", sa.column("user_id"))
+    duplicates = connection.execute(
+        sa.select(user.c.name, sa.func.min(user.c.id))
+        .where(user.c.name.is_not(None))
+        .group_by(user.c.name)
+        .having(sa.func.count() > 1)
+    ).all()
+    user_ids = []
+    for name, user_id in duplicates:
+        ids = connection.scalars(sa.select(user.c.id).where(user.c.name == name, user.c.id != user_id)).all()
+        connection.execute(record.update().where(record.c.user_id.in_(ids)).values(user_id=user_id))
+        connection.execute(user.delete().where(user.c.id.in_(ids)))
+        user_ids += [user_id, *ids]
+    if user_ids:
+        rebuild_rollups(user_ids)
+
+
+def rebuild_rollups(user_ids):
+    """Roll up the finished, not deleted records of the users again (see 00000003 backfill)."""
+    connection = op.get_bind()
+    record = sa.table(
+        "record",
+        sa.column("user_id"),
+        sa.column("start"),
+        sa.column("end"),
+        sa.column("tags"),
+        sa.column("is_deleted", sa.Boolean),
+    )
+    rollup = sa.table(
+        "record_daily_rollup",
+        *(sa.column(name) for name in ("user_id", "day", "tag", "count", "duration")),
+        *(sa.column(name) for name in ("start_min", "start_max", "end_min", "end_max")),
+    )
+    connection.execute(rollup.delete().where(rollup.c.user_id.in_(user_ids)))
+    empty = dict.fromkeys(rollup.c.keys())
+    for user_id in user_ids:
+        records = connection.execute(
+            sa.select(record.c.start, record.c.end, record.c.tags).where(
+                record.c.user_id == user_id,
+                record.c.is_deleted.is_(False),
+                record.c.start.is_not(None),
+                record.c.end.is_not(None),
+            )
+        )
+        rows = {}
+        for row in records:
+            start, end = int(row.start), int(row.end)
+            day = start - start % (24 * 60 * 60)
+            for tag in (set((row.tags or "").split()) or {""}) | {"*"}:
+                values = rows.setdefault(
+                    (day, tag), {**empty, "user_id": user_id, "day": day, "tag": tag, "count": 0, "duration": 0}
+                )
+                values["count"] += 1
+                values["duration"] += end - start
+                if tag == "*":
+                    values["start_min"] = min(start, values["start_min"] or start)
+                    values["start_max"] = max(start, values["start_max"] or start)
+                    values["end_min"] = min(end, values["end_min"] or end)
+                    values["end_max"] = max(end, values["end_max"] or end)
+        if rows:
+            connection.execute(rollup.insert(), list(rows.values()))
+
+
+def downgrade():
+    op.drop_index("ix_user_name", table_name="user")
+    op.create_index("ix_user_name", "user", ["name"], unique=False)
@@ -0,0 +1,17 @@
+"""record user/updated_at index (changes feed)"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "00000007"
+down_revision = "00000006"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index("ix_record_user_id_updated_at", "record", ["user_id", "updated_at"], unique=False)
+
+
+def downgrade():
+    op.drop_index("ix_record_user_id_updated_at", table_name="record")
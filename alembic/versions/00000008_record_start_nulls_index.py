@@ -0,0 +1,34 @@
+"""record user/start/id index with NULL starts last (PostgreSQL keyset pagination)"""
+from alembic import op
+from sqlalchemy import text
+
+
+# revision identifiers, used by Alembic.
+revision = "00000008"
+down_revision = "00000007"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if op.get_bind().dialect.name != "postgresql":
+        return  # SQLite sorts NULLs as the smallest values already
+    op.drop_index("ix_record_user_id_is_deleted_start_id", table_name="record")
+    op.create_index(
+        "ix_record_user_id_is_deleted_start_id",
+        "record",
+        ["user_id", "is_deleted", text("start NULLS FIRST"), "id"],
+        unique=False,
+    )
+
+
+def downgrade():
+    if op.get_bind().dialect.name != "postgresql":
+        return
+    op.drop_index("ix_record_user_id_is_deleted_start_id", table_name="record")
+    op.create_index(
+        "ix_record_user_id_is_deleted_start_id",
+        "record",
+        ["user_id", "is_deleted", "start", "id"],
+        unique=False,
+    )
@@ -0,0 +1,68 @@
+"""record change numbers (changes feed)"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql, sqlite
+
+
+# revision identifiers, used by Alembic.
+revision = "00000009"
+down_revision = "00000008"
+branch_labels = None
+depends_on = None
+
+BACKFILL_BATCH_SIZE = 10000
+
+
+def upgrade():
+    op.create_table(
+        "record_change_counter",
+        sa.Column("user_id", sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column("value", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("user_id"),
+    )
+    op.add_column("record", sa.Column("change_id", sa.Integer(), nullable=True))
+    backfill()
+    op.create_index("ix_record_user_id_change_id", "record", ["user_id", "change_id"], unique=False)
+    op.drop_index("ix_record_user_id_updated_at", table_name="record")
+
+
+def backfill():
+    """Number the existing records of every user in the id order, batch by batch, set the counters."""
+    connection = op.get_bind()
+    record = sa.table(
+        "record", sa.column("id", sa.Integer), sa.column("user_id", sa.Integer), sa.column("change_id", sa.Integer)
+    )
+    counter = sa.table("record_change_counter", sa.column("user_id", sa.Integer), sa.column("value", sa.Integer))
+    insert_counter = (postgresql if connection.dialect.name == "postgresql" else sqlite).insert(counter)
+    insert_counter = insert_counter.on_conflict_do_update(
+        index_elements=["user_id"], set_={"value": counter.c.value + insert_counter.excluded.value}
+    )
+    user_id = sa.func.coalesce(record.c.user_id, 0)  # records without user
+    last_id = 0
+    while True:
+        ids = sa.select(record.c.id).where(record.c.id > last_id).order_by(record.c.id).limit(BACKFILL_BATCH_SIZE)
+        max_id = connection.execute(sa.select(sa.func.max(ids.subquery().c.id))).scalar()
+        if max_id is None:
+            break
+        batch = sa.and_(record.c.id > last_id, record.c.id <= max_id)
+        # one UPDATE per batch: numbers of the batch records continue the counters of the previous batches
+        change_id = sa.func.row_number().over(partition_by=user_id, order_by=record.c.id) + sa.func.coalesce(
+            counter.c.value, 0
+        )
+        numbered = (
+            sa.select(record.c.id, change_id.label("change_id"))
+            .select_from(record.outerjoin(counter, counter.c.user_id == user_id))
+            .where(batch)
+            .subquery()
+        )
+        connection.execute(record.update().where(record.c.id == numbered.c.id).values(change_id=numbered.c.change_id))
+        counts = connection.execute(sa.select(user_id, sa.func.count()).where(batch).group_by(user_id)).all()
+        connection.execute(insert_counter, [{"user_id": key, "value": n} for key, n in counts])
+        last_id = max_id
+
+
+def downgrade():
+    op.create_index("ix_record_user_id_updated_at", "record", ["user_id", "updated_at"], unique=False)
+    op.drop_index("ix_record_user_id_change_id", table_name="record")
+    op.drop_column("record", "change_id")
+    op.drop_table("record_change_counter")
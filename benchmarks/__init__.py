@@ -0,0 +1 @@
+"""Benchmarks (not a part of the tests run): `make bench`, `make bench-compare`."""
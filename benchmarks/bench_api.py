@@ -0,0 +1,192 @@
+"""
+HTTP-level API benchmarks -- the app is driven in-process (ASGI transport).
+
+Run against a scratch database (tables are dropped and recreated for every dataset):
+
+    TMTRKR_DATABASE_URL=sqlite:////tmp/bench.sqlite python -m benchmarks.bench_api --sizes 1000,100000
+
+With `--datasets DIR` (SQLite) generated databases are saved there and
+copied back by the next runs -- a baseline tree (`make bench-compare`) is
+measured on the very same data, its demo database generator is not used.
+"""
+
+import argparse
+import asyncio
+import datetime
+import logging
+import os
+import random
+import sqlite3
+import time
+
+import httpx
+
+import tmtrkr.models
+from tmtrkr import settings
+from tmtrkr.api.api import app
+from tmtrkr.misc.demodb import create_demo_database
+
+from .common import latency_stats, save_results
+
+__all__ = ["run_benchmarks"]
+
+log = logging.getLogger("benchmarks")
+
+OPERATIONS = ("list", "detail", "create", "patch", "delete")
+PREFIX = settings.API_BASE_PREFIX + "/records"
+TODAY = datetime.date(2024, 1, 1)  # fixed, same datasets for every run
+
+
+def copy_database(source: str, target: str):
+    """Copy SQLite database file (online backup -- WAL content included)."""
+    src, dst = sqlite3.connect(source), sqlite3.connect(target)
+    try:
+        src.backup(dst)
+    finally:
+        src.close()
+        dst.close()
+
+
+def create_dataset(n_records: int, n_users: int, years: float, seed: int, datasets: str = None) -> list:
+    """
+    Recreate the database with generated records, return [(user name, record id)] of not deleted records.
+
+    With `datasets` directory the database is copied from there (if it was saved by a previous run) or saved there.
+    """
+    engine = tmtrkr.models.db.engine
+    path = None
+    if datasets:
+        if engine.dialect.name != "sqlite":
+            raise ValueError("datasets are SQLite databases files")
+        os.makedirs(datasets, exist_ok=True)
+        path = os.path.join(datasets, f"records={n_records}-users={n_users}-years={years}-seed={seed}.sqlite")
+    if path and os.path.exists(path):
+        engine.dispose()
+        copy_database(path, engine.url.database)
+        log.info("dataset is copied from %s", path)
+    else:
+        tmtrkr.models.drop_all()
+        tmtrkr.models.create_all()
+        create_demo_database(n_users=n_users, n_records=n_records, years=years, seed=seed, today=TODAY)
+        if path:
+            engine.dispose()
+            copy_database(engine.url.database, path)
+    db = next(tmtrkr.models.db_session())
+    try:
+        User, Record = tmtrkr.models.User, tmtrkr.models.Record
+        rows = (
+            db.query(User.name, Record.id)
+            .join(User, User.id == Record.user_id)
+            .filter(Record.is_deleted.is_(False))
+            .order_by(Record.id)
+        )
+        return [tuple(row) for row in rows]
+    finally:
+        db.close()
+
+
+def build_requests(operation: str, n: int, samples: list, rng: random.Random) -> list:
+    """Build n requests (method, url, headers, json) of the operation."""
+    requests = []
+    for username, record_id in rng.sample(samples, k=n) if len(samples) >= n else rng.choices(samples, k=n):
+        headers = {settings.AUTH_USERS_ALLOW_XFORWARDED_HEADER: username}
+        start = int(datetime.datetime(TODAY.year, TODAY.month, TODAY.day).timestamp()) - rng.randint(1, 365) * 86400
+        data = {"name": "Benchmark record.", "start": start, "end": start + 1800, "tags": "bench mark"}
+        if operation == "list":
+            requests.append(("GET", PREFIX + "/", headers, None))
+        elif operation == "detail":
+            requests.append(("GET", f"{PREFIX}/{record_id}", headers, None))
+        elif operation == "create":
+            requests.append(("POST", PREFIX + "/", headers, data))
+        elif operation == "patch":
+            requests.append(("PATCH", f"{PREFIX}/{record_id}", headers, data))
+        elif operation == "delete":
+            requests.append(("DELETE", f"{PREFIX}/{record_id}", headers, None))
+    return requests
+
+
+async def run_requests(client: httpx.AsyncClient, requests: list, concurrency: int) -> dict:
+    """Send requests with `concurrency` parallel clients, get latency stats."""
+    latencies, errors, queue = [], 0, iter(requests)
+
+    async def worker():
+        nonlocal errors
+        for method, url, headers, data in queue:
+            t = time.perf_counter()
+            rsp = await client.request(method, url, headers=headers, json=data)
+            latencies.append(time.perf_counter() - t)
+            errors += rsp.status_code >= 400
+
+    t = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latency_stats(latencies, time.perf_counter() - t, errors)
+
+
+async def run_dataset(samples: list, operations: list, n_requests: int, concurrency: int, warmup: int, seed: int):
+    """Run all operations benchmarks on the current dataset."""
+    rng = random.Random(seed)
+    results = {}
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)  # errors are counted
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+        await run_requests(client, build_requests("list", warmup, samples, rng), concurrency)
+        for operation in operations:
+            requests = build_requests(operation, n_requests, samples, rng)
+            results[operation] = await run_requests(client, requests, concurrency)
+            log.info("%s: %s", operation, results[operation])
+    return results
+
+
+def run_benchmarks(
+    sizes,
+    users=100,
+    years=3,
+    operations=OPERATIONS,
+    requests=1000,
+    concurrency=8,
+    warmup=50,
+    seed=42,
+    datasets=None,
+):
+    """Run benchmarks on datasets of the sizes (number of records), get {dataset: {operation: stats}}."""
+    results = {}
+    for size in sizes:
+        log.info("dataset: %d records", size)
+        samples = create_dataset(size, min(users, size), years, seed, datasets=datasets)
+        results[f"records={size}"] = asyncio.run(run_dataset(samples, operations, requests, concurrency, warmup, seed))
+    return results
+
+
+def main():
+    """Read cli parameters, run benchmarks, save results."""
+    logging.basicConfig(level=logging.WARNING)
+    log.setLevel(logging.INFO)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="1000,10000,100000", help="datasets sizes (records), comma separated")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--years", type=float, default=3)
+    parser.add_argument("--operations", default=",".join(OPERATIONS))
+    parser.add_argument("--requests", type=int, default=1000, help="requests per operation")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--warmup", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--datasets", help="directory of the saved datasets (SQLite databases), see the module docs")
+    parser.add_argument("--output", help="results JSON file (default: stdout)")
+    args = parser.parse_args()
+    settings.AUTH_USERS_ALLOW_XFORWARDED = True
+    params = {key: value for key, value in vars(args).items() if key not in ("output", "datasets")}
+    results = run_benchmarks(
+        sizes=[int(size) for size in args.sizes.split(",")],
+        users=args.users,
+        years=args.years,
+        operations=args.operations.split(","),
+        requests=args.requests,
+        concurrency=args.concurrency,
+        warmup=args.warmup,
+        seed=args.seed,
+        datasets=args.datasets,
+    )
+    save_results(args.output, results, benchmark="api", database=settings.DATABASE_URL.split(":")[0], **params)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Benchmarks of the API responses compression: bandwidth vs CPU.
+
+Records list pages (the response JSON) of typical sizes are compressed
+with every encoding and level; sizes, ratios and timings are reported:
+
+    python -m benchmarks.bench_compression --rows 10,100,1000 --output compression.json
+"""
+
+import argparse
+import logging
+import random
+import sys
+import time
+
+from tmtrkr.api import compression, responses
+from tmtrkr.models import Record
+
+from .bench_models import build_records
+from .common import latency_stats, save_results
+
+__all__ = ["run_benchmarks"]
+
+log = logging.getLogger("benchmarks")
+
+LEVELS = {"gzip": (1, 6, 9), "br": (1, 4, 6, 11)}
+
+
+def build_page(n: int, seed: int) -> bytes:
+    """Build records list response body of n records."""
+    records = [record.as_dict() for record in build_records(n, random.Random(seed))]
+    summary = {"count": n, "duration": float(sum(r["duration"] or 0 for r in records))}
+    return responses.dumps({**summary, "records": [{k: r[k] for k in Record.OUTPUT_COLUMNS} for r in records]})
+
+
+def measure(body: bytes, encoding: str, level: int, repeat: int) -> dict:
+    """Time `repeat` compressions of the body, get stats with sizes."""
+    timings = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        compressed = compression.compressor(encoding, level).compress(body)
+        timings.append(time.perf_counter() - t)
+    stats = latency_stats(timings, sum(timings))
+    stats.update(
+        size=len(compressed), ratio=len(body) / len(compressed), mib_per_s=len(body) / 2**20 / stats["mean"] * 1000
+    )
+    return stats
+
+
+def run_benchmarks(rows=(10, 100, 1000), repeat=50, encodings=None, seed=42) -> dict:
+    """Run compression benchmarks for the pages sizes, get {rows: {encoding-level: stats}}."""
+    encodings = encodings or [e for e in LEVELS if e != "br" or compression.brotli is not None]
+    results = {}
+    for n in rows:
+        body = build_page(n, seed)
+        group = results[f"rows={n}"] = {"identity": {"size": len(body)}}
+        for encoding in encodings:
+            for level in LEVELS[encoding]:
+                stats = group[f"{encoding}-{level}"] = measure(body, encoding, level, repeat)
+                log.info(
+                    "rows=%d %s-%d: %d -> %d bytes (x%.1f), p50 %.3f ms, %.1f MiB/s",
+                    n,
+                    encoding,
+                    level,
+                    len(body),
+                    stats["size"],
+                    stats["ratio"],
+                    stats["p50"],
+                    stats["mib_per_s"],
+                )
+    return results
+
+
+def main():
+    """Read cli parameters, run benchmarks, save results."""
+    logging.basicConfig(level=logging.WARNING)
+    log.setLevel(logging.INFO)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", default="10,100,1000", help="records per page, comma separated")
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--encodings", help="encodings to run, comma separated (default: all available)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="results JSON file (default: stdout)")
+    args = parser.parse_args()
+    results = run_benchmarks(
+        rows=[int(n) for n in args.rows.split(",")],
+        repeat=args.repeat,
+        encodings=args.encodings.split(",") if args.encodings else None,
+        seed=args.seed,
+    )
+    params = {key: value for key, value in vars(args).items() if key != "output"}
+    save_results(args.output, results, benchmark="compression", **params)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
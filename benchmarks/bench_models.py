@@ -0,0 +1,143 @@
+"""
+Micro-benchmarks of the per-row paths: models to dicts, durations, schemas validation.
+
+Timed repetitions (each over `rows` objects) and peak memory (tracemalloc, separate run);
+with `--baseline` results are compared and regressions over `--threshold` % fail the run:
+
+    python -m benchmarks.bench_models --output new.json --baseline old.json --threshold 20
+"""
+
+import argparse
+import datetime
+import gc
+import logging
+import random
+import sys
+import time
+import tracemalloc
+
+from tmtrkr.api import responses, schemas
+from tmtrkr.models import Record
+
+from .common import latency_stats, load_results, save_results
+from .compare import compare_results
+
+__all__ = ["run_benchmarks"]
+
+log = logging.getLogger("benchmarks")
+
+NOW = int(datetime.datetime(2024, 1, 1).timestamp())
+
+
+def build_records(n: int, rng: random.Random) -> list:
+    """Build (transient) records, every tenth one is running."""
+    records = []
+    for i in range(n):
+        start = NOW - rng.randint(1, 365 * 24) * 3600
+        end = None if i % 10 == 0 else start + rng.randint(1, 48) * 300
+        tags = " ".join(rng.sample(["work", "home", "meeting", "review", "bug", "docs"], k=rng.randint(0, 3)))
+        records.append(
+            Record(id=i + 1, user_id=1, is_deleted=False, start=start, end=end, name=f"Record #{i}.", tags=tags or None)
+        )
+    return records
+
+
+def build_inputs(n: int, rng: random.Random) -> list:
+    """Build records input dicts (with tags to clean up)."""
+    inputs = []
+    for i in range(n):
+        start = NOW - rng.randint(1, 365 * 24) * 3600
+        tags = "  ".join(rng.sample(["Work", "HOME!", "meet-ing", "Review", "bug#1", "docs"], k=rng.randint(0, 4)))
+        inputs.append({"name": f"  Record #{i}. ", "start": start, "end": start + 1800, "tags": tags})
+    return inputs
+
+
+def build_cases(n: int, seed: int) -> dict:
+    """Build {case: callable} for n rows."""
+    rng = random.Random(seed)
+    records, inputs = build_records(n, rng), build_inputs(n, rng)
+    records_dicts = [record.as_dict() for record in records]
+    output_list = {"count": n, "duration": 1.0, "records": records_dicts, "next_cursor": None}
+    rows = [tuple(getattr(record, key) for key in Record.OUTPUT_COLUMNS) for record in records]
+    return {
+        "record.as_dict": lambda: [record.as_dict() for record in records],
+        "record.duration": lambda: [record.duration for record in records],
+        "Record.row_mapper": lambda: list(map(Record.row_mapper(), rows)),
+        "RecordsOutputList": lambda: schemas.RecordsOutputList.model_validate(output_list),
+        "RecordsOutputList.json": lambda: schemas.RecordsOutputList.model_validate(output_list).model_dump_json(),
+        "responses.dumps": lambda: responses.dumps(output_list),
+        "RecordInput": lambda: [schemas.RecordInput.model_validate(data) for data in inputs],
+        "clean_tags": lambda: [schemas.clean_tags(data["tags"]) for data in inputs],
+    }
+
+
+def measure(func, repeat: int) -> dict:
+    """Time `repeat` runs of the function, measure peak memory of one more (traced) run."""
+    func()  # warm up
+    timings = []
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            t = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - t)
+    finally:
+        if gc_enabled:
+            gc.enable()
+    stats = latency_stats(timings, sum(timings))
+    tracemalloc.start()
+    try:
+        func()
+        stats["peak_kib"] = tracemalloc.get_traced_memory()[1] / 1024
+    finally:
+        tracemalloc.stop()
+    return stats
+
+
+def run_benchmarks(rows=(100, 1000), repeat=50, cases=None, seed=42) -> dict:
+    """Run micro-benchmarks for the rows counts, get {rows: {case: stats}}."""
+    results = {}
+    for n in rows:
+        group = results[f"rows={n}"] = {}
+        for case, func in build_cases(n, seed).items():
+            if cases and case not in cases:
+                continue
+            group[case] = measure(func, repeat)
+            log.info("rows=%d %s: p50 %.3f ms, peak %.1f KiB", n, case, group[case]["p50"], group[case]["peak_kib"])
+    return results
+
+
+def main():
+    """Read cli parameters, run benchmarks, save and check results."""
+    logging.basicConfig(level=logging.WARNING)
+    log.setLevel(logging.INFO)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", default="100,1000", help="rows per run, comma separated")
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--cases", help="cases to run, comma separated (default: all)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="results JSON file (default: stdout)")
+    parser.add_argument("--baseline", help="baseline results JSON file to check regressions against")
+    parser.add_argument("--threshold", type=float, default=20.0, help="allowed regression, %%")
+    parser.add_argument("--metrics", default="p50,peak_kib", help="checked metrics, comma separated")
+    args = parser.parse_args()
+    results = run_benchmarks(
+        rows=[int(n) for n in args.rows.split(",")],
+        repeat=args.repeat,
+        cases=args.cases.split(",") if args.cases else None,
+        seed=args.seed,
+    )
+    params = {key: value for key, value in vars(args).items() if key not in ("output", "baseline")}
+    save_results(args.output, results, benchmark="models", **params)
+    if args.baseline:
+        baseline = load_results(args.baseline)
+        regressions = compare_results(baseline, {"results": results}, args.threshold, args.metrics.split(","))
+        for group, case, key, change in regressions:
+            print(f"REGRESSION: {group} {case} {key} changed by {change:+.1f}% (threshold {args.threshold}%)")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,56 @@
+"""Benchmarks helpers: timings statistics, results files."""
+
+import json
+import platform
+import statistics
+import subprocess
+import time
+
+__all__ = ["latency_stats", "save_results", "load_results"]
+
+
+def latency_stats(latencies: list, wall_time: float, errors: int = 0) -> dict:
+    """Latency percentiles (milliseconds) and throughput (per second) of the timed calls."""
+    latencies = sorted(latencies)
+    quantiles = statistics.quantiles(latencies, n=100, method="inclusive") if len(latencies) > 1 else latencies * 99
+    return {
+        "n": len(latencies),
+        "errors": errors,
+        "throughput": len(latencies) / wall_time if wall_time else None,
+        "mean": 1000 * statistics.fmean(latencies),
+        "p50": 1000 * quantiles[49],
+        "p95": 1000 * quantiles[94],
+        "p99": 1000 * quantiles[98],
+        "max": 1000 * latencies[-1],
+    }
+
+
+def git_revision() -> str:
+    """Get current git revision (of the working directory)."""
+    try:
+        cmd = ["git", "rev-parse", "--short", "HEAD"]
+        return subprocess.run(cmd, capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+def save_results(path: str, results: dict, **meta):
+    """Save results with the run metadata as JSON (stdout if no path)."""
+    meta.update(
+        revision=git_revision(),
+        python=platform.python_version(),
+        platform=platform.platform(),
+        time=time.strftime("%Y-%m-%dT%H:%M:%S"),
+    )
+    data = json.dumps({"meta": meta, "results": results}, indent=2, sort_keys=True)
+    if path:
+        with open(path, "w") as f:
+            f.write(data + "\n")
+    else:
+        print(data)
+
+
+def load_results(path: str) -> dict:
+    """Load results JSON file."""
+    with open(path) as f:
+        return json.load(f)
@@ -0,0 +1,58 @@
+"""Compare two benchmarks results files (baseline and current), fail on regressions."""
+
+import argparse
+import sys
+
+from .common import load_results
+
+__all__ = ["compare_results"]
+
+# metric: True if higher is better
+METRICS = {"p50": False, "p95": False, "p99": False, "throughput": True, "peak_kib": False}
+
+
+def compare_results(baseline: dict, current: dict, threshold: float = 10.0, metrics: tuple = ("p95",)) -> list:
+    """
+    Print the side by side table, return regressions (`metrics` worse by more than `threshold` %).
+
+    Results are {group: {case: {metric: value}}}, cases missing in one of the files are skipped.
+    """
+    regressions = []
+    print(f"{'case':<40} {'metric':<12} {'baseline':>12} {'current':>12} {'change':>9}")
+    for group, cases in current["results"].items():
+        for case, stats in cases.items():
+            base = baseline["results"].get(group, {}).get(case)
+            if not base:
+                continue
+            for key, higher_is_better in METRICS.items():
+                if base.get(key) is None or stats.get(key) is None:
+                    continue
+                change = 100 * (stats[key] - base[key]) / base[key] if base[key] else 0.0
+                worse = -change if higher_is_better else change
+                mark = " !" if key in metrics and worse > threshold else ""
+                print(
+                    f"{group + ' ' + case:<40} {key:<12} {base[key]:>12.3f} {stats[key]:>12.3f} {change:>+8.1f}%{mark}"
+                )
+                if mark:
+                    regressions.append((group, case, key, change))
+    return regressions
+
+
+def main():
+    """Read cli parameters, compare, exit with 1 on regressions."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=10.0, help="allowed regression, %%")
+    parser.add_argument("--metrics", default="p95", help=f"checked metrics, comma separated: {', '.join(METRICS)}")
+    args = parser.parse_args()
+    baseline, current = load_results(args.baseline), load_results(args.current)
+    print(f"baseline: {baseline['meta'].get('revision')}, current: {current['meta'].get('revision')}")
+    regressions = compare_results(baseline, current, threshold=args.threshold, metrics=args.metrics.split(","))
+    for group, case, key, change in regressions:
+        print(f"REGRESSION: {group} {case} {key} {change:+.1f}% (threshold {args.threshold}%)")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
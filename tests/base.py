@@ -2,6 +2,7 @@
 
 import logging
 
+import tmtrkr.api.users
 import tmtrkr.models
 
 # set up logging
@@ -21,5 +22,7 @@ class DataBaseTestMixin:
 
     def tearDown(self):
         """Close database -- drop all tables."""
+        self.db.close()  # return the connection to the pool (not left to the garbage collector)
         tmtrkr.models.drop_all()
+        tmtrkr.api.users.users_cache.invalidate()  # user ids are reused
         super().tearDown()
@@ -1,14 +1,50 @@
 """."""
 
+import asyncio
+import csv
 import datetime
+import importlib.util
+import io
+import json
+import os
+import pathlib
 import random
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
 import unittest
+import zlib
+from unittest import mock
 
+import httpx
+import jwt
 from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse
+from starlette.routing import Mount, Route
 
+import tmtrkr.models.db
 import tmtrkr.settings as settings
-from tmtrkr.api.api import app
-from tmtrkr.models import Record
+from tmtrkr.api import events, replica, schemas
+from tmtrkr.api.api import OAuth2SessionMiddleware, app, create_app
+from tmtrkr.api.cache import TTLCache
+from tmtrkr.api.compression import accepted_encodings, compressor
+from tmtrkr.api.events import Broadcaster, LocalPubSub, event_stream
+from tmtrkr.api.records import encode_cursor
+from tmtrkr.api.users import tokens_cache, users_cache
+from tmtrkr.models import Base, Record
+from tmtrkr.models import db_session_async as db_session_async_dependency
+from tmtrkr.server.packagestaticfiles import PackageStaticFiles
+from tmtrkr.server.prefork import PreforkServer
 
 from .base import DataBaseTestMixin
 
@@ -38,6 +74,415 @@ class TestAPIUsers(DataBaseTestMixin, unittest.TestCase):
         rsp = self.client.get(settings.API_BASE_PREFIX + "/users/logout", follow_redirects=False)
         self.assertIn(rsp.status_code, [301, 302, 303, 307])
 
+    def test_token(self):
+        """Get token, use it (verified once, then cached)."""
+        headers = {settings.AUTH_USERS_ALLOW_XFORWARDED_HEADER: "tokenized"}
+        rsp = self.client.get(settings.API_BASE_PREFIX + "/users/token", headers=headers)
+        self.assertEqual(rsp.status_code, 200)
+        headers = {"Authorization": f"Bearer {rsp.json()['token']}"}
+        hits = tokens_cache.hits
+        for _ in range(3):
+            rsp = self.client.get(settings.API_BASE_PREFIX + "/records/summary", headers=headers)
+            self.assertEqual(rsp.status_code, 200)
+            self.assertEqual(rsp.json()["user"]["name"], "tokenized")
+        self.assertEqual(tokens_cache.hits - hits, 2)
+
+    def test_token_invalid(self):
+        """Expired and wrongly signed tokens are rejected."""
+        expired = {"username": "tokenized", "userid": None, "expire": int(time.time()) - 1}
+        tokens = [
+            jwt.encode(expired, key=settings.SECRET_KEY, algorithm="HS256"),
+            jwt.encode({**expired, "expire": int(time.time()) + 60}, key="not a secret", algorithm="HS256"),
+        ]
+        for token in tokens:
+            rsp = self.client.get(
+                settings.API_BASE_PREFIX + "/records/summary", headers={"Authorization": f"Bearer {token}"}
+            )
+            self.assertEqual(rsp.status_code, 401, rsp.text)
+
+    def test_session_middleware_paths(self):
+        """Session is set up for the OAuth2 routes only."""
+
+        async def has_session(request):
+            return PlainTextResponse(str("session" in request.scope))
+
+        routes = [Route("/api/users/oauth2-login", has_session), Route("/api/records/", has_session)]
+        test_app = OAuth2SessionMiddleware(Starlette(routes=routes), path_prefix="/api/users/oauth2-", secret_key="x")
+        client = TestClient(test_app)
+        self.assertEqual(client.get("/api/users/oauth2-login").text, "True")
+        self.assertEqual(client.get("/api/records/").text, "False")
+
+
+class TestTTLCache(unittest.TestCase):
+    """Test in-process cache."""
+
+    def setUp(self):
+        """."""
+        self.now = 0
+        self.cache = TTLCache(maxsize=3, ttl=10, timer=lambda: self.now)
+
+    def test_lru(self):
+        """Least recently used entries are evicted."""
+        for key in "abc":
+            self.cache.set(key, key.upper())
+        self.assertEqual(self.cache.get("a"), "A")
+        self.cache.set("d", "D")
+        self.assertIsNone(self.cache.get("b"))
+        self.assertEqual([self.cache.get(key) for key in "acd"], ["A", "C", "D"])
+        self.assertEqual(self.cache.stats(), {"hits": 4, "misses": 1, "size": 3, "maxsize": 3})
+
+    def test_ttl(self):
+        """Expired entries are dropped."""
+        self.cache.set("a", 1)
+        self.cache.set("b", 2, ttl=20)
+        self.now = 10
+        self.assertIsNone(self.cache.get("a"))
+        self.assertEqual(self.cache.get("b"), 2)
+        self.now = 20
+        self.assertIsNone(self.cache.get("b"))
+        self.assertEqual(len(self.cache), 0)
+
+    def test_invalidate(self):
+        """Drop entries explicitly."""
+        for key in "abc":
+            self.cache.set(key, key.upper())
+        self.cache.invalidate("a", "x")
+        self.assertEqual([self.cache.get(key) for key in "abc"], [None, "B", "C"])
+        self.cache.invalidate()
+        self.assertEqual(len(self.cache), 0)
+
+    def test_disabled(self):
+        """Zero size cache stores nothing."""
+        cache = TTLCache(maxsize=0, ttl=10)
+        cache.set("a", 1)
+        self.assertIsNone(cache.get("a"))
+
+
+class TestEvents(unittest.TestCase):
+    """Test records change events (push channel)."""
+
+    def test_workers(self):
+        """Events are delivered to the user's subscribers of all the workers (shared pub/sub)."""
+        pubsub = LocalPubSub()
+        workers = [Broadcaster(pubsub), Broadcaster(pubsub)]
+
+        async def check():
+            subscriptions = [worker.subscribe(1) for worker in workers]
+            other = workers[1].subscribe(2)
+            await asyncio.to_thread(workers[0].publish, 1, "create", {"id": 1})
+            for subscription in subscriptions:
+                self.assertEqual(await subscription.get(timeout=1), {"op": "create", "record": {"id": 1}})
+            self.assertIsNone(await other.get(timeout=0.01))
+
+        asyncio.run(check())
+
+    def test_backpressure(self, N=4):
+        """Slow subscriber loses pending events, gets resync."""
+        worker = Broadcaster(queue_size=2)
+
+        async def check():
+            subscription = worker.subscribe(1)
+            for i in range(N):
+                worker.publish(1, "update", {"id": i})
+            await asyncio.sleep(0)
+            self.assertEqual(await subscription.get(timeout=1), {"op": "resync"})
+            self.assertEqual(await subscription.get(timeout=1), {"op": "update", "record": {"id": N - 1}})
+            self.assertIsNone(await subscription.get(timeout=0.01))
+
+        asyncio.run(check())
+
+    def test_event_stream(self):
+        """Server-Sent Events stream, subscribed while streamed (not before), unsubscribed when closed."""
+        worker = Broadcaster()
+
+        async def check():
+            event_stream(2, broadcaster=worker)  # response never streamed (client gone)
+            stream = event_stream(1, broadcaster=worker, keepalive=0.01)
+            self.assertEqual(worker.subscribers, {})
+            self.assertTrue((await anext(stream)).startswith("retry:"))
+            self.assertEqual(set(worker.subscribers), {1})
+            self.assertEqual(await anext(stream), ": keepalive\n\n")
+            worker.publish(1, "delete", {"id": 1})
+            self.assertEqual(await anext(stream), 'event: delete\ndata: {"op": "delete", "record": {"id": 1}}\n\n')
+            await stream.aclose()
+            self.assertEqual(worker.subscribers, {})
+
+        asyncio.run(check())
+
+    def test_unix_socket_pubsub(self):
+        """Events are delivered to the workers of other processes (datagram sockets), stale sockets are dropped."""
+        with tempfile.TemporaryDirectory() as directory:
+            pubsubs = [events.UnixSocketPubSub(directory, name="one"), events.UnixSocketPubSub(directory, name="two")]
+            with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as stale:
+                stale.bind(os.path.join(directory, "stale.sock"))  # exited process, the socket file is left
+            workers = [Broadcaster(), Broadcaster()]
+            for worker, pubsub in zip(workers, pubsubs):
+                worker.use(pubsub)
+
+            async def check():
+                subscriptions = [worker.subscribe(1) for worker in workers]
+                await asyncio.to_thread(workers[0].publish, 1, "create", {"id": 1})
+                for subscription in subscriptions:
+                    self.assertEqual(await subscription.get(timeout=1), {"op": "create", "record": {"id": 1}})
+
+            try:
+                asyncio.run(check())
+                self.assertEqual(sorted(os.listdir(directory)), ["one.sock", "two.sock"])
+            finally:
+                for pubsub in pubsubs:
+                    pubsub.close()
+            self.assertEqual(os.listdir(directory), [])
+
+    def test_unix_socket_pubsub_resync(self, N=100):
+        """Messages to a full (stuck) receiver are dropped, all its subscribers get resync then."""
+        with tempfile.TemporaryDirectory() as directory:
+            sender, receiver = events.UnixSocketPubSub(directory, name="one"), events.UnixSocketPubSub(
+                directory, name="two"
+            )
+            stuck = threading.Event()
+            receiver.attach(lambda message: stuck.wait(timeout=5))
+            worker = Broadcaster()
+            worker.use(receiver)
+
+            async def check():
+                subscription = worker.subscribe(2)
+                for i in range(N):
+                    sender.publish({"user_id": 1, "event": {"op": "create", "record": {"id": i}}})
+                self.assertEqual(sender.dropped, {receiver.path})
+                stuck.set()
+                self.assertEqual(await subscription.get(timeout=1), {"op": "resync"})
+                self.assertIsNone(await subscription.get(timeout=0.2))
+                self.assertEqual(sender.dropped, set())
+
+            try:
+                asyncio.run(check())
+            finally:
+                stuck.set()
+                sender.close()
+                receiver.close()
+
+
+@unittest.skipUnless(hasattr(os, "fork"), "pre-fork server needs fork")
+class TestPreforkServer(unittest.TestCase):
+    """Test multi-process server: migrations before the fork, reload, graceful shutdown."""
+
+    def wait_get(self, url: str, timeout: float = 10) -> httpx.Response:
+        """GET once the server is up."""
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                return httpx.get(url, headers={settings.AUTH_USERS_ALLOW_XFORWARDED_HEADER: "username"})
+            except httpx.TransportError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.1)
+
+    def workers(self, process: subprocess.Popen) -> set:
+        """."""
+        with open(f"/proc/{process.pid}/task/{process.pid}/children") as f:
+            return set(f.read().split())
+
+    def test_respawn_backoff(self, N=3):
+        """Workers failing at startup are restarted with exponential backoff, a working one resets it."""
+        server = PreforkServer(app, "127.0.0.1", 0, workers=1)
+        server.run_worker = mock.Mock(side_effect=RuntimeError("startup failure"))
+
+        def fail():
+            server.workers.add(server.spawn())
+            while server.workers:
+                server.reap()
+                time.sleep(0.01)
+
+        for i in range(N):
+            fail()
+            self.assertEqual(server.failures, i + 1)
+            self.assertFalse(server.respawn_due())
+        self.assertEqual(server.respawn_delay(), 0.2 * 2 ** (N - 1))
+        with mock.patch.object(settings, "SERVER_RESPAWN_MAX_DELAY", 0.5):
+            self.assertEqual(server.respawn_delay(), 0.5)
+        with mock.patch.object(settings, "SERVER_WORKER_MIN_UPTIME", 0):
+            fail()
+        self.assertEqual(server.failures, 0)
+        self.assertTrue(server.respawn_due())
+
+    def test_server(self, N=2):
+        """Workers serve the migrated database, are replaced on SIGHUP, stopped on SIGTERM."""
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        with tempfile.TemporaryDirectory() as directory:
+            env = {
+                **os.environ,
+                "TMTRKR_DATABASE_URL": "sqlite:///" + os.path.join(directory, "db.sqlite"),
+                "TMTRKR_DATABASE_SQLITE_MODE": "wal",
+                "TMTRKR_SERVER_WORKERS": str(N),
+                "TMTRKR_SERVER_MIGRATE": "1",
+                "TMTRKR_SERVER_BIND_HOST": "127.0.0.1",
+                "TMTRKR_SERVER_BIND_PORT": str(port),
+                "TMTRKR_SERVER_GRACEFUL_TIMEOUT": "5",
+            }
+            cmd = [sys.executable, "-c", "import tmtrkr.server.server; tmtrkr.server.server.run()"]
+            process = subprocess.Popen(cmd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            try:
+                url = f"http://127.0.0.1:{port}{settings.API_BASE_PREFIX}/records/"
+                self.assertEqual(self.wait_get(url).status_code, 200)
+                workers = self.workers(process)
+                self.assertEqual(len(workers), N)
+                process.send_signal(signal.SIGHUP)
+                deadline = time.monotonic() + 10
+                while self.workers(process) & workers and time.monotonic() < deadline:
+                    time.sleep(0.1)
+                self.assertEqual(len(self.workers(process) - workers), N)
+                self.assertEqual(self.wait_get(url).status_code, 200)
+                process.send_signal(signal.SIGTERM)
+                self.assertEqual(process.wait(timeout=15), 0)
+            finally:
+                process.kill()
+                process.wait()
+
+
+class TestStaticFiles(unittest.TestCase):
+    """Test web front-end static files."""
+
+    def setUp(self):
+        """."""
+        self.static = PackageStaticFiles(directory="www")
+        self.client = TestClient(Starlette(routes=[Mount("/www", self.static)]), follow_redirects=False)
+
+    def test_index(self):
+        """Directory index, redirect to it."""
+        rsp = self.client.get("/www")
+        self.assertEqual(rsp.status_code, 307)
+        self.assertTrue(rsp.headers["location"].endswith("/www/"))
+        rsp = self.client.get("/www/", headers={"Accept-Encoding": "identity"})
+        self.assertEqual(rsp.status_code, 200)
+        self.assertEqual(rsp.headers["content-type"], "text/html; charset=utf-8")
+        self.assertEqual(rsp.content, pathlib.Path("www/index.html").read_bytes())
+        self.assertEqual(rsp.headers["cache-control"], settings.SERVER_STATIC_CACHE_CONTROL)
+        self.assertEqual(self.client.get("/www/404.html").status_code, 404)
+        self.assertEqual(self.client.post("/www/").status_code, 405)
+
+    def test_compressed(self):
+        """Compressed variants are negotiated, conditional GET."""
+        path = "/www/js/vue@3.2.33.global.prod.js"
+        data = pathlib.Path(path.lstrip("/")).read_bytes()
+        encodings = ["gzip", "br"] if importlib.util.find_spec("brotli") else ["gzip"]
+        etags = set()
+        for encoding in encodings:
+            rsp = self.client.get(path, headers={"Accept-Encoding": f"{encoding}, deflate;q=0.5"})
+            self.assertEqual(rsp.status_code, 200)
+            self.assertEqual(rsp.headers["content-encoding"], encoding)
+            self.assertLess(int(rsp.headers["content-length"]), len(data) // 2)
+            self.assertEqual(rsp.content, data)
+            etags.add(rsp.headers["etag"])
+            rsp = self.client.get(path, headers={"Accept-Encoding": encoding, "If-None-Match": rsp.headers["etag"]})
+            self.assertEqual(rsp.status_code, 304)
+        rsp = self.client.get(path, headers={"Accept-Encoding": "gzip;q=0"})
+        self.assertNotIn("content-encoding", rsp.headers)
+        self.assertEqual(int(rsp.headers["content-length"]), len(data))
+        self.assertEqual(len(etags | {rsp.headers["etag"]}), len(encodings) + 1)
+
+    def test_range(self):
+        """Partial content."""
+        path = "/www/css/tmtrkr.css"
+        data = pathlib.Path(path.lstrip("/")).read_bytes()
+        for range_header, content in [("bytes=0-9", data[:10]), ("bytes=-5", data[-5:]), ("bytes=10-", data[10:])]:
+            rsp = self.client.get(path, headers={"Range": range_header, "Accept-Encoding": "gzip"})
+            self.assertEqual(rsp.status_code, 206)
+            self.assertEqual(rsp.content, content)
+            self.assertTrue(rsp.headers["content-range"].endswith(f"/{len(data)}"))
+        rsp = self.client.get(path, headers={"Range": f"bytes={len(data)}-"})
+        self.assertEqual(rsp.status_code, 416)
+
+    def test_changed(self):
+        """Changed directory files are read again."""
+        with tempfile.TemporaryDirectory() as directory:
+            file = pathlib.Path(directory) / "index.html"
+            file.write_text("one")
+            client = TestClient(Starlette(routes=[Mount("/www", PackageStaticFiles(directory=directory))]))
+            rsp = client.get("/www/")
+            self.assertEqual(rsp.text, "one")
+            file.write_text("two")
+            os.utime(file, ns=(0, 0))
+            rsp2 = client.get("/www/")
+            self.assertEqual(rsp2.text, "two")
+            self.assertNotEqual(rsp.headers["etag"], rsp2.headers["etag"])
+            (pathlib.Path(directory) / "new.txt").write_text("new")
+            self.assertEqual(client.get("/www/new.txt").text, "new")
+
+
+class TestCompression(unittest.TestCase):
+    """Test API responses compression."""
+
+    def test_accepted_encodings(self):
+        """Parse Accept-Encoding."""
+        self.assertEqual(accepted_encodings("gzip, br;q=0.5, deflate;q=0, zstd;q=x"), {"gzip", "br"})
+
+    def test_streamed_chunks(self):
+        """Streamed chunks are flushed: every one can be decoded at once."""
+        decoders = {"gzip": lambda: zlib.decompressobj(16 + zlib.MAX_WBITS).decompress}
+        if importlib.util.find_spec("brotli"):
+            import brotli
+
+            decoders["br"] = lambda: brotli.Decompressor().process
+        for encoding, decoder in decoders.items():
+            encoder, decode = compressor(encoding), decoder()
+            for i in range(3):
+                chunk = f"event: update\ndata: {i}\n\n".encode()
+                self.assertEqual(decode(encoder.compress(chunk, final=False)), chunk, encoding)
+            self.assertEqual(decode(encoder.compress(b"end")), b"end")
+
+
+class TestAPIReplica(DataBaseTestMixin, unittest.TestCase):
+    """Test read replica routing (another SQLite file stands in for the replica)."""
+
+    def setUp(self):
+        """."""
+        super().setUp()
+        self.directory = tempfile.TemporaryDirectory()
+        self.replica = create_engine("sqlite:///" + os.path.join(self.directory.name, "replica.sqlite"))
+        Base.metadata.create_all(self.replica)
+        sessions = sessionmaker(
+            class_=tmtrkr.models.db.RoutingSession, bind=tmtrkr.models.db.engine, reader=self.replica, autoflush=False
+        )
+        for patch in (
+            mock.patch.object(settings, "AUTH_USERS_ALLOW_UNKNOWN", True),
+            mock.patch.object(tmtrkr.models.db, "replica_engine", self.replica),
+            mock.patch.object(tmtrkr.models.db, "ReplicaSession", sessions),
+        ):
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.client = TestClient(create_app())
+
+    def tearDown(self):
+        """."""
+        self.replica.dispose()
+        self.directory.cleanup()
+        super().tearDown()
+
+    def records_names(self, path="/records/") -> list:
+        """."""
+        rsp = self.client.get(settings.API_BASE_PREFIX + path)
+        self.assertEqual(rsp.status_code, 200)
+        return sorted(record["name"] for record in rsp.json()["records"])
+
+    def test_replica_reads(self):
+        """Read-only endpoints read from the replica, the client's writes are followed by primary reads."""
+        Record(name="primary", start=1577880000, end=1577883600).save(session=self.db)
+        with tmtrkr.models.db.ReplicaSession(bind=self.replica) as db:
+            Record(name="replica", start=1577880000, end=1577883600).save(session=db)
+        self.assertEqual(self.records_names(), ["replica"])
+        rsp = self.client.get(settings.API_BASE_PREFIX + "/records/export")
+        self.assertEqual([json.loads(line)["name"] for line in rsp.text.splitlines()], ["replica"])
+        rsp = self.client.post(settings.API_BASE_PREFIX + "/records/", json={"name": "new", "start": 1577880000})
+        self.assertEqual(rsp.status_code, 201)
+        self.assertIn(replica.PRIMARY_COOKIE, rsp.cookies)
+        self.assertEqual(self.records_names(), ["new", "primary"])  # read-your-writes
+        self.client.cookies.clear()
+        self.assertEqual(self.records_names(), ["replica"])
+        rsp = self.client.get(settings.API_BASE_PREFIX + "/records/")
+        self.assertNotIn(replica.PRIMARY_COOKIE, rsp.cookies)
+
 
 class TestAPIRecords(DataBaseTestMixin, unittest.TestCase):
     """Test User database model."""
@@ -65,6 +510,473 @@ class TestAPIRecords(DataBaseTestMixin, unittest.TestCase):
             rspi = self.client.get(settings.API_BASE_PREFIX + f"/records/{record_id}")
             self.assertEqual(rspi.status_code, 200)
 
+    def test_records_list_summary(self, N=30, LIMIT=10):
+        """Records list summary covers the whole filtered range, not the page."""
+        self._create_records(N)
+        rsp_all = self.client.get(settings.API_BASE_PREFIX + "/records/")
+        self.assertEqual(rsp_all.status_code, 200)
+        data_all = rsp_all.json()
+        records = data_all["records"]
+        rsp = self.client.get(settings.API_BASE_PREFIX + "/records/", params={"limit": LIMIT})
+        self.assertEqual(rsp.status_code, 200)
+        data = rsp.json()
+        self.assertEqual(len(data["records"]), LIMIT)
+        self.assertEqual(data["count"], N)
+        self.assertEqual(data["duration"], sum(r["duration"] for r in records))
+        self.assertEqual(data["start_min"], min(r["start"] for r in records))
+        self.assertEqual(data["start_max"], max(r["start"] for r in records))
+        self.assertEqual(data["end_min"], min(r["end"] for r in records))
+        self.assertEqual(data["end_max"], max(r["end"] for r in records))
+
+    def test_records_summary(self, N=30):
+        """Get records summary only."""
+        self._create_records(N)
+        rsp_list = self.client.get(settings.API_BASE_PREFIX + "/records/")
+        data_list = rsp_list.json()
+        start_max = sorted(r["start"] for r in data_list["records"])[N // 2]
+        rsp = self.client.get(settings.API_BASE_PREFIX + "/records/summary", params={"start_max": start_max})
+        self.assertEqual(rsp.status_code, 200)
+        data = rsp.json()
+        self.assertNotIn("records", data)
+        self.assertEqual(data["count"], N // 2 + 1)
+        self.assertEqual(data["query_start_max"], start_max)
+        self.assertEqual(data["start_max"], start_max)
+
+    def test_records_report(self):
+        """Get records report by days, weeks, months and tags."""
+        DAY = 24 * 60 * 60
+        MONDAY = 1704067200  # 2024-01-01 00:00:00 UTC
+        records = [
+            {"name": "mon", "start": MONDAY + 9 * 3600, "end": MONDAY + 10 * 3600, "tags": "work"},
+            {"name": "mon", "start": MONDAY + 11 * 3600, "end": MONDAY + 13 * 3600, "tags": "work meet"},
+            {"name": "sun", "start": MONDAY + 6 * DAY, "end": MONDAY + 6 * DAY + 1800},
+            {"name": "next mon", "start": MONDAY + 7 * DAY, "end": MONDAY + 7 * DAY + 600, "tags": "meet"},
+            {"name": "feb", "start": MONDAY + 31 * DAY, "end": MONDAY + 31 * DAY + 60, "tags": "work"},
+        ]
+        for record in records:
+            rsp = self.client.post(settings.API_BASE_PREFIX + "/records/", json=record)
+            self.assertEqual(rsp.status_code, 201)
+
+        def report(**params):
+            rsp = self.client.get(settings.API_BASE_PREFIX + "/records/report", params=params)
+            self.assertEqual(rsp.status_code, 200)
+            return [(r["bucket"], r["tag"], r["count"], r["duration"]) for r in rsp.json()["rows"]]
+
+        self.assertEqual(
+            report(bucket="day"),
+            [
+                ("2024-01-01", None, 2, 3 * 3600),
+                ("2024-01-07", None, 1, 1800),
+                ("2024-01-08", None, 1, 600),
+                ("2024-02-01", None, 1, 60),
+            ],
+        )
+        self.assertEqual(
+            report(bucket="week"),
+            [("2024-01-01", None, 3, 3 * 3600 + 1800), ("2024-01-08", None, 1, 600), ("2024-01-29", None, 1, 60)],
+        )
+        self.assertEqual(
+            report(bucket="month", by_tag=True),
+            [
+                ("2024-01-01", None, 1, 1800),
+                ("2024-01-01", "meet", 2, 2 * 3600 + 600),
+                ("2024-01-01", "work", 2, 3 * 3600),
+                ("2024-02-01", "work", 1, 60),
+            ],
+        )
+        self.assertEqual(report(bucket="year", start_min=MONDAY + 7 * DAY), [("2024-01-01", None, 2, 660)])
+        self.assertEqual(report(bucket="day", utc_offset=-10 * 3600)[0], ("2023-12-31", None, 1, 3600))
+
+    def test_records_rollups(self, N=50):
+        """Summary and report from the rollups are the same as from the records."""
+        DAY = 24 * 60 * 60
+        today = int(datetime.datetime.now().timestamp()) // DAY * DAY
+        for i in range(N):
+            # some records cross UTC midnight (and the ranges bounds)
+            start = today - random.randint(0, 500) * DAY + random.randint(0, 23) * 3600
+            end = start + random.randint(1, 200) * 15 * 60
+            Record(name=f"record #{i}", start=start, end=end, tags=random.choice([None, "a", "a b"])).save(self.db)
+        Record(name="running", start=today).save(self.db)
+        start_min = today - 365 * DAY
+        start_max = start_min + 366 * DAY - 1
+        requests = [
+            ("/records/summary", {}),
+            ("/records/summary", {"start_min": start_min, "start_max": start_max}),
+            ("/records/summary", {"start_min": start_min + 100 * DAY, "start_max": start_min + 130 * DAY - 1}),
+            ("/records/summary", {"start_max": start_min + 200 * DAY - 1}),
+            ("/records/report", {"bucket": "month"}),
+            ("/records/report", {"bucket": "day", "start_min": start_min + 7 * DAY, "start_max": start_max - DAY}),
+            ("/records/report", {"bucket": "week", "by_tag": True, "start_min": start_min}),
+        ]
+        for url, params in requests:
+            responses = []
+            for rollup_enabled in (True, False):
+                settings.ROLLUP_ENABLED = rollup_enabled
+                try:
+                    rsp = self.client.get(settings.API_BASE_PREFIX + url, params=params)
+                finally:
+                    settings.ROLLUP_ENABLED = True
+                self.assertEqual(rsp.status_code, 200)
+                responses.append(rsp.json())
+            # running record duration grows between the requests
+            durations = [[r.pop("duration") for r in rsp.get("rows", [rsp])] for rsp in responses]
+            for duration_a, duration_b in zip(*durations):
+                self.assertAlmostEqual(duration_a, duration_b, delta=10)
+            self.assertEqual(responses[0], responses[1], f"{url} {params}")
+
+    def test_records_list_tags(self):
+        """Get records list filtered by tags."""
+        for i, tags in enumerate(["Work", "work meet", "meet home", None]):
+            record = {"name": f"record #{i}", "start": 1577880000 + i, "tags": tags}
+            rsp = self.client.post(settings.API_BASE_PREFIX + "/records/", json=record)
+            self.assertEqual(rsp.status_code, 201)
+
+        def names(**params):
+            rsp = self.client.get(settings.API_BASE_PREFIX + "/records/", params=params)
+            self.assertEqual(rsp.status_code, 200)
+            data = rsp.json()
+            self.assertEqual(data["count"], len(data["records"]))
+            return sorted(r["name"] for r in data["records"])
+
+        self.assertEqual(names(tags="work"), ["record #0", "record #1"])
+        self.assertEqual(names(tags="WORK, home"), ["record #0", "record #1", "record #2"])
+        self.assertEqual(names(tags="work meet", tags_match="all"), ["record #1"])
+        rsp = self.client.get(settings.API_BASE_PREFIX + "/records/", params={"tags": "x", "tags_match": "none"})
+        self.assertEqual(rsp.status_code, 422)
+
+    def test_records_search(self):
+        """Search records by names and tags (full-text)."""
+        records = [
+            {"name": "Weekly planning meeting", "start": 1577880000},
+            {"name": "Code review", "start": 1577880100, "tags": "meeting"},
+            {"name": "Meeting meeting, more meetings", "start": 1577880200},
+            {"name": "Lunch", "start": 1577880300},
+        ]
+        ids = []
+        for record in records:
+            rsp = self.client.post(settings.API_BASE_PREFIX + "/records/", json=record)
+            self.assertEqual(rsp.status_code, 201)
+            ids.append(rsp.json()["id"])
+
+        def search(q, **params):
+            rsp = self.client.get(settings.API_BASE_PREFIX + "/records/", params={"q": q, **params})
+            self.assertEqual(rsp.status_code, 200)
+            data = rsp.json()
+            self.assertEqual(data["count"], len(data["records"]))
+            return [r["id"] for r in data["records"]]
+
+        self.assertEqual(search("meeting")[0], ids[2])  # the most relevant first
+        self.assertEqual(sorted(search("MEET")), sorted(ids[:3]))
+        self.assertEqual(search("planning meet"), [ids[0]])
+        self.assertEqual(sorted(search("meeting", start_max=1577880150)), ids[:2])
+        self.assertEqual(search('"review" OR *lunch*'), [])
+        self.assertEqual(search("lunch"), [ids[3]])
+        rsp = self.client.patch(
+            settings.API_BASE_PREFIX + f"/records/{ids[3]}", json={"name": "Team lunch", "start": 1577880300}
+        )
+        self.assertEqual(rsp.status_code, 202)
+        self.assertEqual(search("team"), [ids[3]])
+        self.assertEqual(search("lunch", is_deleted=True), [])
+        rsp = self.client.get(
+            settings.API_BASE_PREFIX + "/records/", params={"q": "lunch", "cursor": encode_cursor(1577880300, 1)}
+        )
+        self.assertEqual(rsp.status_code, 400)
+
+    def test_records_batch(self, N=100):
+        """Create, patch and delete records in one batch."""
+        rsp = self.client.post(settings.API_BASE_PREFIX + "/records/", json={"name": "old", "start": 1577880000})
+        old_id = rsp.json()["id"]
+        operations = [
+            {"op": "create", "data": {"name": f"new #{i}", "start": 1577880000 + i, "end": 1577883600}}
+            for i in range(N)
+        ]
+        operations += [
+            {"op": "patch", "id": old_id, "data": {"name": "old patched", "start": 1577880000, "tags": "Batch"}},
+            {"op": "create", "data": {"name": "", "start": 1577880000}},
+            {"op": "create", "data": {"name": "end<start", "start": 1577880000, "end": 1577870000}},
+            {"op": "patch", "id": 999999999, "data": {"name": "404", "start": 1577880000}},
+            {"op": "delete"},
+            {"op": "delete", "id": old_id},
+        ]
+        rsp = self.client.post(settings.API_BASE_PREFIX + "/records/batch", json={"operations": operations})
+        self.assertEqual(rsp.status_code, 200)
+        results = rsp.json()["results"]
+        self.assertEqual([r["index"] for r in results], list(range(len(operations))))
+        self.assertEqual([r["status"] for r in results[N:]], [202, 422, 422, 404, 422, 200])
+        for i, result in enumerate(results[:N]):
+            self.assertEqual(result["status"], 201)
+            self.assertEqual(result["record"]["name"], f"new #{i}")
+            self.assertEqual(result["record"]["duration"], 3600 - i)
+        self.assertEqual(results[N]["record"]["tags"], "batch")
+        self.assertTrue(results[N]["record"]["is_deleted"])
+        self.assertIn("name", results[N + 1]["error"])
+        self.assertIsNone(results[N + 3]["record"])
+        rsp = self.client.get(settings.API_BASE_PREFIX + "/records/")
+        data = rsp.json()
+        self.assertEqual(data["count"], N)
+        self.assertEqual(sorted(r["id"] for r in data["records"]), sorted(r["record"]["id"] for r in results[:N]))
+        rsp = self.client.get(settings.API_BASE_PREFIX + "/records/", params={"tags": "batch", "is_deleted": True})
+        self.assertEqual([r["id"] for r in rsp.json()["records"]], [old_id])
+        rsp = self.client.get(settings.API_BASE_PREFIX + "/records/summary", params={"start_min": 0})
+        self.assertEqual(rsp.json()["duration"], sum(3600 - i for i in range(N)))
+
+    def test_records_etag(self, N=10):
+        """Conditional GET of the list: 304 till the records (in the filtered range) are changed."""
+        record_ids = self._create_records(N)
+        url = settings.API_BASE_PREFIX + "/records/"
+        rsp = self.client.get(url)
+        self.assertEqual(rsp.status_code, 200)
+        etag = rsp.headers["etag"]
+        rsp = self.client.get(url, headers={"If-None-Match": etag})
+        self.assertEqual(rsp.status_code, 304)
+        self.assertEqual(rsp.content, b"")
+        self.assertEqual(rsp.headers["etag"], etag)
+        rsp = self.client.get(url, params={"limit": 5}, headers={"If-None-Match": etag})
+        self.assertEqual(rsp.status_code, 200)
+        patch = {"op": "patch", "id": record_ids[0], "data": {"name": "patched", "start": 1577880000}}
+        changes = [
+            ("batch", {"operations": [patch]}),
+            ("batch", {"operations": [{"op": "delete", "id": record_ids[1]}]}),
+            ("post", {"name": "new", "start": 1577880000, "end": 1577883600}),
+        ]
+        for method, data in changes:
+            if method == "batch":
+                self.client.post(url + "batch", json=data)
+            else:
+                self.client.post(url, json=data)
+            rsp = self.client.get(url, headers={"If-None-Match": etag})
+            self.assertEqual(rsp.status_code, 200, method)
+            self.assertNotEqual(rsp.headers["etag"], etag)
+            etag = rsp.headers["etag"]
+
+    def test_record_etag(self):
+        """Conditional GET of a record."""
+        record_id = self._create_records(1)[0]
+        url = settings.API_BASE_PREFIX + f"/records/{record_id}"
+        rsp = self.client.get(url)
+        etag = rsp.headers["etag"]
+        rsp = self.client.get(url, headers={"If-None-Match": f'"other", {etag}'})
+        self.assertEqual(rsp.status_code, 304)
+        self.client.patch(url, json={"name": "patched", "start": 1577880000, "end": 1577883600})
+        rsp = self.client.get(url, headers={"If-None-Match": etag})
+        self.assertEqual(rsp.status_code, 200)
+        self.assertEqual(rsp.json()["name"], "patched")
+        rsp = self.client.get(settings.API_BASE_PREFIX + "/records/999999999", headers={"If-None-Match": "*"})
+        self.assertEqual(rsp.status_code, 404)
+
+    def test_records_changes(self, N=5, LIMIT=3):
+        """Changes feed: pages by watermark, then updated and deleted records only."""
+        url = settings.API_BASE_PREFIX + "/records/changes"
+        record_ids = self._create_records(N)
+        rsp = self.client.get(url, params={"limit": LIMIT})
+        self.assertEqual(rsp.status_code, 200)
+        data = rsp.json()
+        self.assertEqual(len(data["records"]), LIMIT)
+        self.assertTrue(data["has_more"])
+        rsp = self.client.get(url, params={"limit": LIMIT, "since": data["watermark"]})
+        data2 = rsp.json()
+        self.assertFalse(data2["has_more"])
+        self.assertEqual(sorted(r["id"] for r in data["records"] + data2["records"]), sorted(record_ids))
+        watermark = data2["watermark"]
+        data = self.client.get(url, params={"since": watermark}).json()
+        self.assertEqual((data["records"], data["watermark"]), ([], watermark))  # no changes -- same watermark
+
+        record = {"name": "patched", "start": 1577880000, "end": 1577883600}
+        self.client.patch(settings.API_BASE_PREFIX + f"/records/{record_ids[0]}", json=record)
+        self.client.delete(settings.API_BASE_PREFIX + f"/records/{record_ids[1]}")
+        data = self.client.get(url, params={"since": watermark}).json()
+        self.assertEqual(
+            [(r["id"], r["is_deleted"]) for r in data["records"]], [(record_ids[0], False), (record_ids[1], True)]
+        )
+        self.assertEqual(data["records"][0]["name"], "patched")
+        operations = [{"op": "delete", "id": record_ids[2]}]
+        rsp = self.client.post(settings.API_BASE_PREFIX + "/records/batch", json={"operations": operations})
+        self.assertEqual(rsp.status_code, 200)
+        data = self.client.get(url, params={"since": data["watermark"]}).json()
+        self.assertEqual([(r["id"], r["is_deleted"]) for r in data["records"]], [(record_ids[2], True)])
+
+    def test_records_changes_invalid(self):
+        """Changes feed: invalid watermark."""
+        rsp = self.client.get(settings.API_BASE_PREFIX + "/records/changes", params={"since": "invalid"})
+        self.assertEqual(rsp.status_code, 400)
+
+    def test_records_compression(self, N=50):
+        """Large and streamed responses are compressed (negotiated), small ones are not."""
+        record_id = self._create_records(N)[0]
+        url = settings.API_BASE_PREFIX + "/records/"
+        plain = self.client.get(url, headers={"Accept-Encoding": "identity"})
+        self.assertNotIn("content-encoding", plain.headers)
+        for encoding in ["gzip", "br"] if importlib.util.find_spec("brotli") else ["gzip"]:
+            rsp = self.client.get(url, headers={"Accept-Encoding": encoding})
+            self.assertEqual(rsp.headers["content-encoding"], encoding)
+            self.assertIn("accept-encoding", rsp.headers["vary"].lower())
+            self.assertLess(int(rsp.headers["content-length"]), len(plain.content) // 2)
+            self.assertEqual(rsp.json()["records"], plain.json()["records"])
+        rsp = self.client.get(url + f"{record_id}", headers={"Accept-Encoding": "gzip"})
+        self.assertNotIn("content-encoding", rsp.headers)
+        rsp = self.client.get(url + "export", headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(rsp.headers["content-encoding"], "gzip")
+        self.assertEqual(len(rsp.text.splitlines()), N)
+
+    def test_records_batch_too_large(self):
+        """Post too large batch."""
+        operations = [{"op": "delete", "id": 1}] * (settings.API_BATCH_SIZE_LIMIT + 1)
+        rsp = self.client.post(settings.API_BASE_PREFIX + "/records/batch", json={"operations": operations})
+        self.assertEqual(rsp.status_code, 413)
+
+    def test_records_fast_output(self, N=20):
+        """Fast path responses are the same as validated by the response models."""
+        self._create_records(N)
+        now = datetime.datetime.now().timestamp()
+        Record(name="running", start=int(now) - 600).save(self.db)
+        Record(name="future", start=int(now) + 600).save(self.db)
+        rsp = self.client.get(settings.API_BASE_PREFIX + "/records/", params={"start_min": 1})
+        self.assertEqual(rsp.status_code, 200)
+        data = rsp.json()
+        self.assertEqual(list(data), list(schemas.RecordsOutputList.model_fields))
+        self.assertEqual(data, schemas.RecordsOutputList.model_validate(data).model_dump(mode="json"))
+        self.assertEqual(list(data["records"][0]), list(schemas.RecordOutput.model_fields))
+        durations = {r["name"]: r["duration"] for r in data["records"]}
+        self.assertIsNone(durations["future"])
+        self.assertTrue(600 <= durations["running"] < 660)
+        for record in Record.all(self.db)[:3]:
+            rsp = self.client.get(settings.API_BASE_PREFIX + f"/records/{record.id}")
+            validated = schemas.RecordOutput.model_validate(record.as_dict()).model_dump(mode="json")
+            self.assertEqual(rsp.json(), validated)
+        rsp = self.client.get(settings.API_BASE_PREFIX + "/records/summary")
+        self.assertEqual(list(rsp.json()), list(schemas.RecordsSummary.model_fields))
+
+    def test_records_export(self, N=50):
+        """Export records as NDJSON and CSV streams."""
+        self._create_records(N)
+        rsp = self.client.get(settings.API_BASE_PREFIX + "/records/")
+        records = sorted(rsp.json()["records"], key=lambda r: r["start"])
+        half = N // 2
+        start_min = records[half]["start"]
+        chunk_size = settings.API_EXPORT_CHUNK_SIZE
+        settings.API_EXPORT_CHUNK_SIZE = 7
+        try:
+            rsp_ndjson = self.client.get(settings.API_BASE_PREFIX + "/records/export", params={"start_min": start_min})
+            rsp_csv = self.client.get(settings.API_BASE_PREFIX + "/records/export", params={"format": "csv"})
+        finally:
+            settings.API_EXPORT_CHUNK_SIZE = chunk_size
+        self.assertEqual(rsp_ndjson.status_code, 200)
+        self.assertTrue(rsp_ndjson.headers["content-type"].startswith("application/x-ndjson"))
+        exported = [json.loads(line) for line in rsp_ndjson.text.splitlines()]
+        self.assertEqual(exported, records[half:])
+        self.assertEqual(rsp_csv.status_code, 200)
+        self.assertTrue(rsp_csv.headers["content-type"].startswith("text/csv"))
+        exported = list(csv.DictReader(io.StringIO(rsp_csv.text)))
+        self.assertEqual([int(r["id"]) for r in exported], [r["id"] for r in records])
+        self.assertEqual([r["name"] for r in exported], [r["name"] for r in records])
+        self.assertEqual([float(r["duration"]) for r in exported], [r["duration"] for r in records])
+
+    def test_records_import(self, N=20):
+        """Import NDJSON records (body in small chunks), invalid lines are rejected."""
+        lines = [
+            json.dumps({"name": f"imported #{i:03}", "start": 1577880000 + i * 3600, "tags": "A b"}) for i in range(N)
+        ]
+        lines[3] = json.dumps({"name": "", "start": 1577880000})
+        lines[5] = "[1, 2, 3]"
+        lines[7] = '{"name": "broken'
+        body = ("\n".join(lines) + "\n").encode()
+        chunk_size = settings.API_IMPORT_CHUNK_SIZE
+        settings.API_IMPORT_CHUNK_SIZE = 3
+        try:
+            content = (body[i : i + 5] for i in range(0, len(body), 5))  # noqa: E203
+            rsp = self.client.post(settings.API_BASE_PREFIX + "/records/import", content=content)
+        finally:
+            settings.API_IMPORT_CHUNK_SIZE = chunk_size
+        self.assertEqual(rsp.status_code, 200)
+        data = rsp.json()
+        self.assertEqual((data["accepted"], data["rejected"]), (N - 3, 3))
+        self.assertEqual([e["line"] for e in data["errors"]], [4, 6, 8])
+        rsp = self.client.get(settings.API_BASE_PREFIX + "/records/", params={"tags": "a"})
+        self.assertEqual(rsp.json()["count"], N - 3)
+        self.assertEqual(rsp.json()["records"][0]["tags"], "a b")
+
+    def test_records_import_csv(self, N=10):
+        """Import exported CSV back."""
+        self._create_records(N)
+        rsp = self.client.get(settings.API_BASE_PREFIX + "/records/export", params={"format": "csv"})
+        rsp = self.client.post(
+            settings.API_BASE_PREFIX + "/records/import", params={"format": "csv"}, content=rsp.content
+        )
+        self.assertEqual(rsp.status_code, 200)
+        self.assertEqual(rsp.json(), {"accepted": N, "rejected": 0, "errors": []})
+        rsp = self.client.get(settings.API_BASE_PREFIX + "/records/")
+        self.assertEqual(rsp.json()["count"], 2 * N)
+        names = sorted(r["name"] for r in rsp.json()["records"])
+        self.assertEqual(names[::2], names[1::2])
+
+    def test_records_report_invalid_bucket(self):
+        """Get records report with unknown bucket."""
+        rsp = self.client.get(settings.API_BASE_PREFIX + "/records/report", params={"bucket": "decade"})
+        self.assertEqual(rsp.status_code, 422)
+
+    def test_records_list_cursor(self, N=50, LIMIT=7):
+        """Walk records list with cursor pagination."""
+        record_ids = self._create_records(N)
+        seen_ids, cursor = [], None
+        for _ in range(N):
+            params = {"limit": LIMIT}
+            if cursor:
+                params["cursor"] = cursor
+            rsp = self.client.get(settings.API_BASE_PREFIX + "/records/", params=params)
+            self.assertEqual(rsp.status_code, 200)
+            data = rsp.json()
+            self.assertLessEqual(len(data["records"]), LIMIT)
+            seen_ids.extend(r["id"] for r in data["records"])
+            if len(seen_ids) == LIMIT:
+                # a new record (the latest one) must not shift the next pages
+                self._create_records(1)
+            cursor = data["next_cursor"]
+            if not cursor:
+                break
+        self.assertEqual(len(seen_ids), len(set(seen_ids)))
+        self.assertEqual(sorted(seen_ids), sorted(record_ids))
+
+    def test_records_list_cursor_null_start(self, N=21, LIMIT=4):
+        """Walk records list with cursor pagination, some records have no start, some share it."""
+        record_ids = self._create_records(N)
+        for i, record_id in enumerate(record_ids):
+            record = self.db.get(Record, record_id)
+            if i % 3 == 0:
+                record.start, record.end = None, None
+            elif i % 3 == 1:
+                record.start = self.db.get(Record, record_ids[i + 1]).start
+            record.save(session=self.db)
+        rsp = self.client.get(settings.API_BASE_PREFIX + "/records/", params={"limit": N})
+        expected_ids = [r["id"] for r in rsp.json()["records"]]
+        self.assertEqual(sorted(expected_ids), sorted(record_ids))
+        no_start = N // 3
+        self.assertEqual([r["start"] for r in rsp.json()["records"]][-no_start:], [None] * no_start)
+        seen_ids, cursor = [], None
+        for _ in range(N):
+            params = {"limit": LIMIT, "cursor": cursor} if cursor else {"limit": LIMIT}
+            rsp = self.client.get(settings.API_BASE_PREFIX + "/records/", params=params)
+            self.assertEqual(rsp.status_code, 200)
+            seen_ids.extend(r["id"] for r in rsp.json()["records"])
+            cursor = rsp.json()["next_cursor"]
+            if not cursor:
+                break
+        self.assertEqual(seen_ids, expected_ids)
+
+    def test_records_list_cursor_invalid(self):
+        """Get records list with a broken cursor."""
+        rsp = self.client.get(settings.API_BASE_PREFIX + "/records/", params={"cursor": "not-a-cursor"})
+        self.assertEqual(rsp.status_code, 400)
+
+    def test_records_list_offset(self, N=20, LIMIT=5):
+        """Walk records list with offset pagination (old clients)."""
+        record_ids = self._create_records(N)
+        seen_ids = []
+        for offset in range(0, N, LIMIT):
+            rsp = self.client.get(settings.API_BASE_PREFIX + "/records/", params={"limit": LIMIT, "offset": offset})
+            self.assertEqual(rsp.status_code, 200)
+            seen_ids.extend(r["id"] for r in rsp.json()["records"])
+        self.assertEqual(seen_ids, record_ids)
+
     def test_record_post(self, N=10):
         """Post new valid records."""
         records = [
@@ -87,6 +999,84 @@ class TestAPIRecords(DataBaseTestMixin, unittest.TestCase):
         data = rspx.json()
         self.assertEqual(data["count"], len(records))
 
+    def test_record_post_users_cache(self, N=5):
+        """Known users are cached: the same user for every request, a new one after invalidation."""
+        record = {"name": "new record", "start": 1577880000, "end": 1577883600}
+        headers = {settings.AUTH_USERS_ALLOW_XFORWARDED_HEADER: "cached"}
+        hits = users_cache.hits
+        user_ids = set()
+        for _ in range(N):
+            rsp = self.client.post(settings.API_BASE_PREFIX + "/records/", json=record, headers=headers)
+            self.assertEqual(rsp.status_code, 201, rsp.text)
+            user_ids.add(rsp.json()["user_id"])
+        self.assertEqual(len(user_ids), 1)
+        self.assertEqual(users_cache.hits - hits, N - 1)
+        rsp = self.client.get(settings.API_BASE_PREFIX + "/records/", headers=headers)
+        self.assertEqual(rsp.json()["count"], N)
+        self.assertEqual(rsp.json()["user"]["name"], "cached")
+        self.assertEqual(rsp.json()["user"]["id"], user_ids.pop())
+        users_cache.invalidate("cached")
+        misses = users_cache.misses
+        rsp = self.client.get(settings.API_BASE_PREFIX + "/records/", headers=headers)
+        self.assertEqual(rsp.json()["count"], N)
+        self.assertEqual(users_cache.misses - misses, 1)
+
+    def test_record_events(self):
+        """Record writes are pushed to the user's subscribers."""
+        record = {"name": "pushed", "start": 1577880000, "end": 1577883600}
+
+        async def check():
+            subscription = events.broadcaster.subscribe(None)
+            try:
+                rsp = await asyncio.to_thread(self.client.post, settings.API_BASE_PREFIX + "/records/", json=record)
+                url = settings.API_BASE_PREFIX + f"/records/{rsp.json()['id']}"
+                await asyncio.to_thread(self.client.patch, url, json={**record, "name": "patched"})
+                await asyncio.to_thread(self.client.delete, url)
+                for op, name in [("create", "pushed"), ("update", "patched"), ("delete", "patched")]:
+                    event = await subscription.get(timeout=1)
+                    self.assertEqual((event["op"], event["record"]["name"]), (op, name))
+                    self.assertEqual(event["record"]["id"], rsp.json()["id"])
+            finally:
+                events.broadcaster.unsubscribe(subscription)
+
+        asyncio.run(check())
+
+    def test_records_batch_import_events(self):
+        """Batch writes push an event per changed record (resync if many), imports push resync."""
+        record = {"name": "pushed", "start": 1577880000, "end": 1577883600}
+        record_ids = self._create_records(2)
+        batch_url = settings.API_BASE_PREFIX + "/records/batch"
+        operations = [
+            {"op": "create", "data": record},
+            {"op": "patch", "id": record_ids[0], "data": {**record, "name": "patched"}},
+            {"op": "delete", "id": record_ids[1]},
+            {"op": "delete", "id": 999999999},
+        ]
+
+        async def check():
+            subscription = events.broadcaster.subscribe(None)
+            try:
+                rsp = await asyncio.to_thread(self.client.post, batch_url, json={"operations": operations})
+                new_id = rsp.json()["results"][0]["record"]["id"]
+                received = [await subscription.get(timeout=1) for _ in range(3)]
+                self.assertEqual(
+                    sorted((event["op"], event["record"]["id"]) for event in received),
+                    sorted([("create", new_id), ("update", record_ids[0]), ("delete", record_ids[1])]),
+                )
+                self.assertIsNone(await subscription.get(timeout=0.01))
+                with mock.patch.object(settings, "API_EVENTS_BATCH_LIMIT", 2):
+                    await asyncio.to_thread(self.client.post, batch_url, json={"operations": operations[:3]})
+                self.assertEqual(await subscription.get(timeout=1), {"op": "resync"})
+                self.assertIsNone(await subscription.get(timeout=0.01))
+                lines = json.dumps(record) + "\n"
+                url = settings.API_BASE_PREFIX + "/records/import"
+                await asyncio.to_thread(self.client.post, url, params={"format": "ndjson"}, content=lines)
+                self.assertEqual(await subscription.get(timeout=1), {"op": "resync"})
+            finally:
+                events.broadcaster.unsubscribe(subscription)
+
+        asyncio.run(check())
+
     def test_record_post_invalid_times(self):
         """Post invalid record (end<start)."""
         record = {"name": "end<start", "start": 1577880000, "end": 1577872800}
@@ -144,3 +1134,25 @@ class TestAPIRecords(DataBaseTestMixin, unittest.TestCase):
             record.save(session=self.db)
             ids.append(record.id)
         return ids
+
+
+@unittest.skipUnless(importlib.util.find_spec("aiosqlite"), "aiosqlite is not installed")
+class TestAPIRecordsAsync(TestAPIRecords):
+    """Test Records API -- async stack (the same tests)."""
+
+    @classmethod
+    def setUpClass(cls):
+        """Async app, AsyncSession on the same database (no pool: every test request runs in a new event loop)."""
+        super().setUpClass()
+        url = make_url(settings.DATABASE_URL).set(drivername="sqlite+aiosqlite")
+        engine = create_async_engine(url, poolclass=NullPool)
+        sessionmaker = async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
+
+        async def db_session_async():
+            async with sessionmaker() as db:
+                yield db
+
+        app_async = create_app(use_async=True)
+        app_async.dependency_overrides[db_session_async_dependency] = db_session_async
+        app_async.dependency_overrides[replica.db_session_readonly_async] = db_session_async
+        cls.client = TestClient(app_async)
@@ -1,9 +1,25 @@
 """Database models tests."""
 
+import asyncio
 import datetime
+import importlib.util
+import os
+import tempfile
+import threading
+import time
 import unittest
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from unittest import mock
 
-from tmtrkr.models import Record, User
+from sqlalchemy import exc, text
+from sqlalchemy.engine import make_url
+
+import tmtrkr.models
+from tmtrkr.api.records import RecordsQueryParams, encode_cursor
+from tmtrkr.misc.demodb import create_demo_database
+from tmtrkr.models import Base, Record, RecordDailyRollup, RecordTag, Tag, User
+from tmtrkr.models.db import RoutingSession, create_sqlite_engines
 
 from .base import DataBaseTestMixin
 
@@ -18,6 +34,20 @@ class TestUsers(DataBaseTestMixin, unittest.TestCase):
         self.assertTrue(user.id > 0)
         self.assertEqual(user.name, "username")
 
+    def test_get_or_create_concurrent(self, N=8):
+        """Concurrent first logins get the same user (unique name)."""
+        barrier = threading.Barrier(N)
+
+        def login(_):
+            with closing(tmtrkr.models.Session()) as db:
+                barrier.wait()
+                return User.get_or_create(db, name="username").id
+
+        with ThreadPoolExecutor(N) as pool:
+            user_ids = set(pool.map(login, range(N)))
+        self.assertEqual(len(user_ids), 1)
+        self.assertEqual(User.query(self.db, name="username").count(), 1)
+
 
 class TestRecords(DataBaseTestMixin, unittest.TestCase):
     """Test Record database model."""
@@ -35,6 +65,462 @@ class TestRecords(DataBaseTestMixin, unittest.TestCase):
         self.assertEqual(record.user.name, "username")
         self.assertEqual(record.duration, (end - start).total_seconds())
 
+    def test_records_summary(self):
+        """Aggregate records durations (finished, running, future)."""
+        now = datetime.datetime.now()
+        hour = datetime.timedelta(hours=1)
+        records = [
+            Record(name="finished", start=(now - 4 * hour).timestamp(), end=(now - 2 * hour).timestamp()),
+            Record(name="running", start=(now - 1 * hour).timestamp()),
+            Record(name="future", start=(now + 1 * hour).timestamp()),
+        ]
+        for record in records:
+            record.save(session=self.db)
+        summary = Record.summary(Record.query(self.db), now=now.timestamp())
+        self.assertEqual(summary["count"], 3)
+        self.assertAlmostEqual(summary["duration"], (3 * hour).total_seconds(), delta=1)
+        self.assertEqual(summary["start_min"], records[0].start)
+        self.assertEqual(summary["start_max"], records[2].start)
+        self.assertEqual(summary["end_min"], records[0].end)
+        self.assertEqual(summary["end_max"], records[0].end)
+
+
+class TestTags(DataBaseTestMixin, unittest.TestCase):
+    """Test normalized tags (record_tag relations)."""
+
+    def record_tags(self, record):
+        """Get record tag names from the relations table."""
+        queryset = RecordTag.query(self.db, record_id=record.id).join(Tag, Tag.id == RecordTag.tag_id)
+        return sorted(name for (name,) in queryset.with_entities(Tag.name))
+
+    def test_tags_sync(self):
+        """Relations follow the record tags line."""
+        record = Record(name="record", start=1577880000, tags="work meet")
+        record.save(self.db)
+        other = Record(name="other", start=1577880000, tags="work")
+        other.save(self.db)
+        self.assertEqual(self.record_tags(record), ["meet", "work"])
+        record.tags = "meet home  home"
+        record.save(self.db)
+        self.assertEqual(self.record_tags(record), ["home", "meet"])
+        self.assertEqual(self.record_tags(other), ["work"])
+        record.tags = None
+        record.save(self.db)
+        self.assertEqual(self.record_tags(record), [])
+        self.db.delete(other)
+        self.db.commit()
+        self.assertEqual(RecordTag.all(self.db), [])
+        self.assertEqual(sorted(t.name for t in Tag.all(self.db)), ["home", "meet", "work"])
+
+    def test_tags_filter(self):
+        """Filter records by any and all of the tags."""
+        for i, tags in enumerate(["a", "a b", "b c", None, "abc"]):
+            Record(name=f"record #{i}", start=1577880000 + i, tags=tags).save(self.db)
+
+        def names(tags, match_all=False):
+            queryset = Tag.filter_records(Record.query(self.db), tags, match_all=match_all)
+            return sorted(r.name for r in queryset)
+
+        self.assertEqual(names(["a"]), ["record #0", "record #1"])
+        self.assertEqual(names(["a", "c"]), ["record #0", "record #1", "record #2"])
+        self.assertEqual(names(["a", "b"], match_all=True), ["record #1"])
+        self.assertEqual(names(["a", "x"], match_all=True), [])
+
+
+class TestRecordDailyRollups(DataBaseTestMixin, unittest.TestCase):
+    """Test records daily rollups."""
+
+    DAY = 24 * 60 * 60
+    MONDAY = 1704067200  # 2024-01-01 00:00:00 UTC
+
+    def rollups(self):
+        """Get all rollups as {(user_id, day, tag): (count, duration)}."""
+        return {(r.user_id, r.day, r.tag): (r.count, r.duration) for r in RecordDailyRollup.all(self.db)}
+
+    def test_rollups_start_day(self):
+        """Record count and whole duration go to the day it starts (as in `Record.summary`)."""
+        user = User(name="username")
+        user.save(session=self.db)
+        start = self.MONDAY + self.DAY - 3600
+        Record(user=user, name="night", start=start, end=start + 2 * self.DAY, tags="sleep").save(self.db)
+        self.assertEqual(
+            self.rollups(),
+            {
+                (user.id, self.MONDAY, "*"): (1, 2 * self.DAY),
+                (user.id, self.MONDAY, "sleep"): (1, 2 * self.DAY),
+            },
+        )
+
+    def test_rollups_update_delete(self):
+        """Rollups follow records updates and (soft) deletes."""
+        record = Record(name="record", start=self.MONDAY, end=self.MONDAY + 600)
+        record.save(self.db)
+        running = Record(name="running", start=self.MONDAY)
+        running.save(self.db)
+        self.assertEqual(self.rollups(), {(0, self.MONDAY, "*"): (1, 600), (0, self.MONDAY, ""): (1, 600)})
+        record.tags = "a b"
+        record.end = self.MONDAY + 1200
+        record.save(self.db)
+        self.assertEqual(
+            self.rollups(),
+            {
+                (0, self.MONDAY, "*"): (1, 1200),
+                (0, self.MONDAY, "a"): (1, 1200),
+                (0, self.MONDAY, "b"): (1, 1200),
+            },
+        )
+        running.end = self.MONDAY + 60
+        running.save(self.db)
+        record.is_deleted = True
+        record.save(self.db)
+        self.assertEqual(self.rollups(), {(0, self.MONDAY, "*"): (1, 60), (0, self.MONDAY, ""): (1, 60)})
+        rollup = RecordDailyRollup.first(self.db, tag="*")
+        self.assertEqual((rollup.start_min, rollup.end_max), (self.MONDAY, self.MONDAY + 60))
+        self.db.delete(running)
+        self.db.commit()
+        self.assertEqual(self.rollups(), {})
+
+    def test_rollups_concurrent_updates(self):
+        """Concurrent updates of a record wait for each other, rollups stay the same as rebuilt ones."""
+        record = Record(name="record", start=self.MONDAY, end=self.MONDAY + 1000)
+        record.save(self.db)
+        with closing(tmtrkr.models.Session()) as first, closing(tmtrkr.models.Session()) as second:
+            first.get(Record, record.id).end = self.MONDAY + 3000
+            first.flush()  # the record is written, not committed
+
+            def update():
+                second.get(Record, record.id).end = self.MONDAY + 5000
+                second.commit()
+
+            thread = threading.Thread(target=update)
+            thread.start()
+            time.sleep(0.2)  # the second update reads the record, waits for the first one
+            first.commit()
+            thread.join()
+        rollups = self.rollups()
+        self.assertEqual(rollups[(0, self.MONDAY, "*")], (1, 5000))
+        RecordDailyRollup.rebuild(self.db)
+        self.assertEqual(self.rollups(), rollups)
+
+    def test_rollups_rebuild(self, N=100):
+        """Rebuilt rollups are the same as incrementally updated ones."""
+        users = [User(name=f"user{i}") for i in range(3)] + [None]
+        for user in users[:-1]:
+            user.save(session=self.db)
+        records = []
+        for i in range(N):
+            start = self.MONDAY + i * 12345
+            record = Record(user=users[i % 4], name=f"record #{i}", start=start, end=start + i * 600, tags=f"t{i % 3}")
+            record.save(self.db)
+            records.append(record)
+        for record in records[::7]:
+            record.is_deleted = True
+            record.save(self.db)
+        rollups = self.rollups()
+        self.assertEqual(RecordDailyRollup.rebuild(self.db), N)
+        self.assertEqual(self.rollups(), rollups)
+        summary = RecordDailyRollup.summary(self.db, users[0].id)
+        self.assertEqual(summary, Record.summary(Record.query(self.db, user=users[0], is_deleted=False)))
+
+
+class TestRecordChangeCounter(DataBaseTestMixin, unittest.TestCase):
+    """Test records change numbers."""
+
+    def change_ids(self):
+        """Get {record id: change id} of all the records."""
+        self.db.expire_all()
+        return {record.id: record.change_id for record in Record.all(self.db)}
+
+    def test_change_ids(self):
+        """Every write of a record gets the next number of its user (ORM and bulk writes)."""
+        user = User(name="username")
+        user.save(session=self.db)
+        records = [Record(name="a", user=user), Record(name="b", user=user), Record(name="guest")]
+        self.db.add_all(records)
+        self.db.commit()
+        self.assertEqual(self.change_ids(), {records[0].id: 1, records[1].id: 2, records[2].id: 1})
+        records[0].name = "updated"
+        records[0].save(self.db)
+        records[1].save(self.db)  # not modified
+        self.assertEqual(self.change_ids()[records[0].id], 3)
+        ids = tmtrkr.models.bulk.insert_records(self.db, [{"name": "c", "user_id": user.id}, {"name": "d"}])
+        old = tmtrkr.models.bulk.read_snapshots(Record.query(self.db), [records[1].id])
+        tmtrkr.models.bulk.update_records(self.db, [{"id": records[1].id, "is_deleted": True}], old)
+        self.db.commit()
+        self.assertEqual(
+            self.change_ids(), {records[0].id: 3, records[1].id: 5, records[2].id: 1, ids[0]: 4, ids[1]: 2}
+        )
+        RecordChangeCounter = tmtrkr.models.RecordChangeCounter
+        counters = {counter.user_id: counter.value for counter in RecordChangeCounter.all(self.db)}
+        self.assertEqual(counters, {user.id: 5, RecordChangeCounter.NO_USER_ID: 2})
+
+    def test_rollback(self):
+        """Rolled back writes roll the counter back too (their numbers were never visible)."""
+        record = Record(name="a")
+        record.save(self.db)
+        record.name = "b"
+        self.db.flush()
+        self.db.rollback()
+        record.name = "c"
+        record.save(self.db)
+        self.assertEqual(self.change_ids(), {record.id: 2})
+
+
+class TestDemoDatabase(DataBaseTestMixin, unittest.TestCase):
+    """Test demo database generator."""
+
+    def check_demo_database(self, n_users, n_records, **kwargs):
+        """Generate, check records, tags and rollups."""
+        today = datetime.date(2024, 1, 1)
+        n = create_demo_database(n_users=n_users, n_records=n_records, seed=42, today=today, **kwargs)
+        self.assertEqual(n, n_records)
+        self.assertEqual(User.query(self.db).count(), n_users)
+        self.assertEqual(Record.query(self.db).count(), n_records)
+        self.assertTrue(RecordTag.query(self.db).count() > 0)
+        for record in Record.all(self.db):
+            self.assertTrue(record.start < record.end)
+            self.assertTrue(record.end < datetime.datetime(2024, 1, 2, tzinfo=datetime.timezone.utc).timestamp())
+        rollups = {(r.user_id, r.day, r.tag): (r.count, r.duration) for r in RecordDailyRollup.all(self.db)}
+        RecordDailyRollup.rebuild(self.db)
+        self.assertEqual(
+            {(r.user_id, r.day, r.tag): (r.count, r.duration) for r in RecordDailyRollup.all(self.db)}, rollups
+        )
+
+    def test_demodb(self):
+        """Generate demo database in one process."""
+        self.check_demo_database(5, 1000, years=0.5, chunk_size=100)
+
+    def test_demodb_processes(self):
+        """Generate demo database in several processes."""
+        self.check_demo_database(5, 1000, years=2, processes=3)
+
+
+class TestRecordsQueryPlan(DataBaseTestMixin, unittest.TestCase):
+    """Test records list query uses the (user_id, is_deleted, start, id) index."""
+
+    INDEX_NAME = "ix_record_user_id_is_deleted_start_id"
+
+    def explain(self, queryset):
+        """Get query plan for the queryset (SQLite or PostgreSQL)."""
+        dialect = self.db.get_bind().dialect
+        sql = str(queryset.statement.compile(dialect=dialect, compile_kwargs={"literal_binds": True}))
+        if dialect.name == "sqlite":
+            rows = self.db.execute(text("EXPLAIN QUERY PLAN " + sql)).all()
+            return "\n".join(str(row[-1]) for row in rows)
+        if dialect.name == "postgresql":
+            self.db.execute(text("SET LOCAL enable_seqscan = off"))
+            rows = self.db.execute(text("EXPLAIN " + sql)).all()
+            return "\n".join(str(row[0]) for row in rows)
+        self.skipTest(f"no query plan check for {dialect.name}")
+
+    def assert_uses_index(self, queryset):
+        """Check the plan: index is used, no extra sorting."""
+        plan = self.explain(queryset)
+        self.assertIn(self.INDEX_NAME, plan, plan)
+        self.assertNotIn("TEMP B-TREE", plan, plan)
+        self.assertNotRegex(plan, r"(?m)^\s*(->\s*)?Sort", plan)
+
+    def test_records_list_plan(self):
+        """Records list (default filters) is an index scan."""
+        user = User(name="username")
+        user.save(session=self.db)
+        params = RecordsQueryParams()
+        self.assert_uses_index(params.apply(Record.query(self.db, user=user)))
+
+    def test_records_list_range_plan(self):
+        """Records list with a start range is an index range scan."""
+        user = User(name="username")
+        user.save(session=self.db)
+        params = RecordsQueryParams(start_min=1577880000, start_max=1580551200, offset=10, limit=10)
+        self.assert_uses_index(params.apply(Record.query(self.db, user=user)))
+
+    def test_records_list_cursor_plan(self):
+        """Records list page after a cursor is an index seek."""
+        user = User(name="username")
+        user.save(session=self.db)
+        params = RecordsQueryParams(start_min=1577880000, cursor=encode_cursor(1580551200, 42), limit=10)
+        self.assert_uses_index(params.apply(Record.query(self.db, user=user)))
+
+    def test_records_list_tags_plan(self):
+        """Records list filtered by a tag reads record_tag by the tag index."""
+        params = RecordsQueryParams(tags="work")
+        plan = self.explain(params.apply(Record.query(self.db, user=None)))
+        self.assertIn("ix_record_tag_tag_id_record_id", plan, plan)
+
+    def test_records_list_search_plan(self):
+        """Records list search reads the full-text index."""
+        params = RecordsQueryParams(q="meeting")
+        plan = self.explain(params.apply(Record.query(self.db, user=None)))
+        self.assertRegex(plan, "record_fts|ix_record_search_vector", plan)
+
+    def test_running_records_plan(self):
+        """Running records (not in the rollups) are read by the partial index."""
+        queryset = RecordDailyRollup.running_records(self.db, 1, start_min=1577880000)
+        self.assertIn("ix_record_user_id_running", self.explain(queryset))
+
+    def test_records_changes_plan(self):
+        """Records changes feed is an index range scan by the user's change numbers."""
+        queryset = Record.query(self.db, user=None).filter(Record.change_id > 42).order_by(Record.change_id)
+        plan = self.explain(queryset)
+        self.assertIn("ix_record_user_id_change_id", plan, plan)
+        self.assertNotIn("TEMP B-TREE", plan, plan)
+
+    def test_records_list_no_user_plan(self):
+        """Records list for a guest (user_id IS NULL) is an index scan."""
+        params = RecordsQueryParams(start_min=1577880000)
+        self.assert_uses_index(params.apply(Record.query(self.db, user=None)))
+
+
+class TestPoolOptions(unittest.TestCase):
+    """Test connection pool settings."""
+
+    def test_pool_options(self):
+        """Queue pools get all the settings, others -- the common ones only."""
+        options = tmtrkr.models.db.pool_options(make_url("postgresql+psycopg2://user@localhost/tmtrkr"))
+        self.assertEqual(
+            set(options), {"pool_size", "max_overflow", "pool_timeout", "pool_recycle", "pool_pre_ping"}, options
+        )
+        self.assertEqual(set(tmtrkr.models.db.pool_options(make_url("sqlite://"))), {"pool_recycle", "pool_pre_ping"})
+
+
+class TestSQLiteMode(unittest.TestCase):
+    """Test SQLite production mode: WAL, single writer, read-only readers."""
+
+    def setUp(self):
+        """Create the engines of a temporary database file."""
+        self.directory = tempfile.TemporaryDirectory()
+        self.writer, self.reader = create_sqlite_engines("sqlite:///" + os.path.join(self.directory.name, "db.sqlite"))
+        Base.metadata.create_all(self.writer)
+        self.db = RoutingSession(bind=self.writer, reader=self.reader, autoflush=False)
+
+    def tearDown(self):
+        """."""
+        self.db.close()
+        self.writer.dispose()
+        self.reader.dispose()
+        self.directory.cleanup()
+
+    def rollups(self):
+        """Get all rollups as {(user_id, day, tag): (count, duration)}."""
+        return {(r.user_id, r.day, r.tag): (r.count, r.duration) for r in RecordDailyRollup.all(self.db)}
+
+    def test_pragmas(self):
+        """WAL journal and the pragmas are set on connect."""
+        for engine in (self.writer, self.reader):
+            with engine.connect() as connection:
+                self.assertEqual(connection.exec_driver_sql("PRAGMA journal_mode").scalar(), "wal")
+                self.assertEqual(connection.exec_driver_sql("PRAGMA synchronous").scalar(), 1)  # NORMAL
+                self.assertEqual(connection.exec_driver_sql("PRAGMA busy_timeout").scalar(), 5000)
+        self.assertEqual(self.writer.pool.size(), 1)
+
+    def test_reader_read_only(self):
+        """Reader connections cannot write."""
+        with self.reader.connect() as connection, self.assertRaises(exc.OperationalError):
+            connection.execute(User.__table__.insert().values(name="username"))
+
+    def test_routing(self):
+        """Reads go to the reader, writes and reads of a writing transaction go to the writer."""
+        self.assertIs(self.db.get_bind(clause=User.__table__.select()), self.reader)
+        User(name="username").save(session=self.db)
+        self.assertIs(self.db.get_bind(clause=User.__table__.select()), self.reader)  # committed
+        user = User.first(self.db, name="username")
+        user.name = "renamed"
+        self.db.flush()
+        self.assertIs(self.db.get_bind(clause=User.__table__.select()), self.writer)
+        self.assertEqual(self.db.scalars(User.__table__.select().with_only_columns(User.name)).one(), "renamed")
+        self.db.rollback()
+        self.assertIs(self.db.get_bind(clause=User.__table__.select()), self.reader)
+        self.assertEqual(User.first(self.db, name="username").id, user.id)
+
+    def test_routing_flush(self):
+        """Flush listeners (rollups snapshots of the changed records) read through the writer."""
+        record = Record(name="record", start=0, end=60)
+        record.save(self.db)
+        record.end = 120
+        writing = []
+        read_snapshots = RecordDailyRollup.read_snapshots
+
+        def read(queryset, ids):
+            writing.append(queryset.session.writing)
+            return read_snapshots(queryset, ids)
+
+        with mock.patch.object(RecordDailyRollup, "read_snapshots", read):
+            record.save(self.db)
+        self.assertEqual(writing, [True])
+
+    def test_concurrent_writes_rollups(self):
+        """Interleaved updates of a record (writer waits for writer), rollups stay the same as rebuilt ones."""
+        record = Record(name="record", start=0, end=1000)
+        record.save(self.db)
+        with closing(RoutingSession(bind=self.writer, reader=self.reader)) as first:
+            first.get(Record, record.id).end = 3000
+            first.flush()  # the writer connection is taken till the commit
+
+            def update():
+                with closing(RoutingSession(bind=self.writer, reader=self.reader)) as second:
+                    second.get(Record, record.id).end = 5000
+                    second.commit()
+
+            thread = threading.Thread(target=update)
+            thread.start()
+            time.sleep(0.2)  # the second update reads the record, waits for the writer
+            first.commit()
+            thread.join()
+        rollups = self.rollups()
+        self.assertEqual(rollups[(0, 0, "*")], (1, 5000))
+        RecordDailyRollup.rebuild(self.db)
+        self.db.expire_all()
+        self.assertEqual(self.rollups(), rollups)
+
+    def test_concurrent_reads(self, N=4):
+        """Readers are not limited by the pool size, nor blocked by a writing transaction."""
+        User(name="username").save(session=self.db)
+        writer = RoutingSession(bind=self.writer, reader=self.reader)
+        writer.add(User(name="other"))
+        writer.flush()  # the write lock is held
+        barrier = threading.Barrier(N)
+
+        def read(_):
+            with closing(RoutingSession(bind=self.writer, reader=self.reader)) as db:
+                count = db.query(User).count()
+                barrier.wait(timeout=5)  # all the readers have their connections at once
+                return count
+
+        with ThreadPoolExecutor(N) as pool:
+            self.assertEqual(list(pool.map(read, range(N))), [1] * N)
+        writer.commit()
+        writer.close()
+        self.assertEqual(self.db.query(User).count(), 2)
+
+    @unittest.skipUnless(importlib.util.find_spec("aiosqlite"), "aiosqlite is not installed")
+    def test_async_engines(self, N=8):
+        """Async engines: single connection writer (concurrent writes wait in its pool), read-only readers."""
+        from sqlalchemy.ext.asyncio import async_sessionmaker
+
+        writer, reader = create_sqlite_engines("sqlite+aiosqlite:///" + os.path.join(self.directory.name, "db.sqlite"))
+        sessions = async_sessionmaker(writer, sync_session_class=RoutingSession, reader=reader.sync_engine)
+
+        async def write(i):
+            async with sessions() as db:
+                db.add(User(name=f"user{i}"))
+                await db.commit()
+
+        async def check():
+            try:
+                await asyncio.gather(*(write(i) for i in range(N)))
+                self.assertEqual((writer.sync_engine.pool.size(), writer.sync_engine.pool.checkedout()), (1, 0))
+                async with sessions() as db:
+                    self.assertIs(db.sync_session.get_bind(clause=User.__table__.select()), reader.sync_engine)
+                    self.assertEqual(len((await db.scalars(User.aquery())).all()), N)
+                    with self.assertRaises(exc.OperationalError):
+                        async with reader.connect() as connection:
+                            await connection.execute(User.__table__.insert().values(name="username"))
+            finally:
+                await writer.dispose()
+                await reader.dispose()
+
+        asyncio.run(check())
+
 
 if __name__ == "__main__":
     unittest.main()
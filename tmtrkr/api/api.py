@@ -3,12 +3,40 @@
 import fastapi
 from starlette.middleware.sessions import SessionMiddleware
 
+from tmtrkr import models
 from tmtrkr.settings import API_BASE_PREFIX, SECRET_KEY
 
-from .records import api as records_api
-from .users import api as users_api
+from . import records, records_async, users
+from .compression import CompressionMiddleware
+from .replica import ReadYourWritesMiddleware
 
-app = fastapi.FastAPI()
-app.include_router(records_api, prefix=API_BASE_PREFIX + "/records")
-app.include_router(users_api, prefix=API_BASE_PREFIX + "/users")
-app.add_middleware(SessionMiddleware, secret_key=SECRET_KEY)
+
+class OAuth2SessionMiddleware(SessionMiddleware):
+    """Session (signed cookie) for the OAuth2 login routes only, the rest of the API does not need it."""
+
+    def __init__(self, app, path_prefix: str, **kwargs):
+        """."""
+        super().__init__(app, **kwargs)
+        self.path_prefix = path_prefix
+
+    async def __call__(self, scope, receive, send):
+        """."""
+        if scope["type"] in ("http", "websocket") and scope["path"].startswith(self.path_prefix):
+            await super().__call__(scope, receive, send)
+        else:
+            await self.app(scope, receive, send)
+
+
+def create_app(use_async: bool = False) -> fastapi.FastAPI:
+    """Create the application, with async (AsyncSession) or sync database routes."""
+    app = fastapi.FastAPI()
+    app.include_router(records_async.api if use_async else records.api, prefix=API_BASE_PREFIX + "/records")
+    app.include_router(users.api_async if use_async else users.api, prefix=API_BASE_PREFIX + "/users")
+    app.add_middleware(CompressionMiddleware)
+    if models.db.has_replica():
+        app.add_middleware(ReadYourWritesMiddleware)
+    app.add_middleware(OAuth2SessionMiddleware, path_prefix=API_BASE_PREFIX + "/users/oauth2-", secret_key=SECRET_KEY)
+    return app
+
+
+app = create_app(use_async=models.db.is_async())
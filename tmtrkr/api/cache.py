@@ -0,0 +1,68 @@
+"""In-process caches."""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+__all__ = ["TTLCache"]
+
+
+class TTLCache:
+    """
+    Bounded LRU cache with expiring entries, thread-safe.
+
+    Least recently used entries are evicted when `maxsize` is reached,
+    expired entries are dropped on read. `maxsize=0` disables the cache.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, timer: Callable[[], float] = time.monotonic):
+        """."""
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.timer = timer
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()  # key: (expire, value)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        """."""
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Get value, count hit or miss."""
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and item[0] <= self.timer():
+                del self._data[key]
+                item = None
+            if item is None:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """Set value, expires after `ttl` seconds (default is the cache one)."""
+        if self.maxsize <= 0:
+            return
+        expire = self.timer() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expire, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, *keys: Hashable):
+        """Drop entries by keys, all entries if no keys are passed."""
+        with self._lock:
+            if not keys:
+                self._data.clear()
+            for key in keys:
+                self._data.pop(key, None)
+
+    def stats(self) -> dict:
+        """Cache counters."""
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._data), "maxsize": self.maxsize}
@@ -0,0 +1,142 @@
+"""
+API responses compression (gzip, brotli) negotiated by `Accept-Encoding`.
+
+Whole responses smaller than the minimum size are sent as is, streamed
+ones (export, events) are compressed chunk by chunk, every chunk is
+flushed -- lines and events are not held in the compressor.
+"""
+
+import zlib
+from typing import Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from tmtrkr import settings
+
+try:
+    import brotli
+except ImportError:  # optional, see requirements-speedups.txt
+    brotli = None
+
+__all__ = ["CompressionMiddleware", "accepted_encodings", "compressor"]
+
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/")
+
+
+def accepted_encodings(accept_encoding: str) -> set:
+    """Parse `Accept-Encoding` header, get content encodings with non-zero quality."""
+    encodings = set()
+    for item in accept_encoding.split(","):
+        encoding, _, params = item.strip().partition(";")
+        quality = params.strip().removeprefix("q=")
+        try:
+            if encoding and (not params or float(quality) > 0):
+                encodings.add(encoding.strip().lower())
+        except ValueError:
+            pass
+    return encodings
+
+
+class _GzipCompressor:
+    def __init__(self, level: int):
+        self.compressobj = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)  # gzip container
+
+    def compress(self, data: bytes, final: bool = True) -> bytes:
+        return self.compressobj.compress(data) + self.compressobj.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+
+class _BrotliCompressor:
+    def __init__(self, quality: int):
+        self.compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes, final: bool = True) -> bytes:
+        data = self.compressor.process(data)
+        return data + (self.compressor.finish() if final else self.compressor.flush())
+
+
+def compressor(encoding: str, level: Optional[int] = None):
+    """Create compressor (`compress(data, final)`) of the content encoding, default levels are the settings."""
+    if encoding == "br":
+        return _BrotliCompressor(settings.API_COMPRESSION_BROTLI_QUALITY if level is None else level)
+    return _GzipCompressor(settings.API_COMPRESSION_GZIP_LEVEL if level is None else level)
+
+
+class CompressionMiddleware:
+    """Compress responses of the compressible types (see the module docs)."""
+
+    def __init__(self, app: ASGIApp, encodings=None, minimum_size: Optional[int] = None):
+        """Encodings are in the order of preference (brotli is skipped if not installed)."""
+        self.app = app
+        encodings = settings.API_COMPRESSION_ENCODINGS if encodings is None else encodings
+        self.encodings = [e for e in encodings if e != "br" or brotli is not None]
+        self.minimum_size = settings.API_COMPRESSION_MIN_SIZE if minimum_size is None else minimum_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """."""
+        if scope["type"] == "http" and self.encodings:
+            accepted = accepted_encodings(Headers(scope=scope).get("accept-encoding", ""))
+            encoding = next((e for e in self.encodings if e in accepted), None)
+            if encoding is not None:
+                await CompressionResponder(self.app, encoding, self.minimum_size)(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+
+class CompressionResponder:
+    """Compress one response (compressible type, whole one of the minimum size or streamed)."""
+
+    def __init__(self, app: ASGIApp, encoding: str, minimum_size: int):
+        """."""
+        self.app = app
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.send = None
+        self.start = None  # response start message, delayed till the first body one
+        self.compressor = None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """."""
+        self.send = send
+        await self.app(scope, receive, self.send_compressed)
+
+    def is_compressible(self, headers: Headers, body: bytes, more_body: bool) -> bool:
+        """."""
+        return (
+            "content-encoding" not in headers
+            and "content-range" not in headers
+            and headers.get("content-type", "").startswith(COMPRESSIBLE_TYPES)
+            and (more_body or len(body) >= self.minimum_size)
+        )
+
+    async def send_compressed(self, message: Message):
+        """Send wrapper: compress the body messages."""
+        if message["type"] == "http.response.start":
+            self.start = message
+            return
+        if message["type"] != "http.response.body":  # e.g. `pathsend` extension
+            if self.start is not None:
+                start, self.start = self.start, None
+                await self.send(start)
+            await self.send(message)
+            return
+        body, more_body = message.get("body", b""), message.get("more_body", False)
+        if self.start is not None:
+            start, self.start = self.start, None
+            headers = MutableHeaders(raw=start["headers"])
+            if self.is_compressible(headers, body, more_body):
+                self.compressor = compressor(self.encoding)
+                headers["content-encoding"] = self.encoding
+                headers.add_vary_header("accept-encoding")
+                del headers["content-length"]
+                if not more_body:
+                    body = self.compressor.compress(body)
+                    headers["content-length"] = str(len(body))
+                    await self.send(start)
+                    await self.send({"type": "http.response.body", "body": body})
+                    return
+            await self.send(start)
+        if self.compressor is not None:
+            body = self.compressor.compress(body, final=not more_body)
+            message = {"type": "http.response.body", "body": body, "more_body": more_body}
+        await self.send(message)
@@ -0,0 +1,253 @@
+"""
+Records change events -- per user push channel (Server-Sent Events).
+
+Writes publish lightweight events to the pub/sub, every worker (broadcaster)
+delivers them to its subscribers of the user. `LocalPubSub` is in-process,
+`UnixSocketPubSub` is shared by the worker processes of a host (pre-fork
+server), other shared ones implement the same `attach/detach/publish`.
+A pub/sub losing messages of a process delivers `{"resync": true}` to its
+listeners then (all the subscribers there get `resync`).
+
+Backpressure: every subscriber has a bounded queue, a slow one loses
+its pending events and gets `resync` (re-read the changes feed).
+Large bulk writes (batches, imports) publish one `resync` as well.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import socket
+import threading
+from typing import AsyncIterator, Callable, Optional
+
+from tmtrkr import settings
+
+__all__ = ["Broadcaster", "LocalPubSub", "Subscription", "UnixSocketPubSub", "broadcaster", "event_stream"]
+
+log = logging.getLogger(__name__)
+
+
+class LocalPubSub:
+    """In-process pub/sub: messages are delivered to all the attached broadcasters at once."""
+
+    def __init__(self):
+        """."""
+        self.listeners = []
+
+    def attach(self, listener: Callable[[dict], None]):
+        """."""
+        self.listeners.append(listener)
+
+    def detach(self, listener: Callable[[dict], None]):
+        """."""
+        self.listeners.remove(listener)
+
+    def publish(self, message: dict):
+        """Deliver the message (JSON serializable) to the listeners."""
+        for listener in list(self.listeners):
+            listener(message)
+
+
+class UnixSocketPubSub(LocalPubSub):
+    """
+    Pub/sub of the processes of a host: every process receives messages on
+    its datagram socket in the shared directory, messages are sent to all
+    the sockets there. Messages to full (stuck) receivers are dropped, the
+    receivers get `resync` message once they take messages again (retried).
+    """
+
+    max_size = 2**18
+    resync_delay = 0.1  # seconds, between resync message attempts
+
+    def __init__(self, directory: str, name: Optional[str] = None):
+        """Bind the socket (named by the process id by default), start receiving."""
+        super().__init__()
+        self.directory = directory
+        self.path = os.path.join(directory, f"{name or os.getpid()}.sock")
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.socket.bind(self.path)
+        self.dropped = set()  # paths of the receivers lost messages (to get resync)
+        self._lock = threading.Lock()
+        self._timer = None
+        self._thread = threading.Thread(target=self._receive, name="events-pubsub", daemon=True)
+        self._thread.start()
+
+    def close(self):
+        """Stop receiving, remove the socket."""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+            self.dropped.clear()
+        try:
+            self.socket.shutdown(socket.SHUT_RDWR)  # wakes the receiving thread up
+        except OSError:
+            pass
+        self.socket.close()
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+    def publish(self, message: dict):
+        """Send the message (JSON serializable) to all the processes (this one too)."""
+        data = json.dumps(message).encode()
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if not self._send(path, data):
+                with self._lock:
+                    if path not in self.dropped:
+                        log.warning("events pub/sub messages to %s are dropped, resync", path)
+                    self.dropped.add(path)
+                    self._resync_later()
+
+    def _send(self, path: str, data: bytes) -> bool:
+        """Send the datagram, False if the receiver is full (the datagram is dropped)."""
+        try:
+            self.socket.sendto(data, socket.MSG_DONTWAIT, path)
+        except (ConnectionRefusedError, FileNotFoundError):  # exited process
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+        except OSError:
+            return False
+        return True
+
+    def _resync_later(self):
+        # under the lock
+        if self._timer is None and self.dropped:
+            self._timer = threading.Timer(self.resync_delay, self._resync)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _resync(self):
+        data = json.dumps({"resync": True}).encode()
+        with self._lock:
+            self._timer = None
+            self.dropped = {path for path in self.dropped if not self._send(path, data)}
+            self._resync_later()
+
+    def _receive(self):
+        while True:
+            try:
+                data = self.socket.recv(self.max_size)
+            except OSError:
+                return
+            if not data:  # closed
+                return
+            super().publish(json.loads(data))
+
+
+class Subscription:
+    """Events queue of one subscriber (bound to its event loop)."""
+
+    def __init__(self, user_id: Optional[int], queue_size: int):
+        """."""
+        self.user_id = user_id
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=queue_size)
+
+    def put(self, event: dict):
+        """Put event (from any thread)."""
+        try:
+            self.loop.call_soon_threadsafe(self._put, event)
+        except RuntimeError:  # the loop is closed
+            pass
+
+    def _put(self, event: dict):
+        if self.queue.full():
+            # slow subscriber: drop the pending events, the client has to resync
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            event = {"op": "resync"}
+        self.queue.put_nowait(event)
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[dict]:
+        """Get next event, None on timeout."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class Broadcaster:
+    """Subscribers of this worker by users, events are published through the pub/sub."""
+
+    def __init__(self, pubsub=None, queue_size: int = settings.API_EVENTS_QUEUE_SIZE):
+        """."""
+        self.pubsub = pubsub or LocalPubSub()
+        self.queue_size = queue_size
+        self.subscribers = {}  # user_id: set of subscriptions
+        self._lock = threading.Lock()
+        self.pubsub.attach(self.deliver)
+
+    def close(self):
+        """Detach from the pub/sub."""
+        self.pubsub.detach(self.deliver)
+
+    def use(self, pubsub):
+        """Switch to another pub/sub (e.g. a shared one in a forked worker)."""
+        self.close()
+        self.pubsub = pubsub
+        self.pubsub.attach(self.deliver)
+
+    def publish(self, user_id: Optional[int], op: str, record: dict):
+        """Publish record change event (create, update, delete) to all the workers."""
+        self.pubsub.publish({"user_id": user_id, "event": {"op": op, "record": record}})
+
+    def publish_resync(self, user_id: Optional[int]):
+        """Publish `resync` event (too many changes for separate events, e.g. bulk writes) to all the workers."""
+        self.pubsub.publish({"user_id": user_id, "event": {"op": "resync"}})
+
+    def deliver(self, message: dict):
+        """Put the pub/sub message event to the user's subscribers (`resync` to all on lost messages)."""
+        with self._lock:
+            if message.get("resync"):
+                subscriptions = [subscription for user in self.subscribers.values() for subscription in user]
+            else:
+                subscriptions = list(self.subscribers.get(message["user_id"], ()))
+        event = message.get("event", {"op": "resync"})
+        for subscription in subscriptions:
+            subscription.put(event)
+
+    def subscribe(self, user_id: Optional[int]) -> Subscription:
+        """Subscribe to the user's events (in an event loop), `unsubscribe` on disconnect."""
+        subscription = Subscription(user_id, self.queue_size)
+        with self._lock:
+            self.subscribers.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        """."""
+        with self._lock:
+            subscriptions = self.subscribers.get(subscription.user_id, set())
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                self.subscribers.pop(subscription.user_id, None)
+
+
+# this worker's broadcaster
+broadcaster = Broadcaster()
+
+
+async def event_stream(
+    user_id: Optional[int], broadcaster: Broadcaster = broadcaster, keepalive: float = settings.API_EVENTS_KEEPALIVE
+) -> AsyncIterator[str]:
+    """
+    Server-Sent Events of the user (comments when idle).
+
+    Subscribes when iterated, unsubscribes at the end -- a response never
+    streamed (client gone, error before streaming) leaves no subscription.
+    """
+    subscription = broadcaster.subscribe(user_id)
+    try:
+        yield "retry: 3000\n\n"
+        while True:
+            event = await subscription.get(timeout=keepalive)
+            if event is None:
+                yield ": keepalive\n\n"
+            else:
+                yield f"event: {event['op']}\ndata: {json.dumps(event)}\n\n"
+    finally:
+        broadcaster.unsubscribe(subscription)
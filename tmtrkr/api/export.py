@@ -0,0 +1,60 @@
+"""Records export -- streamed NDJSON and CSV lines."""
+
+import csv
+import io
+import json
+from datetime import datetime
+from typing import Iterator
+
+from tmtrkr import models, settings
+
+__all__ = ["EXPORT_COLUMNS", "EXPORT_MEDIA_TYPES", "export_lines"]
+
+EXPORT_COLUMNS = ("id", "user_id", "is_deleted", "start", "end", "duration", "name", "tags")
+EXPORT_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+def export_rows(params, user_id, sessions=None) -> Iterator[list]:
+    """
+    Read filtered records of the user, chunk by chunk, as dicts.
+
+    Own session (the request one is closed before the response is streamed),
+    server side cursor (`yield_per`), columns only -- no ORM objects.
+    `sessions` is the sessions factory (default is `models.Session`).
+    """
+    db = (sessions or models.Session)()
+    try:
+        queryset = db.query(models.Record).filter(
+            models.Record.user_id == user_id if user_id else models.Record.user_id.is_(None)
+        )
+        queryset = params.filter(queryset)
+        columns = [getattr(models.Record, c) for c in EXPORT_COLUMNS if c != "duration"]
+        queryset = queryset.with_entities(*columns).order_by(models.Record.start, models.Record.id)
+        result = db.execute(queryset.statement, execution_options={"yield_per": settings.API_EXPORT_CHUNK_SIZE})
+        for chunk in result.partitions():
+            now = datetime.now().timestamp()
+            rows = []
+            for row in chunk:
+                row = row._asdict()
+                row["duration"] = models.Record.duration_at(row["start"], row["end"], now)
+                rows.append(row)
+            yield rows
+    finally:
+        db.close()
+
+
+def export_lines(params, user_id, format: str = "ndjson", sessions=None) -> Iterator[str]:
+    """Export records as NDJSON or CSV (with a header) text chunks."""
+    if format == "csv":
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=EXPORT_COLUMNS, lineterminator="\n")
+        writer.writeheader()
+        yield buffer.getvalue()
+        for rows in export_rows(params, user_id, sessions):
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerows(rows)
+            yield buffer.getvalue()
+    else:
+        for rows in export_rows(params, user_id, sessions):
+            yield "".join(json.dumps({c: row[c] for c in EXPORT_COLUMNS}) + "\n" for row in rows)
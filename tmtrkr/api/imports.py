@@ -0,0 +1,81 @@
+"""Records import -- NDJSON and CSV lines parsed, validated and inserted chunk by chunk."""
+
+import codecs
+import csv
+import json
+from typing import Iterable, Iterator, Tuple
+
+from pydantic import ValidationError
+
+from tmtrkr import models, settings
+from tmtrkr.api import schemas
+
+__all__ = ["IMPORT_COLUMNS", "iter_lines", "import_lines"]
+
+IMPORT_COLUMNS = ("start", "end", "name", "tags")  # other (exported) columns are ignored
+
+
+def iter_lines(chunks: Iterable[bytes], encoding: str = "utf-8") -> Iterator[str]:
+    """Split bytes chunks (of any size) into the text lines, one partial line is buffered at most."""
+    decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+    tail = ""
+    for chunk in chunks:
+        *lines, tail = (tail + decoder.decode(chunk)).split("\n")
+        for line in lines:
+            yield line + "\n"
+    tail += decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+def parse_lines(lines: Iterable[str], format: str = "ndjson") -> Iterator[Tuple[int, dict, str]]:
+    """Parse lines into (line number, row, error) items, CSV must have a header."""
+    if format == "csv":
+        reader = csv.DictReader(lines)
+        for row in reader:
+            yield reader.line_num, {c: row[c] or None for c in IMPORT_COLUMNS if c in row}, None
+        return
+    for n, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        if isinstance(row, dict):
+            yield n, {c: row[c] for c in IMPORT_COLUMNS if c in row}, None
+        else:
+            yield n, None, "invalid JSON object"
+
+
+def import_lines(db, lines: Iterable[str], user_id: int = None, format: str = "ndjson", chunk_size: int = None) -> dict:
+    """
+    Import records from NDJSON or CSV lines, returns accepted/rejected summary.
+
+    Rows are validated as `RecordInput`, valid ones are inserted with bulk
+    INSERTs and committed every `chunk_size` rows (so memory usage does not
+    depend on the input size, a failed import keeps the committed chunks).
+    Only the first `API_IMPORT_ERRORS_LIMIT` errors are reported.
+    """
+    chunk_size = chunk_size or settings.API_IMPORT_CHUNK_SIZE
+    rsp = {"accepted": 0, "rejected": 0, "errors": []}
+    chunk = []
+    for n, row, error in parse_lines(lines, format=format):
+        if error is None:
+            try:
+                values = schemas.RecordInput.model_validate(row).model_dump()
+                chunk.append(dict(values, user_id=user_id, is_deleted=False))
+            except ValidationError as x:
+                error = schemas.validation_error_message(x)
+        if error is not None:
+            rsp["rejected"] += 1
+            if len(rsp["errors"]) < settings.API_IMPORT_ERRORS_LIMIT:
+                rsp["errors"].append({"line": n, "error": error})
+        if len(chunk) >= chunk_size:
+            rsp["accepted"] += len(models.bulk.insert_records(db, chunk))
+            db.commit()
+            chunk = []
+    if chunk:
+        rsp["accepted"] += len(models.bulk.insert_records(db, chunk))
+        db.commit()
+    return rsp
@@ -1,12 +1,21 @@
 """API for the records (GET/POST/UPADTE/DELETE)."""
 
-from typing import Any, Optional
+import base64
+import json
+import time
+from typing import Any, Literal, Optional, Tuple
 
-from fastapi import APIRouter, Depends, HTTPException
+from anyio import from_thread
+from fastapi import APIRouter, Depends, HTTPException, Request
 from fastapi import status as status_code
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response, StreamingResponse
+from pydantic import ValidationError
+from sqlalchemy import and_, or_
 
 from tmtrkr import models, settings
-from tmtrkr.api import schemas
+from tmtrkr.api import events, export, imports, responses, schemas
+from tmtrkr.api.replica import db_session_readonly, readonly_sessionmaker
 from tmtrkr.api.users import get_user
 
 __all__ = ["api"]
@@ -37,8 +46,52 @@ class CommonQueryParams:
         return queryset
 
 
+def encode_cursor(start: Optional[int], record_id: int) -> str:
+    """Build an opaque page cursor from the last record (start, id) position."""
+    data = json.dumps([start, record_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[Optional[int], int]:
+    """Parse page cursor, get (start, id) position (start is None for records without it)."""
+    try:
+        data = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        start, record_id = json.loads(data)
+        return (None if start is None else int(start)), int(record_id)
+    except Exception:
+        raise HTTPException(status_code=status_code.HTTP_400_BAD_REQUEST, detail="invalid cursor")
+
+
+def encode_watermark(change_id: int) -> str:
+    """Build an opaque changes feed watermark from the user's change number (see `RecordChangeCounter`)."""
+    data = json.dumps([change_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+
+def decode_watermark(watermark: str) -> int:
+    """Parse changes feed watermark, get the change number."""
+    try:
+        data = base64.urlsafe_b64decode(watermark + "=" * (-len(watermark) % 4))
+        (change_id,) = json.loads(data)
+        return int(change_id)
+    except Exception:
+        raise HTTPException(status_code=status_code.HTTP_400_BAD_REQUEST, detail="invalid watermark")
+
+
 class RecordsQueryParams(CommonQueryParams):
-    """Records specific filters."""
+    """
+    Records specific filters.
+
+    Tags: `tags` (space separated) records have any (or all, `tags_match`) of.
+    Search: `q` -- full-text search in names and tags, ranked.
+
+    Pagination:
+    - offset/limit -- classic, gets slower the deeper it goes;
+    - cursor/limit -- keyset, seeks to the (start, id) position after
+    the last record of the previous page (`next_cursor` in the response).
+
+    Records are ordered by (start, id) descending, the ones without start last.
+    """
 
     def __init__(
         self,
@@ -48,73 +101,345 @@ class RecordsQueryParams(CommonQueryParams):
         order_by: Optional[str] = None,
         offset: int = 0,
         limit: int = settings.API_PAGE_SIZE_LIMIT,
+        cursor: Optional[str] = None,
+        tags: Optional[str] = None,
+        tags_match: Literal["any", "all"] = "any",
+        q: Optional[str] = None,
     ):
         """."""
         self.start_min = start_min
         self.start_max = start_max
         self.is_deleted = is_deleted
+        self.tags = (schemas.clean_tags(tags) or "").split()
+        self.tags_match = tags_match
+        self.q = q
         self.order_by = order_by
-        super().__init__(models.Record, offset, limit)
+        self.cursor = decode_cursor(cursor) if cursor else None
+        if self.q and self.cursor:
+            raise HTTPException(status_code=status_code.HTTP_400_BAD_REQUEST, detail="cursor is not supported with q")
+        super().__init__(models.Record, 0 if self.cursor else offset, limit)
 
-    def apply(self, queryset):
-        """Apply records filtering (start interval)."""
+    def filter(self, queryset, ranked: bool = False):
+        """Apply records filtering (start interval, deleted state, tags, search)."""
         if self.start_min:
             queryset = queryset.filter(models.Record.start >= self.start_min)
         if self.start_max:
             queryset = queryset.filter(models.Record.start <= self.start_max)
         if self.is_deleted is not None:
             queryset = queryset.filter(models.Record.is_deleted.is_(self.is_deleted))
+        if self.tags:
+            queryset = models.Tag.filter_records(queryset, self.tags, match_all=(self.tags_match == "all"))
+        if self.q:
+            queryset = models.search_records(queryset, self.q, ranked=ranked)
+        return queryset
+
+    def apply(self, queryset):
+        """Apply records filtering, cursor position, ordering (search rank first) and pagination."""
+        queryset = self.filter(queryset, ranked=True)
+        if self.cursor:
+            queryset = queryset.filter(self.after_cursor(*self.cursor))
         if self.order_by is None:
-            queryset = queryset.order_by(models.Record.start.desc())
+            queryset = queryset.order_by(models.Record.start.desc().nulls_last(), models.Record.id.desc())
         else:
             raise HTTPException(status_code=status_code.HTTP_501_NOT_IMPLEMENTED)
         return super().apply(queryset)
 
+    @staticmethod
+    def after_cursor(start: Optional[int], record_id: int):
+        """Build the filter of the records following the (start, id) position, NULL starts are the last ones."""
+        if start is None:
+            return and_(models.Record.start.is_(None), models.Record.id < record_id)
+        return or_(
+            models.Record.start < start,
+            and_(models.Record.start == start, models.Record.id < record_id),
+            models.Record.start.is_(None),
+        )
+
+    def use_rollups(self, utc_offset: int = 0) -> bool:
+        """Check the filtered range can be read from the daily rollups (long, UTC days aligned)."""
+        return (
+            settings.ROLLUP_ENABLED
+            and self.is_deleted is False
+            and not self.tags
+            and not self.q
+            and models.RecordDailyRollup.is_usable(self.start_min, self.start_max, utc_offset, settings.ROLLUP_MIN_DAYS)
+        )
+
+    def next_cursor(self, records: list) -> Optional[str]:
+        """Get cursor for the next page (if the current page is full and not ranked)."""
+        if not records or len(records) < self.limit or self.q:
+            return None
+        last = records[-1]
+        return encode_cursor(last["start"], last["id"])
+
+
+def get_records_summary(params: RecordsQueryParams, user, db) -> dict:
+    """Build records summary for the whole filtered range (from the rollups or one aggregate query)."""
+    if params.use_rollups():
+        user_id = user.id if user else None
+        rsp = models.RecordDailyRollup.summary(db, user_id, params.start_min, params.start_max)
+    else:
+        rsp = models.Record.summary(params.filter(models.Record.query(db, user=user)))
+    if params.start_min:
+        rsp["query_start_min"] = params.start_min
+    if params.start_max:
+        rsp["query_start_max"] = params.start_max
+    if user:
+        rsp["user"] = responses.shaped(schemas.User, user.as_dict())
+    return rsp
 
-@api.get("/", response_model=schemas.RecordsOutputList)
-def get_records(
-    params: RecordsQueryParams = Depends(RecordsQueryParams),
-    user=Depends(get_user),
-    db=Depends(models.db_session),
-) -> schemas.RecordsOutputList:
-    """Get list of records."""
+
+def get_records_page(params: RecordsQueryParams, user, db) -> dict:
+    """
+    Build records list (a page) and summary (whole filtered range).
+
+    Fast path: output columns only, rows mapped to dicts with one `now`.
+    """
 
     # query records
-    queryset = models.Record.query(db, user=user)
-    records = params.apply(queryset)
+    queryset = models.Record.output_rows(models.Record.query(db, user=user))
+    rows = params.apply(queryset)
 
     # build response
-    rsp = {}
-    rsp["records"] = [record.as_dict() for record in records]
-    rsp["count"] = len(rsp["records"])
-    rsp["duration"] = sum(filter(None, (r["duration"] for r in rsp["records"])))
-    starts = list(filter(None, (r.get("start") for r in rsp["records"])))
-    ends = list(filter(None, (r.get("start") for r in rsp["records"])))
-    if starts:
-        rsp["start_min"], rsp["start_max"] = min(starts), max(starts)
-    if ends:
-        rsp["end_min"], rsp["end_max"] = min(ends), max(ends)
+    rsp = get_records_summary(params, user, db)
+    rsp["records"] = list(map(models.Record.row_mapper(), rows))
+    rsp["next_cursor"] = params.next_cursor(rsp["records"])
+
+    return responses.shaped(schemas.RecordsOutputList, rsp)
+
+
+def get_records_report(params: RecordsQueryParams, bucket: str, by_tag: bool, utc_offset: int, user, db) -> dict:
+    """Build records report (from the rollups or one aggregate query)."""
+    rsp = {"bucket": bucket, "by_tag": by_tag, "utc_offset": utc_offset}
+    if params.use_rollups(utc_offset):
+        user_id = user.id if user else None
+        rsp["rows"] = models.RecordDailyRollup.report(
+            db, user_id, params.start_min, params.start_max, bucket=bucket, by_tag=by_tag
+        )
+    else:
+        queryset = params.filter(models.Record.query(db, user=user))
+        rsp["rows"] = models.Record.report(queryset, bucket=bucket, by_tag=by_tag, utc_offset=utc_offset)
     if params.start_min:
         rsp["query_start_min"] = params.start_min
     if params.start_max:
         rsp["query_start_max"] = params.start_max
     if user:
-        rsp["user"] = user.as_dict()
+        rsp["user"] = responses.shaped(schemas.User, user.as_dict())
+    return responses.shaped(schemas.RecordsReport, rsp)
 
-    return rsp
+
+def get_record_output(record_id: int, user, db) -> dict:
+    """Get record output dict by ID (404 if not found)."""
+    row = models.Record.output_rows(models.Record.query(db, id=record_id, user=user)).first()
+    if not row:
+        raise HTTPException(status_code.HTTP_404_NOT_FOUND)
+    return models.Record.row_mapper()(row)
+
+
+def get_records_changes(since: Optional[str], limit: int, user, db) -> dict:
+    """
+    Build records changes feed: records created, updated or deleted after the watermark.
+
+    Records are scanned by the user's change numbers, the watermark is the last
+    returned one -- it never passes a change which is not committed yet (see
+    `RecordChangeCounter`). Limits: a record is reported once with its last
+    state; hard deleted records and records moved to another user are not
+    reported; writes bypassing the models (raw SQL) are not numbered.
+    """
+    position = decode_watermark(since) if since else 0
+    queryset = models.Record.query(db, user=user).filter(models.Record.change_id > position)
+    queryset = models.Record.output_rows(queryset).add_columns(models.Record.change_id)
+    rows = queryset.order_by(models.Record.change_id).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if rows:
+        position = rows[-1].change_id
+    mapper = models.Record.row_mapper()
+    return {
+        "records": [mapper(row[:-1]) for row in rows],
+        "watermark": encode_watermark(position),
+        "has_more": has_more,
+    }
+
+
+def published(op: str, record: models.Record) -> dict:
+    """Get record output dict, publish it to the user's subscribers (see `events`)."""
+    output = responses.shaped(schemas.RecordOutput, record.as_dict())
+    events.broadcaster.publish(record.user_id, op, output)
+    return output
+
+
+def event_stream_response(user_id: Optional[int]) -> StreamingResponse:
+    """Stream the user's records changes as Server-Sent Events (subscribed while streaming)."""
+    headers = {"cache-control": "no-cache", "x-accel-buffering": "no"}  # no proxy buffering
+    return StreamingResponse(events.event_stream(user_id), media_type="text/event-stream", headers=headers)
+
+
+def get_records_etag(params: RecordsQueryParams, query: str, user, db) -> str:
+    """Records list ETag: user, query string and version of the filtered range (see `Record.version`)."""
+    count, updated_at, running = models.Record.version(params.filter(models.Record.query(db, user=user)))
+    return responses.etag(user.id if user else None, query, count, updated_at, int(time.time()) if running else None)
+
+
+def get_record_etag(record_id: int, user, db) -> Optional[str]:
+    """Record ETag (None if not found)."""
+    queryset = models.Record.query(db, id=record_id, user=user)
+    row = queryset.with_entities(models.Record.updated_at, models.Record.end).first()
+    if not row:
+        return None
+    return responses.etag(user.id if user else None, record_id, row[0], int(time.time()) if row[1] is None else None)
+
+
+def get_records_response(request: Request, params: RecordsQueryParams, user, db) -> Response:
+    """Records list response, `304 Not Modified` (rows are not loaded) if the client has the current version."""
+    tag = get_records_etag(params, request.url.query, user, db)
+    return responses.not_modified(request, tag) or responses.JSONResponse(
+        get_records_page(params, user, db), headers=responses.cache_headers(tag)
+    )
+
+
+def get_record_response(request: Request, record_id: int, user, db) -> Response:
+    """Record response, `304 Not Modified` if the client has the current version."""
+    tag = get_record_etag(record_id, user, db)
+    if tag is None:
+        raise HTTPException(status_code.HTTP_404_NOT_FOUND)
+    return responses.not_modified(request, tag) or responses.JSONResponse(
+        get_record_output(record_id, user, db), headers=responses.cache_headers(tag)
+    )
+
+
+@api.get("/", response_model=schemas.RecordsOutputList)
+def get_records(
+    request: Request,
+    params: RecordsQueryParams = Depends(RecordsQueryParams),
+    user=Depends(get_user),
+    db=Depends(db_session_readonly),
+) -> schemas.RecordsOutputList:
+    """
+    Get list of records (a page) and summary (whole filtered range).
+
+    The response is not validated again (see `get_records_page`),
+    conditional GET is supported (ETag, If-None-Match).
+    """
+    return get_records_response(request, params, user, db)
+
+
+@api.get("/summary", response_model=schemas.RecordsSummary)
+def get_summary(
+    params: RecordsQueryParams = Depends(RecordsQueryParams),
+    user=Depends(get_user),
+    db=Depends(db_session_readonly),
+) -> schemas.RecordsSummary:
+    """Get records summary only (no records are fetched)."""
+    return responses.JSONResponse(responses.shaped(schemas.RecordsSummary, get_records_summary(params, user, db)))
+
+
+@api.get("/report", response_model=schemas.RecordsReport)
+def get_report(
+    bucket: Literal["day", "week", "month", "year"] = "day",
+    by_tag: bool = False,
+    utc_offset: int = 0,
+    params: RecordsQueryParams = Depends(RecordsQueryParams),
+    user=Depends(get_user),
+    db=Depends(db_session_readonly),
+) -> schemas.RecordsReport:
+    """
+    Get records report -- durations grouped by time buckets (and tags).
+
+    Buckets are dates ('YYYY-MM-DD') of the day/week/month/year start,
+    UTC shifted by `utc_offset` seconds; weeks start on Monday.
+    A record goes (with its whole duration) to the bucket it starts;
+    long ranges are read from the daily rollups.
+    """
+    return responses.JSONResponse(get_records_report(params, bucket, by_tag, utc_offset, user, db))
+
+
+@api.get("/export")
+def export_records(
+    request: Request,
+    format: Literal["ndjson", "csv"] = "ndjson",
+    params: RecordsQueryParams = Depends(RecordsQueryParams),
+    user=Depends(get_user),
+) -> StreamingResponse:
+    """
+    Export records (all, filtered) as NDJSON or CSV stream.
+
+    Records are ordered by start, pagination parameters are ignored;
+    memory usage does not depend on the number of records.
+    """
+    sessions = readonly_sessionmaker(request)
+    rows = export.export_lines(params, user.id if user else None, format=format, sessions=sessions)
+    headers = {"content-disposition": f'attachment; filename="records.{format}"'}
+    return StreamingResponse(rows, media_type=export.EXPORT_MEDIA_TYPES[format], headers=headers)
+
+
+@api.post("/import", response_model=schemas.RecordsImportOutput)
+async def import_records(
+    request: Request,
+    format: Literal["ndjson", "csv"] = "ndjson",
+    user=Depends(get_user),
+    db=Depends(models.db_session),
+) -> schemas.RecordsImportOutput:
+    """
+    Import records from NDJSON or CSV (with a header) request body.
+
+    The body is read, parsed and inserted chunk by chunk (in a worker
+    thread), memory usage does not depend on the body size.
+    Subscribers get `resync` (records are committed chunk by chunk).
+    """
+    stream = request.stream()
+
+    def chunks():
+        while (chunk := from_thread.run(anext, stream, None)) is not None:
+            yield chunk
+
+    user_id = user.id if user else None
+    lines = imports.iter_lines(chunks())
+    rsp = None
+    try:
+        rsp = await run_in_threadpool(imports.import_lines, db, lines, user_id, format=format)
+        return rsp
+    finally:
+        if rsp is None or rsp["accepted"]:  # a failed import keeps the committed chunks
+            events.broadcaster.publish_resync(user_id)
+
+
+@api.get("/events")
+async def get_events(user=Depends(get_user)) -> StreamingResponse:
+    """
+    Push records changes of the user (create, update, delete; resync on overflow) as Server-Sent Events.
+
+    Replaces polling of the records list, see `tmtrkr.api.events`.
+    """
+    return event_stream_response(user.id if user else None)
+
+
+@api.get("/changes", response_model=schemas.RecordsChanges)
+def get_changes(
+    since: Optional[str] = None,
+    limit: int = settings.API_PAGE_SIZE_LIMIT,
+    user=Depends(get_user),
+    db=Depends(models.db_session),
+) -> schemas.RecordsChanges:
+    """
+    Get records changes (deleted ones too) since the watermark, for delta sync.
+
+    Repeat with the returned `watermark` (at once while `has_more`).
+    Read from the primary database -- replication lag would skip changes.
+    """
+    limit = min(settings.API_PAGE_SIZE_LIMIT, max(limit, 1))
+    return responses.JSONResponse(get_records_changes(since, limit, user, db))
 
 
 @api.get("/{record_id}", response_model=schemas.RecordOutput)
 def get_record(
+    request: Request,
     record_id: int,
     user=Depends(get_user),
-    db=Depends(models.db_session),
+    db=Depends(db_session_readonly),
 ) -> schemas.RecordOutput:
-    """Get record by ID."""
-    record = models.Record.first(db, id=record_id, user=user)
-    if not record:
-        raise HTTPException(status_code.HTTP_404_NOT_FOUND)
-    return record.as_dict()
+    """Get record by ID (conditional GET is supported)."""
+    return get_record_response(request, record_id, user, db)
 
 
 @api.post("/", response_model=schemas.RecordOutput, status_code=status_code.HTTP_201_CREATED)
@@ -126,7 +451,85 @@ def create_record(
     """Create a new record."""
     record = models.Record(user=user, **data.model_dump())
     record.save(db)
-    return record.as_dict()
+    return published("create", record)
+
+
+@api.post("/batch", response_model=schemas.RecordsBatchOutput)
+def batch_records(
+    data: schemas.RecordsBatchInput,
+    user=Depends(get_user),
+    db=Depends(models.db_session),
+) -> schemas.RecordsBatchOutput:
+    """
+    Create, patch and delete records in one transaction (bulk statements).
+
+    Every operation gets its own result (status as for the single record
+    requests), invalid operations are skipped, valid ones are applied.
+    Operations on the same record are applied in order.
+    Subscribers get an event per changed record (or `resync`, see `events`).
+    """
+    if len(data.operations) > settings.API_BATCH_SIZE_LIMIT:
+        raise HTTPException(status_code.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+    # validate
+    results, inputs = [], {}
+    for index, operation in enumerate(data.operations):
+        result = {"index": index, "op": operation.op, "status": None}
+        results.append(result)
+        if operation.op != "create" and operation.id is None:
+            result["status"], result["error"] = status_code.HTTP_422_UNPROCESSABLE_ENTITY, "id is required"
+        elif operation.op != "delete":
+            try:
+                inputs[index] = schemas.RecordInput.model_validate(operation.data or {}).model_dump()
+            except ValidationError as x:
+                result["status"] = status_code.HTTP_422_UNPROCESSABLE_ENTITY
+                result["error"] = schemas.validation_error_message(x)
+
+    # existing records (user's only)
+    ids = [op.id for op, r in zip(data.operations, results) if op.op != "create" and r["status"] is None]
+    old = models.bulk.read_snapshots(models.Record.query(db, user=user), ids)
+
+    # collect changes
+    creates, updates = [], {}
+    for operation, result in zip(data.operations, results):
+        if result["status"] is not None:
+            continue
+        if operation.op == "create":
+            values = dict(inputs[result["index"]], user_id=user.id if user else None, is_deleted=False)
+            creates.append((result, values))
+            result["status"] = status_code.HTTP_201_CREATED
+        elif operation.id not in old:
+            result["status"] = status_code.HTTP_404_NOT_FOUND
+        elif operation.op == "patch":
+            updates.setdefault(operation.id, {"id": operation.id}).update(inputs[result["index"]])
+            result["status"], result["id"] = status_code.HTTP_202_ACCEPTED, operation.id
+        else:
+            updates.setdefault(operation.id, {"id": operation.id})["is_deleted"] = True
+            result["status"], result["id"] = status_code.HTTP_200_OK, operation.id
+
+    # apply in one transaction
+    new_ids = models.bulk.insert_records(db, [values for _, values in creates])
+    for (result, _), new_id in zip(creates, new_ids):
+        result["id"] = new_id
+    models.bulk.update_records(db, list(updates.values()), old)
+    db.commit()
+
+    # results with the records
+    record_ids = [r["id"] for r in results if r.get("id")]
+    records = {r.id: r.as_dict() for r in models.Record.query(db).filter(models.Record.id.in_(record_ids))}
+    for result in results:
+        result["record"] = records.get(result.pop("id", None))
+
+    # one event per changed record (its final state), one `resync` for large batches
+    user_id = user.id if user else None
+    if len(records) > settings.API_EVENTS_BATCH_LIMIT:
+        events.broadcaster.publish_resync(user_id)
+    else:
+        created = set(new_ids)
+        for record_id, record in records.items():
+            op = "delete" if record["is_deleted"] else "create" if record_id in created else "update"
+            events.broadcaster.publish(user_id, op, responses.shaped(schemas.RecordOutput, record))
+    return {"results": results}
 
 
 @api.patch("/{record_id}", response_model=schemas.RecordOutput, status_code=status_code.HTTP_202_ACCEPTED)
@@ -142,7 +545,7 @@ def update_record(
         raise HTTPException(status_code.HTTP_404_NOT_FOUND)
     record.update(**data.model_dump())
     record.save(db)
-    return record.as_dict()
+    return published("update", record)
 
 
 @api.delete("/{record_id}", response_model=schemas.RecordOutput)
@@ -157,4 +560,4 @@ def delete_record(
         raise HTTPException(status_code.HTTP_404_NOT_FOUND)
     record.is_deleted = True
     record.save(db)
-    return record.as_dict()
+    return published("delete", record)
@@ -0,0 +1,150 @@
+"""
+API for the records -- async stack (AsyncSession), see `tmtrkr.models.db`.
+
+Same routes as `tmtrkr.api.records`: single record writes are native async,
+queries are run by the sync implementations in `AsyncSession.run_sync`
+(database IO is still async, no worker threads are taken).
+Export and import are the same (they use the sync engine).
+"""
+
+from typing import Literal, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi import status as status_code
+from fastapi.responses import StreamingResponse
+
+from tmtrkr import models, settings
+from tmtrkr.api import records, responses, schemas
+from tmtrkr.api.records import RecordsQueryParams
+from tmtrkr.api.replica import db_session_readonly_async
+from tmtrkr.api.users import get_user_async
+
+__all__ = ["api"]
+
+api = APIRouter()
+
+
+@api.get("/", response_model=schemas.RecordsOutputList)
+async def get_records(
+    request: Request,
+    params: RecordsQueryParams = Depends(RecordsQueryParams),
+    user=Depends(get_user_async),
+    db=Depends(db_session_readonly_async),
+) -> schemas.RecordsOutputList:
+    """Get list of records (a page) and summary (whole filtered range)."""
+    return await db.run_sync(lambda session: records.get_records_response(request, params, user, session))
+
+
+@api.get("/summary", response_model=schemas.RecordsSummary)
+async def get_summary(
+    params: RecordsQueryParams = Depends(RecordsQueryParams),
+    user=Depends(get_user_async),
+    db=Depends(db_session_readonly_async),
+) -> schemas.RecordsSummary:
+    """Get records summary only (no records are fetched)."""
+    rsp = await db.run_sync(lambda session: records.get_records_summary(params, user, session))
+    return responses.JSONResponse(responses.shaped(schemas.RecordsSummary, rsp))
+
+
+@api.get("/report", response_model=schemas.RecordsReport)
+async def get_report(
+    bucket: Literal["day", "week", "month", "year"] = "day",
+    by_tag: bool = False,
+    utc_offset: int = 0,
+    params: RecordsQueryParams = Depends(RecordsQueryParams),
+    user=Depends(get_user_async),
+    db=Depends(db_session_readonly_async),
+) -> schemas.RecordsReport:
+    """Get records report -- durations grouped by time buckets (and tags)."""
+    rsp = await db.run_sync(
+        lambda session: records.get_records_report(params, bucket, by_tag, utc_offset, user, session)
+    )
+    return responses.JSONResponse(rsp)
+
+
+@api.get("/events")
+async def get_events(user=Depends(get_user_async)) -> StreamingResponse:
+    """Push records changes of the user as Server-Sent Events."""
+    return records.event_stream_response(user.id if user else None)
+
+
+@api.get("/changes", response_model=schemas.RecordsChanges)
+async def get_changes(
+    since: Optional[str] = None,
+    limit: int = settings.API_PAGE_SIZE_LIMIT,
+    user=Depends(get_user_async),
+    db=Depends(models.db_session_async),
+) -> schemas.RecordsChanges:
+    """Get records changes (deleted ones too) since the watermark, for delta sync."""
+    limit = min(settings.API_PAGE_SIZE_LIMIT, max(limit, 1))
+    return responses.JSONResponse(
+        await db.run_sync(lambda session: records.get_records_changes(since, limit, user, session))
+    )
+
+
+api.get("/export")(records.export_records)
+api.post("/import", response_model=schemas.RecordsImportOutput)(records.import_records)
+
+
+@api.get("/{record_id}", response_model=schemas.RecordOutput)
+async def get_record(
+    request: Request,
+    record_id: int,
+    user=Depends(get_user_async),
+    db=Depends(db_session_readonly_async),
+) -> schemas.RecordOutput:
+    """Get record by ID."""
+    return await db.run_sync(lambda session: records.get_record_response(request, record_id, user, session))
+
+
+@api.post("/", response_model=schemas.RecordOutput, status_code=status_code.HTTP_201_CREATED)
+async def create_record(
+    data: schemas.RecordInput,
+    user=Depends(get_user_async),
+    db=Depends(models.db_session_async),
+) -> schemas.RecordOutput:
+    """Create a new record."""
+    record = models.Record(user_id=user.id if user else None, **data.model_dump())
+    await record.asave(db)
+    return records.published("create", record)
+
+
+@api.post("/batch", response_model=schemas.RecordsBatchOutput)
+async def batch_records(
+    data: schemas.RecordsBatchInput,
+    user=Depends(get_user_async),
+    db=Depends(models.db_session_async),
+) -> schemas.RecordsBatchOutput:
+    """Create, patch and delete records in one transaction (bulk statements)."""
+    return await db.run_sync(lambda session: records.batch_records(data, user, session))
+
+
+@api.patch("/{record_id}", response_model=schemas.RecordOutput, status_code=status_code.HTTP_202_ACCEPTED)
+async def update_record(
+    record_id: int,
+    data: schemas.RecordInput,
+    user=Depends(get_user_async),
+    db=Depends(models.db_session_async),
+) -> schemas.RecordOutput:
+    """Update record."""
+    record = await models.Record.afirst(db, id=record_id, user=user)
+    if not record:
+        raise HTTPException(status_code.HTTP_404_NOT_FOUND)
+    record.update(**data.model_dump())
+    await record.asave(db)
+    return records.published("update", record)
+
+
+@api.delete("/{record_id}", response_model=schemas.RecordOutput)
+async def delete_record(
+    record_id: int,
+    user=Depends(get_user_async),
+    db=Depends(models.db_session_async),
+) -> schemas.RecordOutput:
+    """Mark record as deleted."""
+    record = await models.Record.afirst(db, id=record_id, user=user)
+    if not record:
+        raise HTTPException(status_code.HTTP_404_NOT_FOUND)
+    record.is_deleted = True
+    await record.asave(db)
+    return records.published("delete", record)
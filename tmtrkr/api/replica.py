@@ -0,0 +1,72 @@
+"""
+Read replica routing of the API endpoints.
+
+Read-only endpoints (records lists, summaries, reports, single records,
+export) get sessions reading from the replica, the rest read and write
+the primary database.
+
+Read-your-writes: successful writes (not safe methods) set a short-lived
+cookie, the client reads from the primary till it expires (replication lag).
+"""
+
+from starlette.datastructures import MutableHeaders
+from starlette.requests import Request
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from tmtrkr import models, settings
+
+__all__ = [
+    "PRIMARY_COOKIE",
+    "ReadYourWritesMiddleware",
+    "db_session_readonly",
+    "db_session_readonly_async",
+    "readonly_sessionmaker",
+]
+
+PRIMARY_COOKIE = "tmtrkr_primary"
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+def readonly_sessionmaker(request: Request):
+    """Get the sessions factory of a read-only request: replica one, primary one after the client's writes."""
+    return models.db.Session if PRIMARY_COOKIE in request.cookies else models.db.ReplicaSession
+
+
+def db_session_readonly(request: Request):
+    """Create a new database session of a read-only request (see `readonly_sessionmaker`). Close it after usage."""
+    db = readonly_sessionmaker(request)()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def db_session_readonly_async(request: Request):
+    """Create a new async database session of a read-only request. Close it after usage."""
+    factory = models.db.AsyncSession if PRIMARY_COOKIE in request.cookies else models.db.AsyncReplicaSession
+    async with factory() as db:
+        yield db
+
+
+class ReadYourWritesMiddleware:
+    """Set the primary database cookie on successful responses of writes (see the module docs)."""
+
+    def __init__(self, app: ASGIApp, max_age: int = settings.DATABASE_REPLICA_READ_YOUR_WRITES):
+        """."""
+        self.app = app
+        self.max_age = max_age
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """."""
+        if scope["type"] != "http" or scope["method"] in SAFE_METHODS:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message: Message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                headers = MutableHeaders(scope=message)
+                cookie = f"{PRIMARY_COOKIE}=1; Max-Age={self.max_age}; Path=/; HttpOnly; SameSite=Lax"
+                headers.append("set-cookie", cookie)
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
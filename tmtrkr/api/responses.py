@@ -0,0 +1,62 @@
+"""Fast JSON responses -- content is already shaped as the response model, it is not validated again."""
+
+import hashlib
+import json
+from typing import Any, Optional
+
+from fastapi import Request
+from fastapi.responses import JSONResponse as _JSONResponse
+from fastapi.responses import Response
+from pydantic import BaseModel
+
+try:
+    import orjson
+except ImportError:  # optional, see requirements-speedups.txt
+    orjson = None
+
+__all__ = ["JSONResponse", "cache_headers", "dumps", "etag", "not_modified", "shaped"]
+
+# conditional GET: clients (browsers too) revalidate with `If-None-Match`
+CACHE_CONTROL = "private, no-cache"
+
+
+def dumps(content: Any) -> bytes:
+    """Encode JSON (orjson if installed)."""
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+class JSONResponse(_JSONResponse):
+    """JSON response encoded with `dumps`."""
+
+    def render(self, content: Any) -> bytes:
+        """."""
+        return dumps(content)
+
+
+def shaped(schema: type[BaseModel], content: dict) -> dict:
+    """Shape top level of the content as the schema: fields order, defaults for the missing ones, no extra keys."""
+    return {key: content.get(key, field.default) for key, field in schema.model_fields.items()}
+
+
+def etag(*parts: Any) -> str:
+    """Weak ETag from the version parts (reprs)."""
+    digest = hashlib.sha1(repr(parts).encode()).hexdigest()
+    return f'W/"{digest}"'
+
+
+def not_modified(request: Request, tag: str) -> Optional[Response]:
+    """Get `304 Not Modified` response if `If-None-Match` matches the ETag (weak comparison)."""
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return None
+    tags = {value.strip().removeprefix("W/") for value in if_none_match.split(",")}
+    if "*" in tags or tag.removeprefix("W/") in tags:
+        return Response(status_code=304, headers=cache_headers(tag))
+    return None
+
+
+def cache_headers(tag: str) -> dict:
+    """Conditional GET response headers."""
+    return {"ETag": tag, "Cache-Control": CACHE_CONTROL}
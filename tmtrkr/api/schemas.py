@@ -2,11 +2,24 @@
 
 import re
 import time
-from typing import List, Optional
+from typing import List, Literal, Optional
 
 from pydantic import BaseModel, field_validator, model_validator
 
 
+def clean_tags(v: Optional[str]) -> Optional[str]:
+    """Clean the tags line: lowercase alphanumeric words separated by spaces."""
+    if v:
+        vs = re.split(r"\s+", re.sub(r"[^a-zA-Z0-9\s]", "", str(v).strip().lower()))
+        v = " ".join(vs)
+    return v
+
+
+def validation_error_message(x) -> str:
+    """Format validation errors (pydantic.ValidationError) as one line: `field: message; ...`."""
+    return "; ".join(f"{'.'.join(map(str, e['loc']))}: {e['msg']}" for e in x.errors())
+
+
 class User(BaseModel):
     """User model."""
 
@@ -60,10 +73,7 @@ class RecordInput(Record):
     @classmethod
     def tags_clean(cls, v):
         """Split the tags line."""
-        if v:
-            vs = re.split(r"\s+", re.sub(r"[^a-zA-Z0-9\s]", "", str(v).strip().lower()))
-            v = " ".join(vs)
-        return v
+        return clean_tags(v)
 
 
 class RecordOutput(Record):
@@ -75,10 +85,54 @@ class RecordOutput(Record):
     user_id: Optional[int] = None
 
 
-class RecordsOutputList(BaseModel):
-    """Records list model."""
+class RecordBatchOperation(BaseModel):
+    """Batch operation: create (data), patch (id, data) or delete (id) a record."""
+
+    op: Literal["create", "patch", "delete"]
+    id: Optional[int] = None
+    data: Optional[dict] = None  # validated as RecordInput per operation
+
+
+class RecordsBatchInput(BaseModel):
+    """Batch of the records operations."""
+
+    operations: List[RecordBatchOperation]
+
+
+class RecordBatchResult(BaseModel):
+    """Batch operation result (HTTP-like status, record or error)."""
+
+    index: int
+    op: str
+    status: int
+    record: Optional[RecordOutput] = None
+    error: Optional[str] = None
+
+
+class RecordsBatchOutput(BaseModel):
+    """Batch results, in the operations order."""
+
+    results: List[RecordBatchResult]
+
+
+class RecordImportError(BaseModel):
+    """Rejected import line."""
+
+    line: int
+    error: str
+
+
+class RecordsImportOutput(BaseModel):
+    """Import summary (errors list is truncated)."""
+
+    accepted: int
+    rejected: int
+    errors: List[RecordImportError]
+
+
+class RecordsSummary(BaseModel):
+    """Records summary model (whole filtered range, not a page)."""
 
-    records: List[RecordOutput]
     count: int
     duration: Optional[float] = None
     start_min: Optional[int] = None
@@ -90,6 +144,42 @@ class RecordsOutputList(BaseModel):
     user: Optional[User] = None
 
 
+class RecordsOutputList(RecordsSummary):
+    """Records list model."""
+
+    records: List[RecordOutput]
+    next_cursor: Optional[str] = None
+
+
+class RecordsChanges(BaseModel):
+    """Records changes feed model (deleted records are included, `is_deleted`)."""
+
+    records: List[RecordOutput]
+    watermark: str
+    has_more: bool = False
+
+
+class ReportRow(BaseModel):
+    """Report row -- records aggregated in a time bucket (and tag)."""
+
+    bucket: str
+    tag: Optional[str] = None
+    count: int
+    duration: float
+
+
+class RecordsReport(BaseModel):
+    """Records report model (time buckets, optionally split by tag)."""
+
+    bucket: Literal["day", "week", "month", "year"]
+    by_tag: bool = False
+    utc_offset: int = 0
+    rows: List[ReportRow]
+    query_start_min: Optional[int] = None
+    query_start_max: Optional[int] = None
+    user: Optional[User] = None
+
+
 class TokenData(BaseModel):
     """Access token data."""
 
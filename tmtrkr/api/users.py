@@ -1,5 +1,6 @@
 """API for the users (Not fully Implemented Yet)."""
 
+import hashlib
 import time
 from typing import Optional
 
@@ -12,12 +13,19 @@ from fastapi.security import OAuth2PasswordBearer
 
 from tmtrkr import models, settings
 from tmtrkr.api import schemas
+from tmtrkr.api.cache import TTLCache
 
-__all__ = ["api", "get_user"]
+__all__ = ["api", "api_async", "get_user", "get_user_async", "tokens_cache", "users_cache"]
 
 
 api = APIRouter()
 
+# known users, username: user row (`User.as_dict`) -- no database query for them
+users_cache = TTLCache(settings.AUTH_USERS_CACHE_SIZE, settings.AUTH_USERS_CACHE_TTL)
+
+# verified JWT tokens, token hash: username -- till the token expiry
+tokens_cache = TTLCache(settings.AUTH_TOKENS_CACHE_SIZE, settings.AUTH_TOKENS_CACHE_TTL)
+
 # cached oauth client
 _oauth2_client = None
 
@@ -54,17 +62,23 @@ def get_username(
 
 
 def get_username_from_token(token: str) -> Optional[str]:
-    """Parse JWT token and get username."""
+    """Parse JWT token and get username (verified tokens are cached till expiry)."""
+    key = hashlib.sha256(token.encode()).digest()
+    username = tokens_cache.get(key)
+    if username is not None:
+        return username
     try:
         payload = jwt.decode(token, key=settings.SECRET_KEY, algorithms=["HS256"])
-        token = schemas.TokenData(**payload)
-        return token.username
+        data = schemas.TokenData(**payload)
+        if data.expire <= time.time():
+            raise ValueError("token expired")
     except Exception as x:
         raise HTTPException(
             status_code=status_code.HTTP_401_UNAUTHORIZED,
             detail=f"token error: {repr(x):.256}",
         )
-    return None
+    tokens_cache.set(key, data.username, ttl=min(tokens_cache.ttl, data.expire - time.time()))
+    return data.username
 
 
 def build_token(user: models.User) -> str:
@@ -84,15 +98,43 @@ def get_user(
     """
     Get user -- from auth token or trusted headers.
 
+    - known users are cached (`users_cache`), invalidate it on users changes
     - creates a new user if username is unknown and AUTH_USERS_AUTO_CREATE
     - returns None if username is not set and AUTH_USERS_ALLOW_UNKNOWN
     """
     user = None
     if username:
-        if settings.AUTH_USERS_AUTO_CREATE:
+        values = users_cache.get(username)
+        if values is not None:
+            user = db.merge(models.User.detached(values), load=False)
+        elif settings.AUTH_USERS_AUTO_CREATE:
             user = models.User.get_or_create(db, name=username)
         else:
             user = models.User.first(db, name=username)
+        if user and values is None:
+            users_cache.set(username, user.as_dict())
+    if not user and not settings.AUTH_USERS_ALLOW_UNKNOWN:
+        # user is not found and guests are not allowed
+        raise HTTPException(status_code=status_code.HTTP_401_UNAUTHORIZED)
+    return user
+
+
+async def get_user_async(
+    username=Depends(get_username),
+    db=Depends(models.db_session_async),
+) -> Optional[models.User]:
+    """Get user -- async version of `get_user` (AsyncSession)."""
+    user = None
+    if username:
+        values = users_cache.get(username)
+        if values is not None:
+            user = await db.merge(models.User.detached(values), load=False)
+        elif settings.AUTH_USERS_AUTO_CREATE:
+            user = await models.User.aget_or_create(db, name=username)
+        else:
+            user = await models.User.afirst(db, name=username)
+        if user and values is None:
+            users_cache.set(username, user.as_dict())
     if not user and not settings.AUTH_USERS_ALLOW_UNKNOWN:
         # user is not found and guests are not allowed
         raise HTTPException(status_code=status_code.HTTP_401_UNAUTHORIZED)
@@ -156,3 +198,24 @@ async def logout_oauth2(
     if oauth_client.server_metadata and oauth_client.server_metadata.get("end_session_endpoint"):
         return RedirectResponse(url=oauth_client.server_metadata.get("end_session_endpoint"))
     return logout()
+
+
+# async stack: database routes are async, the rest are the same
+api_async = APIRouter()
+
+
+@api_async.get("/", response_model=schemas.UserList)
+async def get_users_async(db=Depends(models.db_session_async)) -> schemas.UserList:
+    """List all users."""
+    users = await models.User.aall(db)
+    return {"users": (u.as_dict() for u in users)}
+
+
+@api_async.get("/token", response_model=schemas.TokenResponse)
+async def get_token_async(user=Depends(get_user_async)) -> schemas.TokenResponse:
+    """Create auth token for logged-in user."""
+    token = build_token(user)
+    return {"token": token}
+
+
+api_async.include_router(api)
@@ -1,62 +1,193 @@
-"""Demo database."""
+"""
+Demo database -- synthetic users and records, from a demo to a load testing size.
+
+Records are generated user by user: working days (rare weekends), working
+hours in the user's timezone, log-normal durations, a few tags per record
+from a Zipf-like vocabulary. Records are inserted with bulk INSERTs in chunks,
+daily rollups are rebuilt once at the end. Users are split between worker
+processes (disjoint users -- disjoint rollups rows).
+"""
 
 import argparse
 import datetime
 import logging
+import math
 import random
 import string
+from concurrent.futures import ProcessPoolExecutor
+from itertools import accumulate
+
+from sqlalchemy import create_engine, func, insert, select, text
+from sqlalchemy.orm import sessionmaker
 
-from tmtrkr.models import Record, User, db_session
+import tmtrkr.models.db
+import tmtrkr.settings
+from tmtrkr.models import Record, RecordDailyRollup, Tag, User, db_session
 
 __all__ = ["create_demo_database"]
 TODAY = datetime.date.today()
 
-
-def generate_word():
-    """Make a name part."""
-    return "".join(random.choices(string.ascii_lowercase, k=random.randint(3, 10)))
-
-
-def create_user(db):
-    """Create a demo user."""
-    user_name = " ".join([generate_word() for _ in ("first", "last")]).title()
-    user = User(name=user_name)
-    user.save(db)
-    return user
-
-
-def create_record(db, users):
-    """Create a demo record."""
-    record_name = " ".join([generate_word() for _ in range(random.randint(3, 10))]).capitalize() + "."
-    start = datetime.datetime(
-        TODAY.year,
-        random.randint(1, 12),
-        random.randint(2, 28),
-        random.randint(8, 17),
-        random.randint(0, 3) * 15,
-        0,
-        tzinfo=datetime.timezone.utc,
-    )
-    end = start + datetime.timedelta(minutes=(10 * random.randint(1, 24)))
-    user = random.choice(users)
-    record = Record(user_id=user.id, name=record_name, start=start.timestamp(), end=end.timestamp())
-    record.save(db)
-    return record
+WORDS = 512  # names vocabulary size
+TAGS = 64  # tags vocabulary size
 
 
-def create_demo_database(n_users=8, n_records=2**10):
-    """Generate users and records."""
-    db = next(db_session())
-    users = []
-    for _ in range(n_users):
-        user = create_user(db)
-        logging.info(user)
-        users.append(user)
-    records = []
-    for _ in range(n_records):
-        record = create_record(db=db, users=users)
-        logging.info(record)
-        records.append(record)
+def generate_word(rng=random):
+    """Make a name part."""
+    return "".join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 10)))
+
+
+def generate_vocabulary(seed, size):
+    """Make words list (same for all workers with the same seed)."""
+    rng = random.Random(f"{seed}-{size}")
+    return sorted({generate_word(rng) for _ in range(size)})
+
+
+def split_counts(rng, total, n):
+    """Split total into n Pareto distributed (heavy users and occasional ones) counts."""
+    weights = [rng.paretovariate(1.5) for _ in range(n)]
+    scale = total / sum(weights)
+    counts = [int(w * scale) for w in weights]
+    for i in rng.sample(range(n), total - sum(counts)):
+        counts[i] += 1
+    return counts
+
+
+def generate_user_records(rng, user_id, n_records, first_id, days, words, tags):
+    """Generate records values (ids from `first_id`) of the user over the days (dates list), oldest first."""
+    utc_offset = rng.choice(range(-8, 10)) * 60 * 60
+    user_tags = rng.sample(tags, k=min(len(tags), rng.randint(4, 16)))
+    tags_weights = list(accumulate(1 / (k + 1) for k in range(len(user_tags))))
+    days_weights = list(accumulate(1 if day.weekday() < 5 else 0.05 for day in days))
+    per_day = {}
+    for day in rng.choices(days, cum_weights=days_weights, k=n_records):
+        per_day[day] = per_day.get(day, 0) + 1
+    record_id = first_id
+    for day in sorted(per_day):
+        midnight = datetime.datetime(day.year, day.month, day.day, tzinfo=datetime.timezone.utc).timestamp()
+        start = int(midnight) - utc_offset + 8 * 60 * 60 + rng.randint(0, 18) * 5 * 60
+        for _ in range(per_day[day]):
+            duration = min(max(int(rng.lognormvariate(math.log(45), 0.8)), 5), 4 * 60) // 5 * 5
+            names = rng.choices(words, k=rng.randint(2, 6))
+            record_tags = set(rng.choices(user_tags, cum_weights=tags_weights, k=rng.choice((0, 1, 1, 2, 2, 3))))
+            yield {
+                "id": record_id,
+                "user_id": user_id,
+                "is_deleted": rng.random() < 0.02,
+                "start": start,
+                "end": start + duration * 60,
+                "name": " ".join(names).capitalize() + ".",
+                "tags": " ".join(sorted(record_tags)) or None,
+            }
+            start += duration * 60 + int(rng.expovariate(1 / 10)) // 5 * 5 * 60
+            record_id += 1
+
+
+def create_users(db, n_users, seed=None):
+    """Create demo users, return their ids."""
+    rng = random.Random(seed)
+    values = [{"name": " ".join([generate_word(rng) for _ in ("first", "last")]).title()} for _ in range(n_users)]
+    ids = list(db.scalars(insert(User).returning(User.id, sort_by_parameter_order=True), values))
+    db.commit()
+    return ids
+
+
+def default_database_url():
+    """Get the (sync driver) database URL of the app."""
+    return tmtrkr.models.db.engine.url.render_as_string(hide_password=False)
+
+
+def create_database_engine(database_url):
+    """Create own engine (of a worker process)."""
+    connect_args = tmtrkr.settings.DATABASE_CONNECT_ARGS if database_url == default_database_url() else {}
+    if database_url.startswith("sqlite"):
+        connect_args = dict(connect_args, timeout=600)  # wait for the other workers' writes
+    return create_engine(database_url, connect_args=connect_args)
+
+
+def init_worker():
+    """Forget the parent process connections (must not be used or closed by a child)."""
+    tmtrkr.models.db.engine.dispose(close=False)
+
+
+def create_records(database_url, users_records, years=1, today=None, chunk_size=10000, seed=None):
+    """
+    Create records for the [(user_id, number of records, first record id)], return number of records.
+
+    Runs in a worker process: own engine, commit per chunk, rollups of the users are rebuilt at the end.
+    Ids are preallocated, so plain executemany INSERTs are used (no RETURNING).
+    """
+    engine = create_database_engine(database_url)
+    db = sessionmaker(bind=engine)()
+    today = today or TODAY
+    days = [today - datetime.timedelta(days=d) for d in range(int(365.25 * years), 0, -1)]
+    words, tags = generate_vocabulary(seed, WORDS), generate_vocabulary(seed, TAGS)
+    statement = insert(Record.__table__)
+    n, chunk = 0, []
+    try:
+        for user_id, n_records, first_id in users_records:
+            rng = random.Random(f"{seed}-{user_id}")
+            for values in generate_user_records(rng, user_id, n_records, first_id, days, words, tags):
+                chunk.append(values)
+                if len(chunk) >= chunk_size:
+                    n += _insert_records(db, statement, chunk)
+                    chunk = []
+            logging.debug("user %d records: %d", user_id, n_records)
+        n += _insert_records(db, statement, chunk)
+        RecordDailyRollup.rebuild(db, user_ids=[user_id for user_id, *_ in users_records], batch_size=chunk_size)
+    finally:
+        db.close()
+        engine.dispose()
+    return n
+
+
+def _insert_records(db, statement, chunk):
+    if not chunk:
+        return 0
+    change_ids = tmtrkr.models.RecordChangeCounter.next_ids(db, [values["user_id"] for values in chunk])
+    db.execute(statement, [dict(values, change_id=change_id) for values, change_id in zip(chunk, change_ids)])
+    Tag.set_records_tags(db, {values["id"]: values["tags"] for values in chunk if values["tags"]})
+    db.commit()
+    logging.info("records inserted: %d", len(chunk))
+    return len(chunk)
+
+
+def create_demo_database(
+    n_users=8,
+    n_records=2**10,
+    years=1,
+    processes=1,
+    chunk_size=10000,
+    seed=None,
+    database_url=None,
+    today=None,
+):
+    """Generate users and records (in several processes), return number of records."""
+    database_url = database_url or default_database_url()
+    seed = random.randrange(2**32) if seed is None else seed
+    engine = create_database_engine(database_url)
+    db = sessionmaker(bind=engine)()
+    try:
+        user_ids = create_users(db, n_users, seed=seed)
+        first_id = (db.scalar(select(func.max(Record.id))) or 0) + 1
+    finally:
+        db.close()
+    logging.info("users created: %d", len(user_ids))
+    counts = split_counts(random.Random(seed), n_records, n_users)
+    first_ids = [first_id + n for n in accumulate(counts, initial=0)]
+    users_records = list(zip(user_ids, counts, first_ids))
+    parts = [users_records[i::processes] for i in range(processes) if users_records[i::processes]]
+    args = (years, today or TODAY, chunk_size, seed)
+    if len(parts) <= 1:
+        n = sum(create_records(database_url, part, *args) for part in parts)
+    else:
+        with ProcessPoolExecutor(max_workers=len(parts), initializer=init_worker) as pool:
+            n = sum(pool.map(create_records, [database_url] * len(parts), parts, *[[arg] * len(parts) for arg in args]))
+    if engine.dialect.name == "postgresql":
+        with engine.begin() as connection:
+            connection.execute(text("SELECT setval(pg_get_serial_sequence('record', 'id'), max(id)) FROM record"))
+    engine.dispose()
+    logging.info("records created: %d", n)
+    return n
 
 
 def count_records():
@@ -71,6 +202,12 @@ def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--only-if-empty", action="store_true")
     parser.add_argument("--today", type=str)
+    parser.add_argument("--users", type=int, default=8)
+    parser.add_argument("--records", type=int, default=2**10)
+    parser.add_argument("--years", type=float, default=1)
+    parser.add_argument("--processes", type=int, default=1)
+    parser.add_argument("--chunk-size", type=int, default=10000)
+    parser.add_argument("--seed", type=int)
     args = parser.parse_args()
     if args.only_if_empty and count_records() > 0:
         logging.warning("database is not empty -- no demo data")
@@ -78,7 +215,14 @@ def main():
     if args.today:
         global TODAY
         TODAY = datetime.datetime.strptime(args.today, "%Y-%m-%d").date()
-    create_demo_database()
+    create_demo_database(
+        n_users=args.users,
+        n_records=args.records,
+        years=args.years,
+        processes=args.processes,
+        chunk_size=args.chunk_size,
+        seed=args.seed,
+    )
 
 
 if __name__ == "__main__":
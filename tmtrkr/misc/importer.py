@@ -0,0 +1,38 @@
+"""Import records from NDJSON or CSV file (or stdin)."""
+
+import argparse
+import logging
+import sys
+
+from tmtrkr.api.imports import import_lines
+from tmtrkr.models import db_session
+
+__all__ = ["import_records"]
+
+
+def import_records(path, user_id=None, format=None, chunk_size=None):
+    """Import records file (format by the extension if not set), line by line."""
+    format = format or ("csv" if path.lower().endswith(".csv") else "ndjson")
+    db = next(db_session())
+    with open(path, newline="", encoding="utf-8") if path != "-" else sys.stdin as lines:
+        rsp = import_lines(db, lines, user_id=user_id, format=format, chunk_size=chunk_size)
+    for error in rsp["errors"]:
+        logging.warning("line %d rejected: %s", error["line"], error["error"])
+    logging.info("records imported: %d, rejected: %d", rsp["accepted"], rsp["rejected"])
+    return rsp
+
+
+def main():
+    """Read cli parameters and import."""
+    logging.root.setLevel(logging.INFO)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("path", help="NDJSON or CSV file, '-' for stdin")
+    parser.add_argument("--user-id", type=int)
+    parser.add_argument("--format", choices=["ndjson", "csv"])
+    parser.add_argument("--chunk-size", type=int)
+    args = parser.parse_args()
+    import_records(args.path, user_id=args.user_id, format=args.format, chunk_size=args.chunk_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+"""Rebuild records daily rollups (backfill and repair)."""
+
+import argparse
+import logging
+
+from tmtrkr.models import RecordDailyRollup, db_session
+
+__all__ = ["rebuild_rollups"]
+
+
+def rebuild_rollups(user_ids=None, batch_size=10000):
+    """Rebuild rollups for all (or the listed) users."""
+    db = next(db_session())
+    n = RecordDailyRollup.rebuild(db, user_ids=user_ids, batch_size=batch_size)
+    logging.info("rollups rebuilt, records: %d", n)
+    return n
+
+
+def main():
+    """Read cli parameters and rebuild."""
+    logging.root.setLevel(logging.INFO)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--user-id", type=int, action="append", dest="user_ids")
+    parser.add_argument("--batch-size", type=int, default=10000)
+    args = parser.parse_args()
+    rebuild_rollups(user_ids=args.user_ids, batch_size=args.batch_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,11 @@
+from . import bulk
 from .base import Base
-from .db import db_connection, db_session
+from .changes import RecordChangeCounter
+from .db import Session, db_connection, db_session, db_session_async
 from .records import Record
+from .rollups import RecordDailyRollup
+from .search import search_records
+from .tags import RecordTag, Tag
 from .users import User
 
 
@@ -2,8 +2,9 @@
 
 from datetime import datetime
 
-from sqlalchemy import TIMESTAMP, Column
-from sqlalchemy.orm import declarative_base
+from sqlalchemy import TIMESTAMP, Column, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import declarative_base, make_transient_to_detached
 
 
 class BaseModel:
@@ -33,10 +34,52 @@ class BaseModel:
         obj = cls.first(session, **kwargs)
         if obj:
             return obj
-        obj = cls(**kwargs)
-        obj.save(session)
+        try:
+            return cls(**kwargs).save(session)
+        except IntegrityError:
+            # created concurrently (unique constraint), get that one
+            session.rollback()
+            return cls.first(session, **kwargs)
+
+    @classmethod
+    def detached(cls, values: dict):
+        """Detached instance from the row values (e.g. cached ones), use `session.merge(obj, load=False)`."""
+        obj = cls(**values)
+        make_transient_to_detached(obj)
         return obj
 
+    # async versions (AsyncSession), `aquery` is a select statement
+
+    @classmethod
+    def aquery(cls, **kwargs):
+        q = select(cls)
+        if kwargs:
+            q = q.filter_by(**kwargs)
+        return q
+
+    @classmethod
+    async def afirst(cls, session, **kwargs):
+        return (await session.scalars(cls.aquery(**kwargs).limit(1))).first()
+
+    @classmethod
+    async def aone(cls, session, **kwargs):
+        return (await session.scalars(cls.aquery(**kwargs))).one_or_none()
+
+    @classmethod
+    async def aall(cls, session, **kwargs):
+        return (await session.scalars(cls.aquery(**kwargs))).all()
+
+    @classmethod
+    async def aget_or_create(cls, session, **kwargs):
+        obj = await cls.afirst(session, **kwargs)
+        if obj:
+            return obj
+        try:
+            return await cls(**kwargs).asave(session)
+        except IntegrityError:
+            await session.rollback()
+            return await cls.afirst(session, **kwargs)
+
     def update(self, **kwargs):
         for key, value in kwargs.items():
             if key in self._columns_update:
@@ -62,6 +105,11 @@ class BaseModel:
         session.flush()
         return self
 
+    async def asave(self, session):
+        session.add(self)
+        await session.commit()
+        return self
+
 
 #
 Base = declarative_base(cls=BaseModel)
@@ -0,0 +1,51 @@
+"""Records bulk (executemany) writes, with rollups, tags and change numbers kept in sync."""
+
+from sqlalchemy.sql import insert, update
+
+from .changes import RecordChangeCounter
+from .records import Record
+from .rollups import RecordDailyRollup
+from .tags import Tag
+
+__all__ = ["insert_records", "update_records", "read_snapshots"]
+
+
+def _snapshot(values: dict, old: dict = None) -> dict:
+    snapshot = dict(old or {"user_id": None, "start": None, "end": None, "tags": None, "is_deleted": False})
+    snapshot.update((key, values[key]) for key in RecordDailyRollup.SNAPSHOT_COLUMNS if key in values)
+    return snapshot
+
+
+def insert_records(session, values: list) -> list:
+    """
+    Insert records (list of column values dicts) with bulk INSERTs, does not commit.
+
+    Returns new records ids (in the values order).
+    """
+    if not values:
+        return []
+    change_ids = RecordChangeCounter.next_ids(session, [v.get("user_id") for v in values])
+    statement = insert(Record).returning(Record.id, sort_by_parameter_order=True)
+    ids = list(session.scalars(statement, [dict(v, change_id=c) for v, c in zip(values, change_ids)]))
+    RecordDailyRollup.records_changed(session, [(None, _snapshot(v)) for v in values])
+    Tag.set_records_tags(session, {id_: v["tags"] for id_, v in zip(ids, values) if v.get("tags")})
+    return ids
+
+
+def update_records(session, values: list, old: dict):
+    """
+    Update records (list of column values dicts with `id`) with bulk UPDATEs, does not commit.
+
+    `old` -- {id: snapshot} of the records before update (see `read_snapshots`).
+    """
+    if not values:
+        return
+    change_ids = RecordChangeCounter.next_ids(session, [v.get("user_id", old[v["id"]]["user_id"]) for v in values])
+    session.execute(update(Record), [dict(v, change_id=c) for v, c in zip(values, change_ids)])
+    RecordDailyRollup.records_changed(session, [(old[v["id"]], _snapshot(v, old[v["id"]])) for v in values])
+    Tag.set_records_tags(session, {v["id"]: v["tags"] for v in values if "tags" in v})
+
+
+def read_snapshots(queryset, ids: list) -> dict:
+    """Read {id: snapshot} of the records (rollups and tags dependent columns), locked for update."""
+    return RecordDailyRollup.read_snapshots(queryset, ids)
@@ -0,0 +1,97 @@
+"""Records change counters database model."""
+
+from collections import defaultdict
+from itertools import chain
+from typing import Iterable, Optional
+
+from sqlalchemy import Column, Integer, event
+from sqlalchemy.orm import Session, attributes
+from sqlalchemy.sql import bindparam, update
+
+from . import functions
+from .base import Base
+from .records import Record
+
+
+class RecordChangeCounter(Base):
+    """
+    Last records change number per user (changes feed positions).
+
+    NB:
+    Every written record gets the next number of its user (`Record.change_id`),
+    the counter row is bumped in the same transaction as the records. The row
+    stays locked by the writer till the commit (SQLite has a single writer anyway),
+    so the numbers of a user become visible in their order -- a reader never sees
+    a number before the smaller ones (a rollback takes its numbers back too).
+
+    Numbers are assigned on every session flush (see the session events below),
+    bulk (Core) statements bypass the session, use `next_ids` or `records_changed`.
+    Users are not foreign keys here, NO_USER_ID stands for records without user.
+    """
+
+    __tablename__ = "record_change_counter"
+
+    NO_USER_ID = 0
+
+    user_id = Column(Integer, primary_key=True, autoincrement=False)
+    value = Column(Integer, nullable=False, default=0)
+
+    def __repr__(self) -> str:
+        """."""
+        return f"RecordChangeCounter(user_id={self.user_id!r}, value={self.value!r})"
+
+    @classmethod
+    def bump(cls, session, user_id: Optional[int], n: int) -> int:
+        """Reserve the next n change numbers of the user, get the last one."""
+        dialect = session.get_bind().dialect.name
+        insert = functions.insert(cls.__table__, dialect)
+        statement = insert.on_conflict_do_update(
+            index_elements=["user_id"], set_={"value": cls.__table__.c.value + insert.excluded.value}
+        )
+        return session.scalar(statement.values(user_id=user_id or cls.NO_USER_ID, value=n).returning(cls.value))
+
+    @classmethod
+    def next_ids(cls, session, user_ids: list) -> list:
+        """Reserve the next change numbers for the records of the users (`user_ids` item per record), in order."""
+        positions = defaultdict(list)
+        for i, user_id in enumerate(user_ids):
+            positions[user_id].append(i)
+        change_ids = [None] * len(user_ids)
+        for user_id, indexes in positions.items():
+            last = cls.bump(session, user_id, len(indexes))
+            for i, change_id in zip(indexes, range(last - len(indexes) + 1, last + 1)):
+                change_ids[i] = change_id
+        return change_ids
+
+    @classmethod
+    def records_changed(cls, session, records: Iterable[tuple]) -> dict:
+        """
+        Number the changes of the written records -- (id, user_id) pairs, get {id: change_id}.
+
+        Must be called after the records are written, does not commit.
+        Bulk writes had better put `next_ids` into the written values at once.
+        """
+        records = list(records)
+        change_ids = dict(zip((id_ for id_, _ in records), cls.next_ids(session, [user_id for _, user_id in records])))
+        if change_ids:
+            statement = update(Record.__table__).where(Record.__table__.c.id == bindparam("record_id"))
+            session.execute(
+                statement.values(change_id=bindparam("change_id")),
+                [{"record_id": id_, "change_id": change_id} for id_, change_id in change_ids.items()],
+            )
+        return change_ids
+
+
+@event.listens_for(Session, "after_flush")
+def _changes_after_flush(session, flush_context):
+    """Number the flushed (created, modified) records changes."""
+    records = [
+        obj
+        for obj in chain(session.new, session.dirty)
+        if isinstance(obj, Record) and obj not in session.deleted and session.is_modified(obj)
+    ]
+    if not records:
+        return
+    change_ids = RecordChangeCounter.records_changed(session, [(obj.id, obj.user_id) for obj in records])
+    for obj in records:
+        attributes.set_committed_value(obj, "change_id", change_ids[obj.id])
@@ -1,15 +1,212 @@
-"""Database instance module."""
+"""
+Database instance module.
 
-from sqlalchemy import create_engine
+Async stack is enabled by an async driver in the database URL
+(`sqlite+aiosqlite://...`, `postgresql+asyncpg://...`), the sync engine
+(migrations, scripts, streaming export/import) uses the sync driver then.
+
+SQLite production mode (`TMTRKR_DATABASE_SQLITE_MODE=wal`): WAL journal and
+tuned pragmas, writes go through a single connection (writers wait in the
+pool instead of failing on the database lock), reads run on a pool of
+read-only connections concurrently with the writer and each other.
+The async stack gets its own writer and readers engines of the same kind
+(the sync and async writers are two connections, their writes still wait
+for each other with `busy_timeout`).
+
+Read replica (`TMTRKR_DATABASE_REPLICA_URL`): `db_session_replica` sessions
+read from the replica, write to the primary database (and read from it
+after that, till the transaction end) -- for the read-only API endpoints,
+see `tmtrkr.api.replica` (read-your-writes).
+"""
+
+from typing import Optional
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import URL, Engine, make_url
+from sqlalchemy.orm import Session as OrmSession
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 
 import tmtrkr.settings
 
-__all__ = ["db_session", "db_connection"]
+__all__ = [
+    "Session",
+    "AsyncSession",
+    "ReplicaSession",
+    "AsyncReplicaSession",
+    "RoutingSession",
+    "create_sqlite_engines",
+    "db_session",
+    "db_session_async",
+    "db_session_replica",
+    "db_session_replica_async",
+    "db_connection",
+    "has_replica",
+    "is_async",
+]
+
+# async driver: sync driver of the same database
+ASYNC_DRIVERS = {"aiosqlite": "pysqlite", "asyncpg": "psycopg2"}
+
+url = make_url(tmtrkr.settings.DATABASE_URL)
+replica_url = make_url(tmtrkr.settings.DATABASE_REPLICA_URL) if tmtrkr.settings.DATABASE_REPLICA_URL else None
+
+
+def sync_url(url: URL) -> URL:
+    """Get the URL with the sync driver (of the async one)."""
+    if url.get_driver_name() in ASYNC_DRIVERS:
+        return url.set(drivername=f"{url.get_backend_name()}+{ASYNC_DRIVERS[url.get_driver_name()]}")
+    return url
+
+
+def pool_options(url: URL) -> dict:
+    """Connection pool settings of the engine (size, overflow and timeout are of the queue pools only)."""
+    options = {
+        "pool_recycle": tmtrkr.settings.DATABASE_POOL_RECYCLE,
+        "pool_pre_ping": tmtrkr.settings.DATABASE_POOL_PRE_PING,
+    }
+    if issubclass(url.get_dialect().get_pool_class(url), QueuePool):
+        options.update(
+            pool_size=tmtrkr.settings.DATABASE_POOL_SIZE,
+            max_overflow=tmtrkr.settings.DATABASE_POOL_MAX_OVERFLOW,
+            pool_timeout=tmtrkr.settings.DATABASE_POOL_TIMEOUT,
+        )
+    return options
+
+
+def set_pragmas(engine: Engine, pragmas: dict):
+    """Set SQLite pragmas on every new connection of the engine."""
+
+    @event.listens_for(engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+
+def create_sqlite_engines(url, readers: int = tmtrkr.settings.DATABASE_SQLITE_READERS):
+    """Create SQLite production mode engines (file database): (writer, read-only readers pool), async by the URL."""
+    url = make_url(url)
+    if url.get_driver_name() in ASYNC_DRIVERS:
+        from sqlalchemy.ext.asyncio import create_async_engine as create
+
+        poolclass = AsyncAdaptedQueuePool
+    else:
+        create, poolclass = create_engine, QueuePool
+    options = {
+        "connect_args": tmtrkr.settings.DATABASE_CONNECT_ARGS,
+        "poolclass": poolclass,
+        "pool_timeout": tmtrkr.settings.DATABASE_POOL_TIMEOUT,
+    }
+    writer = create(url, pool_size=1, max_overflow=0, **options)
+    set_pragmas(
+        getattr(writer, "sync_engine", writer), {"journal_mode": "WAL", **tmtrkr.settings.DATABASE_SQLITE_PRAGMAS}
+    )
+    reader_url = url.set(database=f"file:{url.database}", query={**url.query, "mode": "ro", "uri": "true"})
+    reader = create(reader_url, pool_size=readers, max_overflow=-1, **options)
+    set_pragmas(getattr(reader, "sync_engine", reader), tmtrkr.settings.DATABASE_SQLITE_PRAGMAS)
+    return writer, reader
+
+
+class RoutingSession(OrmSession):
+    """
+    Session reading through the reader engine (if any), writing through the bound one.
+
+    Once the session writes (flush, DML statements) it reads through the
+    writer too (its own not committed changes) till the transaction end.
+    """
+
+    def __init__(self, *args, reader: Optional[Engine] = None, **kwargs):
+        """."""
+        super().__init__(*args, **kwargs)
+        self.reader = reader
+        self.writing = False
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        """Get the writer engine for writes and in writing transactions, the reader one otherwise."""
+        if self.reader is None or self.writing or getattr(clause, "is_dml", False):
+            self.writing = True
+            return super().get_bind(mapper, clause=clause, **kwargs)
+        return self.reader
+
+
+@event.listens_for(RoutingSession, "before_flush", insert=True)
+def start_writing(session: RoutingSession, flush_context, instances):
+    """Route the whole flush to the writer (inserted before the other flush listeners, e.g. rollups reads)."""
+    session.writing = True
 
-engine = create_engine(tmtrkr.settings.DATABASE_URL, connect_args=tmtrkr.settings.DATABASE_CONNECT_ARGS)
 
-Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+@event.listens_for(RoutingSession, "after_commit")
+@event.listens_for(RoutingSession, "after_rollback")
+def end_writing(session: RoutingSession):
+    """."""
+    session.writing = False
+
+
+sqlite_wal = tmtrkr.settings.DATABASE_SQLITE_MODE == "wal" and url.get_backend_name() == "sqlite" and url.database
+
+if url.get_driver_name() in ASYNC_DRIVERS:
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+    if sqlite_wal:
+        async_engine, async_reader_engine = create_sqlite_engines(url)
+    else:
+        async_engine = create_async_engine(url, connect_args=tmtrkr.settings.DATABASE_CONNECT_ARGS, **pool_options(url))
+        async_reader_engine = None
+    async_replica_engine = None
+    if replica_url is not None and replica_url.get_driver_name() in ASYNC_DRIVERS:
+        async_replica_engine = create_async_engine(
+            replica_url, connect_args=tmtrkr.settings.DATABASE_CONNECT_ARGS, **pool_options(replica_url)
+        )
+    async_read_engine = async_replica_engine or async_reader_engine
+    # not expired on commit: attributes are not lazy loaded (no implicit IO) after `asave`
+    AsyncSession = async_sessionmaker(
+        async_engine,
+        sync_session_class=RoutingSession,
+        reader=async_reader_engine.sync_engine if async_reader_engine is not None else None,
+        autoflush=False,
+        expire_on_commit=False,
+    )
+    AsyncReplicaSession = async_sessionmaker(
+        async_engine,
+        sync_session_class=RoutingSession,
+        reader=async_read_engine.sync_engine if async_read_engine is not None else None,
+        autoflush=False,
+        expire_on_commit=False,
+    )
+else:
+    async_engine = async_reader_engine = async_replica_engine = None
+    AsyncSession = AsyncReplicaSession = None
+
+url = sync_url(url)
+if sqlite_wal:
+    engine, reader_engine = create_sqlite_engines(url)
+else:
+    engine = create_engine(url, connect_args=tmtrkr.settings.DATABASE_CONNECT_ARGS, **pool_options(url))
+    reader_engine = None
+
+replica_engine = None
+if replica_url is not None:
+    replica_url = sync_url(replica_url)
+    replica_engine = create_engine(
+        replica_url, connect_args=tmtrkr.settings.DATABASE_CONNECT_ARGS, **pool_options(replica_url)
+    )
+
+Session = sessionmaker(class_=RoutingSession, autocommit=False, autoflush=False, bind=engine, reader=reader_engine)
+ReplicaSession = sessionmaker(
+    class_=RoutingSession, autocommit=False, autoflush=False, bind=engine, reader=replica_engine or reader_engine
+)
+
+
+def is_async() -> bool:
+    """Check the async stack is enabled."""
+    return AsyncSession is not None
+
+
+def has_replica() -> bool:
+    """Check the read replica is set."""
+    return replica_engine is not None
 
 
 def db_session():
@@ -23,6 +220,27 @@ def db_session():
         db.close()
 
 
+def db_session_replica():
+    """Create a new database session reading from the replica (primary without one). Close it after usage."""
+    try:
+        db = ReplicaSession()
+        yield db
+    finally:
+        db.close()
+
+
+async def db_session_async():
+    """Create a new async database session. Close it after usage."""
+    async with AsyncSession() as db:
+        yield db
+
+
+async def db_session_replica_async():
+    """Create a new async database session reading from the replica. Close it after usage."""
+    async with AsyncReplicaSession() as db:
+        yield db
+
+
 def db_connection():
     """Return database connction."""
     return engine.begin()
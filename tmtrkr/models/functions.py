@@ -0,0 +1,42 @@
+"""Dialect specific SQL expressions (SQLite and PostgreSQL)."""
+
+from sqlalchemy import func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.sql.expression import literal_column
+
+__all__ = ["BUCKETS", "date_bucket", "insert"]
+
+BUCKETS = ("day", "week", "month", "year")
+
+_SQLITE_BUCKET_MODIFIERS = {
+    "day": (),
+    "week": ("weekday 0", "-6 days"),  # next (or same) Sunday, back to Monday
+    "month": ("start of month",),
+    "year": ("start of year",),
+}
+
+
+def date_bucket(epoch, bucket: str, dialect: str):
+    """
+    Bucket (day, week, month, year) start date for epoch seconds.
+
+    Returns SQL expression -- 'YYYY-MM-DD' text, UTC, weeks start on Monday.
+    """
+    if bucket not in BUCKETS:
+        raise ValueError(f"unknown bucket: {bucket}")
+    if dialect == "sqlite":
+        modifiers = (literal_column(f"'{m}'") for m in _SQLITE_BUCKET_MODIFIERS[bucket])
+        return func.date(epoch, literal_column("'unixepoch'"), *modifiers)
+    if dialect == "postgresql":
+        timestamp = func.timezone(literal_column("'UTC'"), func.to_timestamp(epoch))
+        return func.to_char(func.date_trunc(literal_column(f"'{bucket}'"), timestamp), literal_column("'YYYY-MM-DD'"))
+    raise NotImplementedError(f"date_bucket is not implemented for {dialect}")
+
+
+def insert(table, dialect: str):
+    """INSERT statement supporting ON CONFLICT (upsert)."""
+    if dialect == "sqlite":
+        return sqlite.insert(table)
+    if dialect == "postgresql":
+        return postgresql.insert(table)
+    raise NotImplementedError(f"insert on conflict is not implemented for {dialect}")
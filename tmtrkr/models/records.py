@@ -1,12 +1,14 @@
 """Records database model."""
 
 from datetime import datetime
-from typing import Optional
+from typing import Callable, Optional
 
 # from sqlalchemy import ARRAY, TIMESTAMP
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, Text
+from sqlalchemy import Boolean, Column, ForeignKey, Index, Integer, Text, func
 from sqlalchemy.orm import relationship
+from sqlalchemy.sql.expression import and_, case, literal_column, text
 
+from . import functions
 from .base import AutoTimestampsMixin, Base
 
 
@@ -20,8 +22,30 @@ class Record(Base, AutoTimestampsMixin):
     """
 
     __tablename__ = "record"
+    __table_args__ = (
+        # records list access path: filter by user and state, scan by (start, id) backwards,
+        # NULL starts last (PostgreSQL sorts them as the biggest values, SQLite as the smallest ones)
+        Index("ix_record_user_id_is_deleted_start_id", "user_id", "is_deleted", "start", "id").ddl_if(
+            callable_=lambda ddl, target, bind, dialect=None, **kwargs: dialect.name != "postgresql"
+        ),
+        Index("ix_record_user_id_is_deleted_start_id", "user_id", "is_deleted", text("start NULLS FIRST"), "id").ddl_if(
+            dialect="postgresql"
+        ),
+        # running (not finished) records, they are not in the daily rollups
+        Index(
+            "ix_record_user_id_running",
+            "user_id",
+            "is_deleted",
+            "start",
+            sqlite_where=text('"end" IS NULL'),
+            postgresql_where=text('"end" IS NULL'),
+        ),
+        # changes feed (delta sync): scan by the user's change numbers
+        Index("ix_record_user_id_change_id", "user_id", "change_id"),
+    )
 
     TAGS_DATATYPE = Text  # ARRAY(Text)
+    OUTPUT_COLUMNS = ("start", "end", "name", "tags", "id", "is_deleted", "user_id")  # `row_mapper` order
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(Integer, ForeignKey("user.id"), nullable=True)
@@ -30,6 +54,7 @@ class Record(Base, AutoTimestampsMixin):
     end = Column(Integer, nullable=True)
     name = Column(Text)
     tags = Column(TAGS_DATATYPE)
+    change_id = Column(Integer, nullable=True)  # the user's last change number (see `RecordChangeCounter`)
 
     user = relationship("User", back_populates="records")
 
@@ -52,11 +77,140 @@ class Record(Base, AutoTimestampsMixin):
         - seconds since the start till the current moment
         for not finished records started in the past.
         """
-        now = datetime.now().timestamp()
-        end = self.end or now
-        if not self.start or (self.start > max(now, end)):
+        return self.duration_at(self.start, self.end, datetime.now().timestamp())
+
+    @staticmethod
+    def duration_at(start: Optional[int], end: Optional[int], now: float) -> Optional[float]:
+        """Calculate duration of the record (start, end) at the `now` moment (see `duration`)."""
+        end = end or now
+        if not start or (start > max(now, end)):
             return None
-        return end - self.start
+        return end - start
+
+    @classmethod
+    def output_rows(cls, queryset):
+        """Select only the output columns (as tuples, no ORM objects), see `row_mapper`."""
+        return queryset.with_entities(*(getattr(cls, key) for key in cls.OUTPUT_COLUMNS))
+
+    @classmethod
+    def row_mapper(cls, now: Optional[float] = None) -> Callable[[tuple], dict]:
+        """
+        Build output row (`OUTPUT_COLUMNS` tuple) to dict function.
+
+        The dict is the same as `RecordOutput` (keys order and types),
+        duration is calculated at one `now` moment for all the rows.
+        """
+        now = now or datetime.now().timestamp()
+        duration_at = cls.duration_at
+
+        def mapper(row: tuple) -> dict:
+            start, end, name, tags, id_, is_deleted, user_id = row
+            duration = duration_at(start, end, now)
+            return {
+                "start": start,
+                "end": end,
+                "name": name,
+                "tags": tags,
+                "id": id_,
+                "duration": None if duration is None else float(duration),
+                "is_deleted": is_deleted,
+                "user_id": user_id,
+            }
+
+        return mapper
+
+    @classmethod
+    def duration_expression(cls, now: Optional[float] = None):
+        """Record duration as SQL expression (same rules as `duration`)."""
+        now = now or datetime.now().timestamp()
+        return case(
+            (and_(cls.end.is_(None), cls.start > now), None),
+            else_=func.coalesce(cls.end, now) - cls.start,
+        )
+
+    @classmethod
+    def summary(cls, queryset, now: Optional[float] = None) -> dict:
+        """
+        Aggregate records of the (filtered, not paginated) queryset.
+
+        One SQL query: count, total duration, start/end min and max.
+        """
+        row = queryset.with_entities(
+            func.count(cls.id),
+            func.sum(cls.duration_expression(now)),
+            func.min(cls.start),
+            func.max(cls.start),
+            func.min(cls.end),
+            func.max(cls.end),
+        ).one()
+        return {
+            "count": row[0] or 0,
+            "duration": float(row[1] or 0),
+            "start_min": row[2],
+            "start_max": row[3],
+            "end_min": row[4],
+            "end_max": row[5],
+        }
+
+    @classmethod
+    def version(cls, queryset) -> tuple:
+        """
+        Version stamp of the (filtered) queryset records, cheap -- rows are not loaded.
+
+        One SQL query: count, last update, not finished records count
+        (their durations change with time).
+        """
+        row = queryset.with_entities(
+            func.count(cls.id),
+            func.max(cls.updated_at),
+            func.sum(case((cls.end.is_(None), 1), else_=0)),
+        ).one()
+        return row[0] or 0, row[1], row[2] or 0
+
+    @classmethod
+    def report(
+        cls,
+        queryset,
+        bucket: str = "day",
+        by_tag: bool = False,
+        utc_offset: int = 0,
+        now: Optional[float] = None,
+    ) -> list:
+        """
+        Aggregate records of the (filtered) queryset by time buckets (and tags).
+
+        One GROUP BY query, records are bucketed by their start.
+        With `by_tag` a record is counted in every its tag group
+        (and in the `None` group if it has no tags).
+        """
+        dialect = queryset.session.get_bind().dialect.name
+        start = cls.start + literal_column(str(int(utc_offset))) if utc_offset else cls.start
+        groups = [functions.date_bucket(start, bucket, dialect).label("bucket")]
+        if by_tag:
+            from .tags import RecordTag, Tag
+
+            queryset = queryset.outerjoin(RecordTag, RecordTag.record_id == cls.id).outerjoin(
+                Tag, Tag.id == RecordTag.tag_id
+            )
+            groups.append(Tag.name.label("tag"))
+        rows = (
+            queryset.with_entities(
+                *groups,
+                func.count(cls.id).label("count"),
+                func.sum(cls.duration_expression(now)).label("duration"),
+            )
+            .group_by(*groups)
+            .order_by(*groups)
+        )
+        return [
+            {
+                "bucket": row.bucket,
+                "tag": row.tag if by_tag else None,
+                "count": row.count,
+                "duration": float(row.duration or 0),
+            }
+            for row in rows
+        ]
 
     @property
     def _columns_as_dict(self) -> list:
@@ -0,0 +1,370 @@
+"""
+Records daily rollups database model.
+
+Rollups book a record's whole duration on the UTC day it starts, they do not
+split it across the days the record covers: the records summary and report
+bucket records by start (a record crossing midnight counts to its start day),
+and the rollups have to give the same numbers for any days aligned range.
+"""
+
+from collections import defaultdict
+from itertools import chain
+from typing import Iterable, Optional
+
+from sqlalchemy import Column, Integer, Text, event, inspect
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import delete, func, select, update
+
+from . import functions
+from .base import Base
+from .records import Record
+
+DAY = 24 * 60 * 60
+
+
+class RecordDailyRollup(Base):
+    """
+    Records durations per user, UTC day and tag.
+
+    NB:
+    Only finished (with start and end) and not deleted records are rolled up,
+    running records are added on the fly by the queries.
+    Record count and (whole) duration go to the day it starts -- records are
+    bucketed by start like in `Record.summary` and `Record.report`, so the
+    rollups give the same results for any UTC days aligned range.
+    Tag TAG_ALL row is a total for all records of the day,
+    tag TAG_NONE row is for records without tags.
+    Users are not foreign keys here, NO_USER_ID stands for records without user.
+
+    Rollups are updated on every session flush (see the session events below),
+    in the same transaction as the records. Bulk (Core) statements bypass
+    the session, use `records_changed` or `rebuild` after them.
+    """
+
+    __tablename__ = "record_daily_rollup"
+
+    TAG_ALL = "*"
+    TAG_NONE = ""
+    NO_USER_ID = 0
+
+    user_id = Column(Integer, primary_key=True, autoincrement=False)
+    day = Column(Integer, primary_key=True, autoincrement=False)  # epoch seconds of the UTC day start
+    tag = Column(Text, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+    duration = Column(Integer, nullable=False, default=0)
+    # records starting the day (TAG_ALL rows only)
+    start_min = Column(Integer, nullable=True)
+    start_max = Column(Integer, nullable=True)
+    end_min = Column(Integer, nullable=True)
+    end_max = Column(Integer, nullable=True)
+
+    def __repr__(self) -> str:
+        """."""
+        return (
+            f"RecordDailyRollup(user_id={self.user_id!r}, day={self.day!r}, tag={self.tag!r}, "
+            f"count={self.count!r}, duration={self.duration!r})"
+        )
+
+    SNAPSHOT_COLUMNS = ("user_id", "start", "end", "tags", "is_deleted")
+
+    @classmethod
+    def contributions(cls, snapshot: Optional[dict]) -> dict:
+        """Split the record into {(user_id, start day, tag): [count, duration]} parts (one per tag)."""
+        parts = {}
+        if not snapshot or snapshot["is_deleted"] or snapshot["start"] is None or snapshot["end"] is None:
+            return parts
+        start, end = int(snapshot["start"]), int(snapshot["end"])
+        user_id = snapshot["user_id"] or cls.NO_USER_ID
+        tags = set((snapshot["tags"] or "").split()) or {cls.TAG_NONE}
+        day = start - start % DAY
+        for tag in tags | {cls.TAG_ALL}:
+            parts[(user_id, day, tag)] = [1, end - start]
+        return parts
+
+    @classmethod
+    def read_snapshots(cls, queryset, ids: list) -> dict:
+        """
+        Read {id: snapshot} of the records, locked for update till the transaction end.
+
+        Concurrent writes of the records wait for the commit, so the snapshots
+        are the state the records are overwritten from (exact rollups deltas).
+        """
+        if not ids:
+            return {}
+        if queryset.session.get_bind().dialect.name == "sqlite":
+            # no SELECT FOR UPDATE, take the database write lock with a no-op write of the records
+            table = Record.__table__
+            statement = update(table).where(table.c.id.in_(ids))
+            queryset.session.execute(statement.values(id=table.c.id, updated_at=table.c.updated_at))
+        columns = [getattr(Record, key) for key in cls.SNAPSHOT_COLUMNS]
+        rows = queryset.filter(Record.id.in_(ids)).with_entities(Record.id, *columns).with_for_update(of=Record)
+        return {row.id: {key: getattr(row, key) for key in cls.SNAPSHOT_COLUMNS} for row in rows}
+
+    @classmethod
+    def records_changed(cls, session, changes: Iterable[tuple]):
+        """
+        Apply records changes -- (old, new) snapshots pairs -- to the rollups.
+
+        Snapshot is a dict of SNAPSHOT_COLUMNS values (or None for not existing record),
+        old ones must be read locked (`read_snapshots`) before the records are written.
+        Must be called after the records are written, does not commit.
+        """
+        deltas, start_days = defaultdict(lambda: [0, 0]), set()
+        for old, new in changes:
+            if old == new:
+                continue
+            for sign, snapshot in ((-1, old), (1, new)):
+                for key, (count, duration) in cls.contributions(snapshot).items():
+                    deltas[key][0] += sign * count
+                    deltas[key][1] += sign * duration
+                    if key[2] == cls.TAG_ALL:
+                        start_days.add(key[:2])
+        cls.upsert(session, [cls.row(key, *delta) for key, delta in deltas.items() if delta != [0, 0]])
+        # drop emptied rows
+        for user_id in {key[0] for key in deltas}:
+            days = [key[1] for key in deltas if key[0] == user_id]
+            session.execute(
+                delete(cls.__table__).where(
+                    cls.user_id == user_id,
+                    cls.day.between(min(days), max(days)),
+                    cls.count == 0,
+                    cls.duration == 0,
+                )
+            )
+        # start/end min/max can not be decremented, recount them for the start days
+        for user_id, day in start_days:
+            cls.recount_start_day(session, user_id, day)
+
+    @staticmethod
+    def row(key: tuple, count: int, duration: int, *start_end_min_max) -> dict:
+        """Build rollup row values."""
+        row = {"user_id": key[0], "day": key[1], "tag": key[2], "count": count, "duration": duration}
+        if start_end_min_max:
+            row.update(zip(("start_min", "start_max", "end_min", "end_max"), start_end_min_max))
+        return row
+
+    @classmethod
+    def upsert(cls, session, values: list):
+        """Add rows (count and duration deltas) to the rollups."""
+        if not values:
+            return
+        dialect = session.get_bind().dialect.name
+        insert = functions.insert(cls.__table__, dialect)
+        statement = insert.on_conflict_do_update(
+            index_elements=["user_id", "day", "tag"],
+            set_={
+                "count": cls.__table__.c.count + insert.excluded.count,
+                "duration": cls.__table__.c.duration + insert.excluded.duration,
+            },
+        )
+        session.execute(statement, values)
+
+    @classmethod
+    def recount_start_day(cls, session, user_id: int, day: int):
+        """Recount start/end min/max of the day (TAG_ALL row) from the records table."""
+        queryset = cls.rolled_up_records(session, user_id).filter(Record.start >= day, Record.start < day + DAY)
+        start_min, start_max, end_min, end_max = queryset.with_entities(
+            func.min(Record.start),
+            func.max(Record.start),
+            func.min(Record.end),
+            func.max(Record.end),
+        ).one()
+        session.execute(
+            update(cls.__table__)
+            .where(cls.user_id == user_id, cls.day == day, cls.tag == cls.TAG_ALL)
+            .values(start_min=start_min, start_max=start_max, end_min=end_min, end_max=end_max)
+        )
+
+    @staticmethod
+    def rolled_up_records(session, user_id: Optional[int]):
+        """Query records which are rolled up (finished, not deleted) for the user."""
+        queryset = session.query(Record).filter(
+            Record.user_id == user_id if user_id else Record.user_id.is_(None),
+            Record.is_deleted.is_(False),
+            Record.start.is_not(None),
+            Record.end.is_not(None),
+        )
+        return queryset
+
+    @classmethod
+    def rebuild(cls, session, user_ids: Optional[Iterable[int]] = None, batch_size: int = 10000) -> int:
+        """
+        Rebuild rollups from the records table (backfill and repair), commit.
+
+        Records are read with a server side cursor, ordered by user,
+        rollups are inserted user by user. Returns number of the read records.
+        """
+        rollups = session.query(cls)
+        records = select(Record.user_id, Record.start, Record.end, Record.tags, Record.is_deleted)
+        if user_ids is not None:
+            user_ids = list(user_ids)
+            rollups = rollups.filter(cls.user_id.in_(user_ids))
+            records = records.filter(Record.user_id.in_(user_ids))
+        rollups.delete(synchronize_session=False)
+        records = records.order_by(Record.user_id).execution_options(yield_per=batch_size)
+        n, user_id, rows = 0, None, {}
+        for record in session.execute(records):
+            if record.user_id != user_id:
+                cls.upsert(session, list(rows.values()))
+                user_id, rows = record.user_id, {}
+            for key, (count, duration) in cls.contributions(record._asdict()).items():
+                row = rows.setdefault(key, cls.row(key, 0, 0, None, None, None, None))
+                row["count"] += count
+                row["duration"] += duration
+                if key[2] == cls.TAG_ALL:
+                    start, end = int(record.start), int(record.end)
+                    row["start_min"] = min(start, row["start_min"] or start)
+                    row["start_max"] = max(start, row["start_max"] or start)
+                    row["end_min"] = min(end, row["end_min"] or end)
+                    row["end_max"] = max(end, row["end_max"] or end)
+            n += 1
+        cls.upsert(session, list(rows.values()))
+        session.commit()
+        return n
+
+    @staticmethod
+    def is_usable(start_min: Optional[int], start_max: Optional[int], utc_offset: int = 0, min_days: int = 0) -> bool:
+        """Check the query range can be answered by the rollups (UTC days aligned, long enough)."""
+        if utc_offset % DAY:
+            return False
+        if start_min is not None and start_min % DAY:
+            return False
+        if start_max is not None and (start_max + 1) % DAY:
+            return False
+        if start_min is not None and start_max is not None:
+            return (start_max + 1 - start_min) // DAY >= min_days
+        return True
+
+    @classmethod
+    def query_days(cls, session, user_id: int, start_min: Optional[int], start_max: Optional[int]):
+        """Query rollups of the user for the days range."""
+        queryset = session.query(cls).filter(cls.user_id == (user_id or cls.NO_USER_ID))
+        if start_min is not None:
+            queryset = queryset.filter(cls.day >= start_min)
+        if start_max is not None:
+            queryset = queryset.filter(cls.day <= start_max)
+        return queryset
+
+    @classmethod
+    def summary(cls, session, user_id: int, start_min=None, start_max=None, now: Optional[float] = None) -> dict:
+        """Records summary (see `Record.summary`) from the rollups (plus running records)."""
+        row = (
+            cls.query_days(session, user_id, start_min, start_max)
+            .filter(cls.tag == cls.TAG_ALL)
+            .with_entities(
+                func.sum(cls.count),
+                func.sum(cls.duration),
+                func.min(cls.start_min),
+                func.max(cls.start_max),
+                func.min(cls.end_min),
+                func.max(cls.end_max),
+            )
+            .one()
+        )
+        rsp = {
+            "count": row[0] or 0,
+            "duration": float(row[1] or 0),
+            "start_min": row[2],
+            "start_max": row[3],
+            "end_min": row[4],
+            "end_max": row[5],
+        }
+        running = Record.summary(cls.running_records(session, user_id, start_min, start_max), now=now)
+        rsp["count"] += running["count"]
+        rsp["duration"] += running["duration"]
+        for key, agg in (("start_min", min), ("start_max", max)):
+            values = [v for v in (rsp[key], running[key]) if v is not None]
+            rsp[key] = agg(values) if values else None
+        return rsp
+
+    @classmethod
+    def report(
+        cls,
+        session,
+        user_id: int,
+        start_min=None,
+        start_max=None,
+        bucket: str = "day",
+        by_tag: bool = False,
+        now: Optional[float] = None,
+    ) -> list:
+        """Records report (see `Record.report`) from the rollups (plus running records)."""
+        dialect = session.get_bind().dialect.name
+        groups = [functions.date_bucket(cls.day, bucket, dialect).label("bucket")]
+        queryset = cls.query_days(session, user_id, start_min, start_max)
+        if by_tag:
+            queryset = queryset.filter(cls.tag != cls.TAG_ALL)
+            groups.append(cls.tag.label("tag"))
+        else:
+            queryset = queryset.filter(cls.tag == cls.TAG_ALL)
+        rows = (
+            queryset.with_entities(
+                *groups,
+                func.sum(cls.count).label("count"),
+                func.sum(cls.duration).label("duration"),
+            )
+            .group_by(*groups)
+            .order_by(*groups)
+        )
+        report = {}
+        for row in rows:
+            tag = (row.tag or None) if by_tag else None
+            report[(row.bucket, tag)] = {
+                "bucket": row.bucket,
+                "tag": tag,
+                "count": row.count,
+                "duration": float(row.duration or 0),
+            }
+        running = cls.running_records(session, user_id, start_min, start_max)
+        for row in Record.report(running, bucket=bucket, by_tag=by_tag, now=now):
+            if (row["bucket"], row["tag"]) in report:
+                report[(row["bucket"], row["tag"])]["count"] += row["count"]
+                report[(row["bucket"], row["tag"])]["duration"] += row["duration"]
+            else:
+                report[(row["bucket"], row["tag"])] = row
+        return sorted(report.values(), key=lambda r: (r["bucket"], r["tag"] or ""))
+
+    @staticmethod
+    def running_records(session, user_id: int, start_min=None, start_max=None):
+        """Query not finished records of the user (not in the rollups)."""
+        queryset = session.query(Record).filter(
+            Record.user_id == user_id if user_id else Record.user_id.is_(None),
+            Record.end.is_(None),
+            Record.is_deleted.is_(False),
+        )
+        if start_min is not None:
+            queryset = queryset.filter(Record.start >= start_min)
+        if start_max is not None:
+            queryset = queryset.filter(Record.start <= start_max)
+        return queryset
+
+
+@event.listens_for(Session, "before_flush")
+def _rollups_before_flush(session, flush_context, instances):
+    """Read the stored state of the changed records (before it is overwritten, locked)."""
+    ids = [inspect(obj).identity[0] for obj in chain(session.dirty, session.deleted) if isinstance(obj, Record)]
+    if ids:
+        session.info["rollups_before_flush"] = RecordDailyRollup.read_snapshots(session.query(Record), ids)
+
+
+@event.listens_for(Session, "after_flush")
+def _rollups_after_flush(session, flush_context):
+    """Apply the flushed records changes to the rollups."""
+    stored = session.info.pop("rollups_before_flush", {})
+    changes = []
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if not isinstance(obj, Record):
+            continue
+        state = inspect(obj)
+        old = stored.get(state.identity[0]) if not state.pending else None
+        if obj in session.deleted:
+            changes.append((old, None))
+            continue
+        new = dict(old or {})
+        for key in RecordDailyRollup.SNAPSHOT_COLUMNS:
+            history = state.attrs[key].history
+            if history.added or old is None:
+                new[key] = state.dict.get(key)
+        changes.append((old, new))
+    if changes:
+        RecordDailyRollup.records_changed(session, changes)
@@ -0,0 +1,87 @@
+"""Records full-text search (SQLite FTS5 and PostgreSQL tsvector)."""
+
+import re
+
+from sqlalchemy import DDL, event
+from sqlalchemy.sql import func, select, table
+from sqlalchemy.sql.expression import column, literal_column
+
+from .records import Record
+
+__all__ = ["search_records", "search_terms"]
+
+# SQLite: external content FTS5 table, kept in sync by triggers
+SQLITE_CREATE = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS record_fts USING fts5(name, tags, content='record', content_rowid='id')",
+    "CREATE TRIGGER IF NOT EXISTS record_fts_ai AFTER INSERT ON record BEGIN "
+    "INSERT INTO record_fts(rowid, name, tags) VALUES (new.id, new.name, new.tags); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS record_fts_ad AFTER DELETE ON record BEGIN "
+    "INSERT INTO record_fts(record_fts, rowid, name, tags) VALUES ('delete', old.id, old.name, old.tags); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS record_fts_au AFTER UPDATE OF name, tags ON record BEGIN "
+    "INSERT INTO record_fts(record_fts, rowid, name, tags) VALUES ('delete', old.id, old.name, old.tags); "
+    "INSERT INTO record_fts(rowid, name, tags) VALUES (new.id, new.name, new.tags); "
+    "END",
+)
+SQLITE_DROP = (
+    "DROP TRIGGER IF EXISTS record_fts_au",
+    "DROP TRIGGER IF EXISTS record_fts_ad",
+    "DROP TRIGGER IF EXISTS record_fts_ai",
+    "DROP TABLE IF EXISTS record_fts",
+)
+
+# PostgreSQL: generated tsvector column with GIN index
+POSTGRESQL_CREATE = (
+    "ALTER TABLE record ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS "
+    "(to_tsvector('simple', coalesce(name, '') || ' ' || coalesce(tags, ''))) STORED",
+    "CREATE INDEX IF NOT EXISTS ix_record_search_vector ON record USING GIN (search_vector)",
+)
+POSTGRESQL_DROP = (
+    "DROP INDEX IF EXISTS ix_record_search_vector",
+    "ALTER TABLE record DROP COLUMN IF EXISTS search_vector",
+)
+
+for statement in SQLITE_CREATE:
+    event.listen(Record.__table__, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+for statement in SQLITE_DROP:
+    event.listen(Record.__table__, "before_drop", DDL(statement).execute_if(dialect="sqlite"))
+for statement in POSTGRESQL_CREATE:
+    event.listen(Record.__table__, "after_create", DDL(statement).execute_if(dialect="postgresql"))
+
+_record_fts = table("record_fts", column("rowid"), column("rank"))
+
+
+def search_terms(q: str) -> list:
+    """Split free text query into the search words (no query syntax is passed through)."""
+    return re.findall(r"\w+", q or "")
+
+
+def search_records(queryset, q: str, ranked: bool = False):
+    """
+    Filter records queryset by the full-text query (all words, prefix matched).
+
+    With `ranked` records are ordered by relevance (best first).
+    """
+    terms = search_terms(q)
+    if not terms:
+        return queryset
+    dialect = queryset.session.get_bind().dialect.name
+    if dialect == "sqlite":
+        match = " ".join(f'"{term}"*' for term in terms)
+        if not ranked:
+            matched = select(_record_fts.c.rowid).where(literal_column("record_fts").match(match))
+            return queryset.filter(Record.id.in_(matched))
+        return (
+            queryset.join(_record_fts, _record_fts.c.rowid == Record.id)
+            .filter(literal_column("record_fts").match(match))
+            .order_by(_record_fts.c.rank)
+        )
+    if dialect == "postgresql":
+        query = func.to_tsquery(literal_column("'simple'"), " & ".join(f"{term}:*" for term in terms))
+        vector = literal_column("record.search_vector")
+        queryset = queryset.filter(vector.op("@@")(query))
+        if ranked:
+            queryset = queryset.order_by(func.ts_rank(vector, query).desc())
+        return queryset
+    raise NotImplementedError(f"full-text search is not implemented for {dialect}")
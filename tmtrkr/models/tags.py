@@ -0,0 +1,113 @@
+"""Tags database models (normalized records tags)."""
+
+from itertools import chain
+
+from sqlalchemy import Column, ForeignKey, Index, Integer, Text, event, inspect
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import delete, func, select
+
+from . import functions
+from .base import Base
+from .records import Record
+
+
+class Tag(Base):
+    """
+    Tag, unique by name.
+
+    NB:
+    `Record.tags` text field is the source of truth (and the API format),
+    `record_tag` relations are kept in sync with it on every session flush
+    (see the session events below). Bulk (Core) statements bypass
+    the session, use `Tag.set_records_tags` after them.
+    """
+
+    __tablename__ = "tag"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    name = Column(Text, nullable=False, unique=True)
+
+    def __repr__(self) -> str:
+        """."""
+        return f"Tag(id={self.id!r}, name={self.name!r})"
+
+    @staticmethod
+    def split(tags: str) -> list:
+        """Split tags line into the unique tag names."""
+        return sorted(set((tags or "").split()))
+
+    @classmethod
+    def get_ids(cls, session, names: list, create: bool = False) -> dict:
+        """Get {name: id} for the tag names (create not existing ones)."""
+        if not names:
+            return {}
+        if create:
+            dialect = session.get_bind().dialect.name
+            insert = functions.insert(cls.__table__, dialect).on_conflict_do_nothing(index_elements=["name"])
+            session.execute(insert, [{"name": name} for name in names])
+        rows = session.execute(select(cls.id, cls.name).where(cls.name.in_(names)))
+        return {row.name: row.id for row in rows}
+
+    @classmethod
+    def set_records_tags(cls, session, records_tags: dict):
+        """Replace relations for {record_id: tags line}, does not commit."""
+        if not records_tags:
+            return
+        session.execute(delete(RecordTag.__table__).where(RecordTag.record_id.in_(list(records_tags))))
+        names = {record_id: cls.split(tags) for record_id, tags in records_tags.items()}
+        ids = cls.get_ids(session, sorted(set(chain(*names.values()))), create=True)
+        values = [
+            {"record_id": record_id, "tag_id": ids[name]}
+            for record_id, record_names in names.items()
+            for name in record_names
+        ]
+        if values:
+            session.execute(RecordTag.__table__.insert(), values)
+
+    @classmethod
+    def filter_records(cls, queryset, names: list, match_all: bool = False):
+        """Filter records queryset by tags (any or all of the names)."""
+        record_ids = select(RecordTag.record_id).join(cls, cls.id == RecordTag.tag_id).where(cls.name.in_(names))
+        if match_all:
+            record_ids = record_ids.group_by(RecordTag.record_id).having(func.count() == len(set(names)))
+        return queryset.filter(Record.id.in_(record_ids))
+
+
+class RecordTag(Base):
+    """Record to tag relation."""
+
+    __tablename__ = "record_tag"
+    __table_args__ = (
+        # records by tag (the primary key covers tags by record)
+        Index("ix_record_tag_tag_id_record_id", "tag_id", "record_id"),
+    )
+
+    record_id = Column(Integer, ForeignKey("record.id", ondelete="CASCADE"), primary_key=True)
+    tag_id = Column(Integer, ForeignKey("tag.id", ondelete="CASCADE"), primary_key=True)
+
+    def __repr__(self) -> str:
+        """."""
+        return f"RecordTag(record_id={self.record_id!r}, tag_id={self.tag_id!r})"
+
+
+@event.listens_for(Session, "before_flush")
+def _tags_before_flush(session, flush_context, instances):
+    """Drop relations of the records to be deleted."""
+    ids = [inspect(obj).identity[0] for obj in session.deleted if isinstance(obj, Record)]
+    if ids:
+        session.execute(delete(RecordTag.__table__).where(RecordTag.record_id.in_(ids)))
+
+
+@event.listens_for(Session, "after_flush")
+def _tags_after_flush(session, flush_context):
+    """Sync relations of the new and updated records (if tags are changed)."""
+    records_tags = {}
+    for obj in chain(session.new, session.dirty):
+        if not isinstance(obj, Record) or obj in session.deleted:
+            continue
+        state = inspect(obj)
+        if state.pending and not state.dict.get("tags"):
+            continue
+        if state.pending or state.attrs.tags.history.added:
+            records_tags[obj.id] = state.dict.get("tags")
+    Tag.set_records_tags(session, records_tags)
@@ -12,7 +12,7 @@ class User(Base, AutoTimestampsMixin):
     __tablename__ = "user"
 
     id = Column(Integer, primary_key=True, autoincrement=True)
-    name = Column(Text, index=True)
+    name = Column(Text, index=True, unique=True)
 
     records = relationship("Record", back_populates="user")
 
@@ -1,48 +1,228 @@
+"""
+Static files for the web front-end -- from a package (zipapp) or a directory.
+
+Files are read once at startup: content type, content hash ETag and
+precompressed (brotli, gzip) variants are kept in memory. Responses are
+negotiated by `Accept-Encoding`, conditional (`If-None-Match`) and
+partial (`Range`, not compressed content only). Package files are
+served from memory, directory files from the disk (zero-copy if the
+server supports it), changed files are read again.
+"""
+
+import gzip
+import hashlib
 import importlib.resources
 import mimetypes
 import os
+import pathlib
+from typing import Optional, Tuple
 
-from fastapi import HTTPException
+import anyio
 from fastapi import status as status_code
-from fastapi.responses import Response
+from fastapi.responses import RedirectResponse, Response
+from starlette.datastructures import Headers
 from starlette.types import Receive, Scope, Send
 
+from tmtrkr import settings
+from tmtrkr.api.compression import accepted_encodings
 
-class PackageStaticFiles:
-    """ """
+try:
+    import brotli
+except ImportError:  # optional, see requirements-speedups.txt
+    brotli = None
+
+__all__ = ["FileAssetResponse", "PackageStaticFiles", "StaticAsset"]
+
+# content encoding: compress function, in the order of preference
+COMPRESSORS = {"gzip": lambda data: gzip.compress(data, compresslevel=9, mtime=0)}
+if brotli is not None:
+    COMPRESSORS = {"br": lambda data: brotli.compress(data, quality=11), **COMPRESSORS}
+
+COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json", "image/svg+xml")
+
+
+def parse_range(range_header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse `Range` header, get (start, end) -- end is exclusive.
 
-    def __init__(self, directory: str, package=None, html=True):
+    Returns None for not supported (not bytes, multiple ranges) ones,
+    raises ValueError for not satisfiable ones.
+    """
+    unit, _, ranges = range_header.partition("=")
+    if unit.strip() != "bytes" or "," in ranges:
+        return None
+    first, _, last = ranges.strip().partition("-")
+    if not first:
+        start, end = max(size - int(last), 0), size
+    else:
+        start, end = int(first), min(int(last) + 1, size) if last else size
+    if start >= end:
+        raise ValueError(f"not satisfiable range: {range_header}")
+    return start, end
+
+
+class FileAssetResponse(Response):
+    """Whole file from disk: zero-copy (`pathsend`, `zerocopysend` server extensions) or by chunks."""
+
+    chunk_size = 64 * 1024
+
+    def __init__(self, path: str, size: int, headers: dict):
         """."""
+        super().__init__(headers={**headers, "content-length": str(size)})
+        self.path = path
+        self.size = size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """."""
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        extensions = scope.get("extensions") or {}
+        if scope["method"] == "HEAD":
+            await send({"type": "http.response.body", "body": b""})
+        elif "http.response.pathsend" in extensions:
+            await send({"type": "http.response.pathsend", "path": self.path})
+        elif "http.response.zerocopysend" in extensions:
+            with open(self.path, "rb") as f:
+                await send({"type": "http.response.zerocopysend", "file": f.fileno(), "count": self.size})
+        else:
+            async with await anyio.open_file(self.path, "rb") as f:
+                while chunk := await f.read(self.chunk_size):
+                    await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            await send({"type": "http.response.body", "body": b""})
+
+
+class StaticAsset:
+    """Static file: content type, content hash ETag, compressed variants."""
+
+    def __init__(self, data: bytes, content_type: Optional[str], path: Optional[str] = None):
+        """Content is kept in memory if the file path is not set (package resources)."""
+        self.size = len(data)
+        self.etag = f'"{hashlib.sha256(data).hexdigest()[:32]}"'
+        self.content_type = content_type or "application/octet-stream"
+        if self.content_type.startswith("text/"):
+            self.content_type += "; charset=utf-8"
+        self.data = data if path is None else None
+        self.path = path
+        self.mtime = os.stat(path).st_mtime_ns if path else None
+        self.encodings = {}
+        if self.content_type.startswith(COMPRESSIBLE_TYPES):
+            for encoding, compress in COMPRESSORS.items():
+                compressed = compress(data)
+                if len(compressed) < 0.9 * self.size:
+                    self.encodings[encoding] = compressed
+
+    def is_stale(self) -> bool:
+        """Check the file is changed (directory files only)."""
+        try:
+            return self.path is not None and os.stat(self.path).st_mtime_ns != self.mtime
+        except OSError:
+            return True
+
+    def negotiate(self, accept_encoding: str) -> Optional[str]:
+        """Get the preferred content encoding (None -- not compressed)."""
+        accepted = accepted_encodings(accept_encoding) if accept_encoding else ()
+        return next((encoding for encoding in self.encodings if encoding in accepted), None)
+
+
+class PackageStaticFiles:
+    """Static files ASGI app (see the module docs), `package=None` -- files of the directory."""
+
+    def __init__(
+        self, directory: str, package=None, html=True, cache_control: str = settings.SERVER_STATIC_CACHE_CONTROL
+    ):
+        """Read the files."""
         self.directory = directory
         self.html = html
-        self.package = package or __name__
-        self.resources = importlib.resources.files(self.package)
+        self.package = package
+        self.cache_control = cache_control
+        if package:
+            self.root = importlib.resources.files(package).joinpath(directory)
+        else:
+            self.root = pathlib.Path(directory)
+        self.assets = {}
+        self.scan(self.root, "")
+
+    def scan(self, folder, prefix: str):
+        """Read the folder files recursively."""
+        for item in folder.iterdir():
+            if item.is_dir():
+                self.scan(item, f"{prefix}{item.name}/")
+            elif item.is_file():
+                self.assets[prefix + item.name] = self.load(item)
+
+    def load(self, file) -> StaticAsset:
+        """."""
+        content_type, _ = mimetypes.guess_type(file.name)
+        return StaticAsset(file.read_bytes(), content_type, path=None if self.package else str(file))
+
+    def lookup(self, path: str) -> Optional[StaticAsset]:
+        """Get asset by the relative path (index.html for directories), reload changed files."""
+        if self.html and (not path or path.endswith("/")):
+            path += "index.html"
+        asset = self.assets.get(path)
+        if self.package is None and (asset is None or asset.is_stale()):
+            # directory files: changed or new ones
+            file = self.root.joinpath(path)
+            asset = None
+            if file.is_file() and file.resolve().is_relative_to(self.root.resolve()):
+                asset = self.assets[path] = self.load(file)
+            else:
+                self.assets.pop(path, None)
+        return asset
 
     async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
         """The ASGI entry point."""
-        try:
-            path = os.path.normpath(scope["path"])
-            if path.endswith("/") and self.html:
-                path += "index.html"
-            path_full = os.path.normpath(os.path.join(self.directory, path.lstrip("/")))
-            ct_type, ct_encoding = mimetypes.guess_type(path_full)
-            data = self.read(path_full)
-        except Exception as x:
-            print(x)
-            raise HTTPException(status_code.HTTP_400_BAD_REQUEST)
-        headers = {}
-        if ct_type and "text" in ct_type:
-            headers["content-type"] = f"{ct_type}; charset={ct_encoding or 'utf-8'}"
-        elif ct_type:
-            headers["content-type"] = ct_type
-        if data:
-            headers["content-length"] = str(len(data))
-        response = Response(content=data, headers=headers)
+        root_path, path = scope.get("root_path", ""), scope["path"]
+        path = path[len(root_path) :] if path.startswith(root_path) else path  # noqa: E203
+        if not path and self.html:
+            await RedirectResponse(f"{root_path}/")(scope, receive, send)
+            return
+        relative_path = os.path.normpath(path).lstrip("/")
+        asset = self.lookup(relative_path + "/" if relative_path and path.endswith("/") else relative_path)
+        if scope["method"] not in ("GET", "HEAD"):
+            response = Response(status_code=status_code.HTTP_405_METHOD_NOT_ALLOWED)
+        elif asset is None:
+            response = Response(status_code=status_code.HTTP_404_NOT_FOUND)
+        else:
+            response = self.asset_response(asset, Headers(scope=scope))
         await response(scope, receive, send)
 
-    def read(self, path):
-        """."""
-        file = self.resources.joinpath(path)
-        with importlib.resources.as_file(file) as f:
-            data = f.read_bytes()
-        return data
+    def asset_response(self, asset: StaticAsset, request_headers: Headers) -> Response:
+        """Build response for the request."""
+        # partial content is not compressed
+        encoding = None if "range" in request_headers else asset.negotiate(request_headers.get("accept-encoding", ""))
+        etag = asset.etag if encoding is None else f'{asset.etag[:-1]}-{encoding}"'
+        headers = {
+            "etag": etag,
+            "cache-control": self.cache_control,
+            "vary": "accept-encoding",
+        }
+        if_none_match = request_headers.get("if-none-match", "")
+        if etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(",")) or if_none_match == "*":
+            return Response(status_code=status_code.HTTP_304_NOT_MODIFIED, headers=headers)
+        headers["content-type"] = asset.content_type
+        if encoding is not None:
+            headers["content-encoding"] = encoding
+            return Response(asset.encodings[encoding], headers=headers)
+        headers["accept-ranges"] = "bytes"
+        range_header = request_headers.get("range")
+        if range_header and request_headers.get("if-range", etag) == etag:
+            try:
+                byte_range = parse_range(range_header, asset.size)
+            except ValueError:
+                headers = {"content-range": f"bytes */{asset.size}"}
+                return Response(status_code=status_code.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE, headers=headers)
+            if byte_range is not None:
+                start, end = byte_range
+                headers["content-range"] = f"bytes {start}-{end - 1}/{asset.size}"
+                return Response(self.read(asset, start, end), status_code.HTTP_206_PARTIAL_CONTENT, headers)
+        if asset.data is not None:
+            return Response(asset.data, headers=headers)
+        return FileAssetResponse(asset.path, asset.size, headers)
+
+    def read(self, asset: StaticAsset, start: int, end: int) -> bytes:
+        """Read asset content range (from memory or disk)."""
+        if asset.data is not None:
+            return asset.data[start:end]
+        with open(asset.path, "rb") as f:
+            f.seek(start)
+            return f.read(end - start)
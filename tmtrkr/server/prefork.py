@@ -0,0 +1,226 @@
+"""
+Pre-fork multi-process server.
+
+The master process loads the app and binds the socket once, forked
+workers (uvicorn servers on the shared socket) get them copy-on-write.
+
+Master signals:
+- SIGTERM, SIGINT: graceful shutdown -- workers finish in-flight requests
+  (up to `SERVER_GRACEFUL_TIMEOUT` seconds) and exit;
+- SIGHUP: graceful reload -- new workers are started, the old ones are
+  shut down gracefully (the preloaded app is not imported again);
+- dead workers are restarted, the ones failing at startup (exited within
+  `SERVER_WORKER_MIN_UPTIME` seconds) with exponential backoff -- the delay
+  doubles on every such failure up to `SERVER_RESPAWN_MAX_DELAY` seconds.
+
+Database connections are never shared by processes: the engines are
+disposed before forking and in the workers (SQLite file locks are per
+process, PostgreSQL connections are sockets). Records change events reach
+the subscribers of all the workers (`events.UnixSocketPubSub`).
+"""
+
+import logging
+import os
+import signal
+import socket
+import tempfile
+import time
+
+import uvicorn
+
+from tmtrkr import models, settings
+from tmtrkr.api import events
+
+__all__ = ["PreforkServer", "dispose_engines"]
+
+log = logging.getLogger("uvicorn.error")
+
+
+def dispose_engines(close: bool = True):
+    """Drop the pooled database connections, `close=False` -- of the parent process (in a forked one)."""
+    for engine in (models.db.engine, models.db.reader_engine, models.db.replica_engine):
+        if engine is not None:
+            engine.dispose(close=close)
+    if not close:  # async engines are not connected by the master (no event loop there)
+        for engine in (models.db.async_engine, models.db.async_reader_engine, models.db.async_replica_engine):
+            if engine is not None:
+                engine.sync_engine.dispose(close=False)
+
+
+class PreforkServer:
+    """Master process of the pre-fork server (see the module docs)."""
+
+    def __init__(
+        self,
+        app,
+        host: str,
+        port: int,
+        workers: int,
+        graceful_timeout: int = settings.SERVER_GRACEFUL_TIMEOUT,
+        **options
+    ):
+        """Options are of `uvicorn.Config`."""
+        self.host = host
+        self.port = port
+        self.workers_count = workers
+        self.graceful_timeout = graceful_timeout
+        self.config = uvicorn.Config(app, timeout_graceful_shutdown=graceful_timeout, **options)
+        self.socket = None
+        self.events_directory = None
+        self.workers = set()  # pids of the current workers
+        self.started = {}  # pid: start time of the current workers
+        self.retiring = set()  # pids of the old workers (shutting down on reload)
+        self.stopping = False
+        self.reloading = False
+        self.failures = 0  # workers failed at startup in a row
+        self.respawn_at = 0.0  # monotonic time to restart the dead workers at (backoff)
+
+    def bind(self) -> socket.socket:
+        """Create the listening socket (inherited by the workers)."""
+        family = socket.AF_INET6 if ":" in self.host else socket.AF_INET
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.host, self.port))
+        sock.listen(self.config.backlog)
+        sock.set_inheritable(True)
+        return sock
+
+    def run(self):
+        """Bind, fork the workers, supervise them till shutdown."""
+        self.socket = self.bind()
+        events_directory = tempfile.TemporaryDirectory(prefix="tmtrkr-events-")
+        self.events_directory = events_directory.name
+        signal.signal(signal.SIGTERM, self.on_stop)
+        signal.signal(signal.SIGINT, self.on_stop)
+        signal.signal(signal.SIGHUP, self.on_reload)
+        log.info(
+            "Pre-fork server on %s:%d: %d workers (master %d)", self.host, self.port, self.workers_count, os.getpid()
+        )
+        if models.db.engine.dialect.name == "sqlite" and models.db.reader_engine is None:
+            log.warning(
+                "SQLite default mode: writes of the workers lock each other out, use TMTRKR_DATABASE_SQLITE_MODE=wal"
+            )
+        dispose_engines()
+        try:
+            while not self.stopping:
+                if self.reloading:
+                    self.reload()
+                self.reap()
+                while len(self.workers) < self.workers_count and not self.stopping and self.respawn_due():
+                    self.workers.add(self.spawn())
+                time.sleep(0.2)
+            self.shutdown()
+        finally:
+            self.socket.close()
+            events_directory.cleanup()
+
+    def on_stop(self, signum, frame):
+        """."""
+        self.stopping = True
+
+    def on_reload(self, signum, frame):
+        """."""
+        self.reloading = True
+
+    def respawn_due(self) -> bool:
+        """."""
+        return time.monotonic() >= self.respawn_at
+
+    def respawn_delay(self) -> float:
+        """Restart delay of the dead workers: doubles on every startup failure in a row."""
+        if not self.failures:
+            return 0.0
+        return min(0.2 * 2 ** (self.failures - 1), settings.SERVER_RESPAWN_MAX_DELAY)
+
+    def spawn(self) -> int:
+        """Fork a worker, get its pid."""
+        pid = os.fork()
+        if pid:
+            self.started[pid] = time.monotonic()
+            return pid
+        code = 1
+        try:
+            self.run_worker()
+            code = 0
+        except BaseException:
+            log.exception("Worker %d failed", os.getpid())
+        finally:
+            os._exit(code)
+
+    def run_worker(self):
+        """Worker process: serve the shared socket till SIGTERM / SIGINT (graceful)."""
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, signal.SIG_DFL)  # uvicorn installs its own ones
+        dispose_engines(close=False)
+        events.broadcaster.use(events.UnixSocketPubSub(self.events_directory))
+        log.info("Worker %d started", os.getpid())
+        uvicorn.Server(self.config).run(sockets=[self.socket])
+
+    def reload(self):
+        """Start new workers, shut the old ones down gracefully."""
+        self.reloading = False
+        log.info("Reloading workers")
+        old, self.workers = self.workers, set()
+        while len(self.workers) < self.workers_count:
+            self.workers.add(self.spawn())
+        for pid in old:
+            self.kill(pid, signal.SIGTERM)
+        self.retiring |= old
+
+    def reap(self):
+        """Collect exited workers (dead current ones are restarted by the caller)."""
+        while self.workers or self.retiring:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:  # no children left
+                self.workers.clear()
+                self.started.clear()
+                self.retiring.clear()
+                break
+            if not pid:
+                break
+            if pid in self.workers:
+                uptime = time.monotonic() - self.started[pid]
+                if uptime < settings.SERVER_WORKER_MIN_UPTIME:
+                    self.failures += 1
+                else:
+                    self.failures = 0
+                delay = self.respawn_delay()
+                self.respawn_at = time.monotonic() + delay
+                log.warning(
+                    "Worker %d exited unexpectedly (status %d, uptime %.1fs), restarting in %.1fs",
+                    pid,
+                    status,
+                    uptime,
+                    delay,
+                )
+            self.started.pop(pid, None)
+            self.workers.discard(pid)
+            self.retiring.discard(pid)
+
+    def shutdown(self):
+        """Stop all the workers gracefully, kill the ones left after the timeout."""
+        log.info("Shutting down workers")
+        self.retiring |= self.workers
+        self.workers = set()
+        for pid in self.retiring:
+            self.kill(pid, signal.SIGTERM)
+        deadline = time.monotonic() + self.graceful_timeout + 5
+        while self.retiring and time.monotonic() < deadline:
+            self.reap()
+            time.sleep(0.1)
+        for pid in self.retiring:
+            log.warning("Worker %d is killed (graceful shutdown timeout)", pid)
+            self.kill(pid, signal.SIGKILL)
+        while self.retiring:
+            self.reap()
+            time.sleep(0.1)
+
+    @staticmethod
+    def kill(pid: int, signum: int):
+        """."""
+        try:
+            os.kill(pid, signum)
+        except ProcessLookupError:
+            pass
@@ -1,13 +1,13 @@
-"""Demo server."""
+"""Demo server: single process or pre-fork workers (`SERVER_WORKERS`, see `tmtrkr.server.prefork`)."""
 
 import uvicorn
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import RedirectResponse
-from fastapi.staticfiles import StaticFiles
 
 import tmtrkr.settings
 from tmtrkr.api.api import app
 from tmtrkr.server.packagestaticfiles import PackageStaticFiles
+from tmtrkr.server.prefork import PreforkServer
 
 
 def setup_cors(app, origins=None):
@@ -25,10 +25,8 @@ def setup_cors(app, origins=None):
 def mount_static(app, zipapp=False):
     """Serve static files for web front-end."""
 
-    if zipapp:
-        app.mount("/www", PackageStaticFiles(directory="www", package="tmtrkr", html=True), name="www")
-    else:
-        app.mount("/www", StaticFiles(directory="www", html=True), name="www")
+    package = "tmtrkr" if zipapp else None  # zipapp: from memory, else from disk
+    app.mount("/www", PackageStaticFiles(directory="www", package=package, html=True), name="www")
 
     @app.get("/")
     async def index():
@@ -36,18 +34,32 @@ def mount_static(app, zipapp=False):
         return RedirectResponse("/www")
 
 
-def run(zipapp=False):
+def migrate(config_file="alembic.ini"):
+    """Apply all the database migrations (alembic upgrade head)."""
+    from alembic import command
+    from alembic.config import Config
+
+    command.upgrade(Config(config_file), "head")
+
+
+def run(zipapp=False, workers=None):
     """Run server, run."""
+    workers = tmtrkr.settings.SERVER_WORKERS if workers is None else workers
 
     setup_cors(app)
     mount_static(app, zipapp)
+    if tmtrkr.settings.SERVER_MIGRATE:
+        migrate()  # once, the workers are not forked yet
 
-    uvicorn.run(
-        app,
-        access_log=True,
-        host=tmtrkr.settings.SERVER_BIND_HOST,
-        port=tmtrkr.settings.SERVER_BIND_PORT,
-    )
+    options = {
+        "access_log": True,
+        "host": tmtrkr.settings.SERVER_BIND_HOST,
+        "port": tmtrkr.settings.SERVER_BIND_PORT,
+    }
+    if workers <= 1:
+        uvicorn.run(app, timeout_graceful_shutdown=tmtrkr.settings.SERVER_GRACEFUL_TIMEOUT, **options)
+        return
+    PreforkServer(app, workers=workers, **options).run()
 
 
 if __name__ == "__main__":
@@ -15,13 +15,59 @@ else:
 
 DATABASE_CONNECT_ARGS = json.loads(os.environ.get("TMTRKR_DATABASE_CONNECT_ARGS", DEFAULT_DATABASE_CONNECT_ARGS))
 
+# connection pools: size, overflow and timeout (seconds, wait for a free connection) are of the queue pools only;
+# recycle -- reconnect older connections (seconds, -1 -- never), pre-ping -- check connections on checkout
+DATABASE_POOL_SIZE = int(os.environ.get("TMTRKR_DATABASE_POOL_SIZE", 5))
+DATABASE_POOL_MAX_OVERFLOW = int(os.environ.get("TMTRKR_DATABASE_POOL_MAX_OVERFLOW", 10))
+DATABASE_POOL_TIMEOUT = float(os.environ.get("TMTRKR_DATABASE_POOL_TIMEOUT", 30))
+DATABASE_POOL_RECYCLE = int(os.environ.get("TMTRKR_DATABASE_POOL_RECYCLE", -1))
+DATABASE_POOL_PRE_PING = os.environ.get("TMTRKR_DATABASE_POOL_PRE_PING", "0").lower() in ("1", "true", "yes")
+
+# read replica of the read-only endpoints (records lists, summaries, reports, export), see tmtrkr.api.replica
+DATABASE_REPLICA_URL = os.environ.get("TMTRKR_DATABASE_REPLICA_URL") or None
+# seconds, clients read from the primary database after their writes (replication lag)
+DATABASE_REPLICA_READ_YOUR_WRITES = int(os.environ.get("TMTRKR_DATABASE_REPLICA_READ_YOUR_WRITES", 10))
+
+# SQLite (file database) mode: "default" or "wal" -- production one, see tmtrkr.models.db
+DATABASE_SQLITE_MODE = os.environ.get("TMTRKR_DATABASE_SQLITE_MODE", "default")
+# read-only connections kept open (more are opened on demand -- reads never wait for each other)
+DATABASE_SQLITE_READERS = int(os.environ.get("TMTRKR_DATABASE_SQLITE_READERS", os.cpu_count() or 4))
+DATABASE_SQLITE_PRAGMAS = {
+    "synchronous": "NORMAL",  # WAL is synced on checkpoints only (durable, but the last commits may be lost on crash)
+    "busy_timeout": 5000,  # milliseconds, wait for locks (e.g. other processes)
+    "mmap_size": 256 * 2**20,
+    "cache_size": -64 * 2**10,  # KiB, per connection
+}
+
 # Demo server settings
 SERVER_BIND_HOST = os.environ.get("TMTRKR_SERVER_BIND_HOST", "0.0.0.0")
 SERVER_BIND_PORT = int(os.environ.get("TMTRKR_SERVER_BIND_PORT", 8000))
+SERVER_STATIC_CACHE_CONTROL = "public, no-cache"  # web front-end files, revalidated by ETag
+SERVER_WORKERS = int(os.environ.get("TMTRKR_SERVER_WORKERS", 1))  # processes, more than one -- pre-fork server
+SERVER_GRACEFUL_TIMEOUT = int(os.environ.get("TMTRKR_SERVER_GRACEFUL_TIMEOUT", 30))  # seconds, shutdown and reload
+SERVER_WORKER_MIN_UPTIME = 5  # seconds, a worker exited sooner is failed at startup (restarted with backoff)
+SERVER_RESPAWN_MAX_DELAY = 30  # seconds, restart delay of workers failing at startup doubles up to it
+# apply the database migrations (alembic.ini of the working directory) at start, once -- before the workers fork
+SERVER_MIGRATE = os.environ.get("TMTRKR_SERVER_MIGRATE", "0").lower() in ("1", "true", "yes")
 
 # API
 API_BASE_PREFIX = "/api"
 API_PAGE_SIZE_LIMIT = 1000
+API_BATCH_SIZE_LIMIT = 10000
+API_EXPORT_CHUNK_SIZE = 1000
+API_IMPORT_CHUNK_SIZE = 1000
+API_IMPORT_ERRORS_LIMIT = 100
+API_EVENTS_QUEUE_SIZE = 100  # pending push events per subscriber, a slow one gets `resync` on overflow
+API_EVENTS_BATCH_LIMIT = 100  # records changed by a batch to publish events of, more -- one `resync` event
+API_EVENTS_KEEPALIVE = 15  # seconds, idle push streams get comments (dead connections are detected)
+API_COMPRESSION_ENCODINGS = ("br", "gzip")  # responses compression, in the order of preference, empty -- disabled
+API_COMPRESSION_MIN_SIZE = 1024  # bytes, smaller (not streamed) responses are not compressed
+API_COMPRESSION_GZIP_LEVEL = 6
+API_COMPRESSION_BROTLI_QUALITY = 4
+
+# Records daily rollups -- summaries and reports over long (UTC days aligned) ranges are read from them
+ROLLUP_ENABLED = True
+ROLLUP_MIN_DAYS = 28
 
 # API Auth parameters
 AUTH_USERS_ALLOW_XFORWARDED = True  # trust `x-forwarded-user` HTTP header (from nginx or demo UI)
@@ -29,9 +75,13 @@ AUTH_USERS_ALLOW_XFORWARDED_HEADER = "x-forwarded-user"
 AUTH_USERS_ALLOW_JWT = True  # enable JWT token (in Authorize header or cookie)
 AUTH_USERS_ALLOW_JWT_COOKIE_BRAND = "tmtrkr-token"
 AUTH_USERS_ALLOW_JWT_TTL = 60 * 60
+AUTH_TOKENS_CACHE_SIZE = 10000  # in-process cache of the verified tokens (till expiry), 0 disables it
+AUTH_TOKENS_CACHE_TTL = 5 * 60
 
 AUTH_USERS_ALLOW_UNKNOWN = False  # allow guests
 AUTH_USERS_AUTO_CREATE = True  # create new users automatically (when a valid username is passed in the header or token)
+AUTH_USERS_CACHE_SIZE = 10000  # in-process cache of the known users (username: user), 0 disables it
+AUTH_USERS_CACHE_TTL = 60
 
 # OAuth2 parameters (google flavoured)
 AUTH_OAUTH2_CLIENT_ID = os.environ.get(